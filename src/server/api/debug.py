@@ -0,0 +1,62 @@
+import hmac
+import math
+from flask import Blueprint, Response, current_app, jsonify, request
+
+from src.server.core.profiler import ProfilerBusy, collapsed_lines
+
+
+# operator endpoints, mounted at /debug
+debug_bp = Blueprint('debug', __name__)
+
+
+@debug_bp.before_request
+def require_token():
+    # disabled unless DEBUG_TOKEN is set, then only with Authorization: Bearer <DEBUG_TOKEN>
+    token = current_app.config['DEBUG_TOKEN']
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    given = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+
+@debug_bp.route('/profile', methods=['GET'])
+def profile():
+    """
+    Profile this worker process
+    ---
+    tags:
+      - Debug
+    summary: Sample the stacks of this worker
+    description: Samples the stacks of every thread of the worker process answering the request for the given number of seconds and returns them as collapsed stacks ("thread;outer;...;inner count" per line) for flame graph tools. Requires Authorization Bearer DEBUG_TOKEN. Only one profile runs per process at a time.
+    parameters:
+      - name: seconds
+        in: query
+        type: number
+        default: 10
+        description: Sampling duration, at most PROFILE_MAX_SECONDS
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Collapsed stacks, most frequent first. X-Profile-Samples holds the number of sampling rounds.
+      400:
+        description: Invalid duration
+      403:
+        description: Missing or wrong token
+      404:
+        description: Debug endpoints are disabled
+      409:
+        description: A profile is already running in this process
+    """
+    seconds = request.args.get('seconds', 10, type=float)
+    if not seconds or not math.isfinite(seconds) or seconds <= 0:
+        return jsonify({'error': 'seconds must be a positive number'}), 400
+    try:
+        stacks, rounds = current_app.profiler.profile(seconds)
+    except ProfilerBusy:
+        return jsonify({'error': 'A profile is already running'}), 409
+    response = Response(''.join(collapsed_lines(stacks)), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(rounds)
+    return response
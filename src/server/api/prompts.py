@@ -0,0 +1,238 @@
+"""
+Prompt layer for the model API.
+
+Translations are requested in batches: many sentences and all target
+languages go into one structured-JSON request, sized by a token budget, so a
+bulk import costs a handful of model calls instead of sentences x languages.
+Answers are streamed and every translation is stored as soon as its JSON
+object is complete.
+"""
+import asyncio
+import json
+import logging
+from contextlib import aclosing, closing
+from jsonschema import Draft7Validator
+from src.server.core.ai_client import AIStreamInterrupted
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_SYSTEM = (
+    "You are a translation service for a language learning app. "
+    "Translate every input sentence into every target language. "
+    "Keep the meaning and register of the original, use natural everyday phrasing "
+    "and include all diacritics. Answer with JSON only, no prose and no code fences."
+)
+
+# one element of the "translations" array the model has to return
+TRANSLATION_ITEM_SCHEMA = {
+    'type': 'object',
+    'required': ['sentence_id', 'language', 'text'],
+    'properties': {
+        'sentence_id': {'type': 'integer'},
+        'language': {'type': 'string', 'minLength': 2, 'maxLength': 5},
+        'text': {'type': 'string', 'minLength': 1, 'maxLength': 200},
+        'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+    },
+}
+TRANSLATION_SCHEMA = {
+    'type': 'object',
+    'required': ['translations'],
+    'properties': {'translations': {'type': 'array', 'items': TRANSLATION_ITEM_SCHEMA}},
+}
+_item_validator = Draft7Validator(TRANSLATION_ITEM_SCHEMA)
+
+# fixed prompt overhead and per-item output overhead (ids, keys, quotes) in tokens
+PROMPT_OVERHEAD_TOKENS = 250
+ITEM_OVERHEAD_TOKENS = 20
+
+
+def estimate_tokens(text):
+    # about four characters per token; errs on the high side for most languages
+    return len(text) // 4 + 1
+
+
+def _sentence_cost(text, languages):
+    # input tokens of the sentence plus the expected output for all its translations
+    tokens = estimate_tokens(text)
+    return tokens + len(languages) * (tokens * 2 + ITEM_OVERHEAD_TOKENS)
+
+
+def build_translation_batches(sentences, languages, token_budget):
+    # sentences: list of (sentence_id, text, category). Packs them greedily into batches
+    # whose prompt plus expected answer stays within token_budget; a sentence that is
+    # too large on its own still gets a batch of its own.
+    batches, batch, used = [], [], PROMPT_OVERHEAD_TOKENS
+    for sentence in sentences:
+        cost = _sentence_cost(sentence[1], languages)
+        if batch and used + cost > token_budget:
+            batches.append(batch)
+            batch, used = [], PROMPT_OVERHEAD_TOKENS
+        batch.append(sentence)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_translation_prompt(batch, source_language, languages):
+    request = {
+        'source_language': source_language,
+        'target_languages': list(languages),
+        'sentences': [{'sentence_id': sentence_id, 'text': text, 'category': category}
+                      for sentence_id, text, category in batch],
+    }
+    return (
+        "Translate each sentence into each target language.\n"
+        "Return exactly one entry per sentence_id and language, matching this JSON schema:\n"
+        f"{json.dumps(TRANSLATION_SCHEMA)}\n"
+        "confidence is your confidence in the translation between 0 and 1.\n"
+        "Input:\n"
+        f"{json.dumps(request, ensure_ascii=False)}"
+    )
+
+
+class TranslationStreamParser:
+    """
+    Incremental parser for {"translations": [{...}, ...]}. feed() takes the next
+    piece of the answer and returns the items it completed, so nothing waits
+    for the end of the response. Text before the first brace is ignored.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._item = None
+
+    def feed(self, text):
+        items = []
+        for char in text:
+            if not self._stack and char != '{':
+                continue
+            if self._item is not None:
+                self._item.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append(char)
+                if char == '{' and len(self._stack) == 3 and self._stack[1] == '[':
+                    self._item = [char]
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if self._item is not None and len(self._stack) == 2:
+                    try:
+                        items.append(json.loads(''.join(self._item)))
+                    except ValueError:
+                        logger.warning("Dropping unparsable translation item: %s", ''.join(self._item))
+                    self._item = None
+        return items
+
+
+def validate_translation_item(item, expected):
+    # expected: set of (sentence_id, language) pairs that were asked for
+    return (_item_validator.is_valid(item)
+            and (item['sentence_id'], item['language']) in expected)
+
+
+def _plan_pass(by_id, wanted, source_language, languages, token_budget, max_output_tokens):
+    # the requests for one pass over the pairs still wanted: (expected pairs, prompt, max_tokens)
+    todo = [by_id[sentence_id] for sentence_id in sorted({pair[0] for pair in wanted})]
+    todo_languages = [language for language in languages if any(pair[1] == language for pair in wanted)]
+    requests = []
+    for batch in build_translation_batches(todo, todo_languages, token_budget):
+        expected = {(sentence[0], language) for sentence in batch for language in todo_languages}
+        max_tokens = min(max_output_tokens,
+                         sum(_sentence_cost(sentence[1], todo_languages) for sentence in batch))
+        requests.append((expected, build_translation_prompt(batch, source_language, todo_languages), max_tokens))
+    return requests
+
+
+def _take_item(item, expected, wanted):
+    # True if the item is valid and still wanted, which it is not anymore afterwards
+    if not validate_translation_item(item, expected):
+        logger.warning("Dropping invalid translation item: %r", item)
+        return False
+    pair = (item['sentence_id'], item['language'])
+    if pair not in wanted:
+        return False
+    wanted.discard(pair)
+    return True
+
+
+def iter_translations(client, manager, sentences, group_ids, source_language, languages,
+                      token_budget, max_output_tokens=8192):
+    # sentences: list of (sentence_id, text, category); group_ids: sentence_id -> group id.
+    # Streams the answers and stores every translation through manager.create_translation
+    # the moment its object is complete, yielding the stored rows. Pairs the model
+    # skipped, or that were lost to a stream breaking off, are asked for once more.
+    by_id = {sentence[0]: sentence for sentence in sentences}
+    wanted = {(sentence_id, language) for sentence_id in by_id for language in languages}
+    calls = 0
+    for attempt in range(2):
+        if not wanted:
+            break
+        for expected, prompt, max_tokens in _plan_pass(by_id, wanted, source_language, languages,
+                                                       token_budget, max_output_tokens):
+            parser = TranslationStreamParser()
+            calls += 1
+            try:
+                with closing(client.stream_complete(prompt, system=TRANSLATION_SYSTEM,
+                                                    max_tokens=max_tokens)) as stream:
+                    for text in stream:
+                        for item in parser.feed(text):
+                            if _take_item(item, expected, wanted):
+                                yield manager.create_translation(item['sentence_id'], item['text'], item['language'],
+                                                                 group_ids[item['sentence_id']], item.get('confidence'))
+            except AIStreamInterrupted as e:
+                # everything parsed so far is stored already
+                logger.warning("Translation stream broke off: %s", e)
+    logger.debug("Translated %d sentences in %d model calls", len(by_id), calls)
+    if wanted:
+        logger.warning("No translation for %d sentence/language pairs", len(wanted))
+
+
+def translate_sentences(client, manager, sentences, group_ids, source_language, languages,
+                        token_budget, max_output_tokens=8192):
+    # like iter_translations, returns the number of translations stored
+    return sum(1 for _ in iter_translations(client, manager, sentences, group_ids, source_language,
+                                            languages, token_budget, max_output_tokens))
+
+
+async def atranslate_sentences(client, store, sentences, source_language, languages,
+                               token_budget, max_output_tokens=8192):
+    # iter_translations for an event loop: all batches of a pass stream at the same time
+    # and every valid item is handed to the coroutine function store(item) as soon as
+    # it is complete. Returns the number of translations stored.
+    by_id = {sentence[0]: sentence for sentence in sentences}
+    wanted = {(sentence_id, language) for sentence_id in by_id for language in languages}
+    stored = 0
+
+    async def run(expected, prompt, max_tokens):
+        nonlocal stored
+        parser = TranslationStreamParser()
+        try:
+            async with aclosing(client.astream_complete(prompt, system=TRANSLATION_SYSTEM,
+                                                        max_tokens=max_tokens)) as stream:
+                async for text in stream:
+                    for item in parser.feed(text):
+                        if _take_item(item, expected, wanted):
+                            await store(item)
+                            stored += 1
+        except AIStreamInterrupted as e:
+            logger.warning("Translation stream broke off: %s", e)
+
+    for attempt in range(2):
+        if not wanted:
+            break
+        await asyncio.gather(*(run(*request) for request in _plan_pass(
+            by_id, wanted, source_language, languages, token_budget, max_output_tokens)))
+    if wanted:
+        logger.warning("No translation for %d sentence/language pairs", len(wanted))
+    return stored
@@ -1,10 +1,25 @@
-from flask import Flask, jsonify, request, Blueprint, current_app
+import base64
+import functools
+import hashlib
+import shutil
+import tempfile
+import json
+import time
+from flask import Flask, jsonify, request, Blueprint, current_app, Response, send_file, stream_with_context, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_restful import Api, Resource
 from flasgger import Swagger, swag_from
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from src.server.models.data_models import db
-from src.server.data_manager import DataManager
+from src.server.data_manager import (
+    DataManager, DuplicateSentenceError, EXPORT_COLUMNS, USER_PAGE_MAX, DUE_LIMIT_MAX, DECK_INTRODUCE_MAX, due_key
+)
+from src.server.core.ai_client import AIClientError
+from src.server.core.scoring import answer_score
+from src.server.api.prompts import atranslate_sentences, iter_translations
+from src.server.core.deck_transfer import (
+    ndjson_lines, iter_ndjson_records, write_sqlite_zip, iter_sqlite_zip_records
+)
 
 
 # creating blueprint
@@ -17,8 +32,27 @@ def index():
     ---
     tags:
       - Users
-    summary: List all users
-    description: Returns a list of all user profiles.
+    summary: List users
+    description: Returns user profiles in username order, one page at a time. The next page is linked in the Link header (rel="next"), X-Total-Count holds an estimate of the number of matching users.
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        default: 100
+        description: Users per page, at most 1000
+      - name: after
+        in: query
+        type: string
+        description: Start after this username, taken from the next link
+      - name: prefix
+        in: query
+        type: string
+        description: Only usernames starting with this
+      - name: stream
+        in: query
+        type: boolean
+        default: false
+        description: Stream every matching user as NDJSON instead of one page
     responses:
       200:
         description: A list of user objects
@@ -36,8 +70,27 @@ def index():
               created_at:
                 type: string
     """
-    users = current_app.manager.get_users()
-    return jsonify(users), 200
+    prefix = request.args.get('prefix') or None
+    if request.args.get('stream', 'false').lower() in ('1', 'true'):
+        # for admin tooling, the response is produced page by page
+        lines = ndjson_lines(('user', user) for user in current_app.manager.iter_users(prefix))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    limit = min(max(request.args.get('limit', 100, type=int), 1), USER_PAGE_MAX)
+    after = request.args.get('after')
+    # one extra row tells whether there is a next page
+    users = current_app.manager.get_users_page(limit + 1, after, prefix)
+    response = jsonify(users[:limit])
+    if len(users) > limit:
+        args = {'limit': limit, 'after': users[limit - 1]['username']}
+        if prefix:
+            args['prefix'] = prefix
+        response.headers['Link'] = f'<{url_for("api.index", **args)}>; rel="next"'
+    count, exact = current_app.manager.estimate_user_count(prefix)
+    response.headers['X-Total-Count'] = str(count)
+    if not exact:
+        response.headers['X-Total-Count-Estimated'] = 'true'
+    return response, 200
 
 # ==================== USER MANAGEMENT ENDPOINTS ====================
 
@@ -315,9 +368,195 @@ def delete_user(user_id):
         return jsonify({'error': 'User not found'}), 404
 
 
+@api_bp.route('/users/<int:user_id>/export', methods=['GET'])
+def export_user(user_id):
+    """
+    Export a user's deck
+    ---
+    tags:
+      - Users
+    summary: Export deck
+    description: Streams the user with their target languages, deck subscriptions, sentences, progress groups (the review state), translations, learning attempts and daily attempt rollups.
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the user
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, sqlite]
+        default: ndjson
+        description: NDJSON stream or a ZIP archive with a SQLite file
+    responses:
+      200:
+        description: The deck dump, one {"type", "data"} object per line for ndjson
+      400:
+        description: Unknown format
+      404:
+        description: User not found
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'sqlite'):
+        return jsonify({'error': 'format must be ndjson or sqlite'}), 400
+    try:
+        records = current_app.manager.iter_user_export(user_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    if export_format == 'ndjson':
+        return Response(stream_with_context(ndjson_lines(records)), mimetype='application/x-ndjson')
+
+    workdir = tempfile.mkdtemp(prefix='export-')
+    try:
+        columns = {kind: names for kind, (model, names) in EXPORT_COLUMNS.items()}
+        zip_path = write_sqlite_zip(records, columns, workdir)
+        response = send_file(zip_path, mimetype='application/zip', as_attachment=True,
+                             download_name=f'user-{user_id}-deck.zip')
+    except Exception as e:
+        shutil.rmtree(workdir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 500
+    response.call_on_close(lambda: shutil.rmtree(workdir, ignore_errors=True))
+    return response
+
+
+@api_bp.route('/users/<int:user_id>/import', methods=['POST'])
+def import_user(user_id):
+    """
+    Import a deck dump into a user
+    ---
+    tags:
+      - Users
+    summary: Import deck
+    description: Loads an export (NDJSON body or application/zip) in chunks and remaps all IDs. Sentences the user already has are kept and their imported copies skipped. A failed import can be resumed by sending the same dump again with its job_id.
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the target user
+      - name: job_id
+        in: query
+        type: integer
+        required: false
+        description: Resume this earlier import job
+    responses:
+      200:
+        description: Import finished
+        schema:
+          type: object
+          properties:
+            job_id:
+              type: integer
+            status:
+              type: string
+            records_done:
+              type: integer
+      400:
+        description: Invalid dump, the job can be resumed
+      404:
+        description: User or job not found
+    """
+    try:
+        job = current_app.manager.get_or_create_import_job(user_id, request.args.get('job_id', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    workdir = tempfile.mkdtemp(prefix='import-')
+    try:
+        if request.mimetype == 'application/zip':
+            zip_path = f'{workdir}/upload.zip'
+            with open(zip_path, 'wb') as upload:
+                shutil.copyfileobj(request.stream, upload)
+            columns = {kind: names for kind, (model, names) in EXPORT_COLUMNS.items()}
+            records = iter_sqlite_zip_records(zip_path, columns, workdir)
+        else:
+            records = iter_ndjson_records(request.stream)
+        job = current_app.manager.import_user_records(job, records)
+        return jsonify({'job_id': job.id, 'status': job.status, 'records_done': job.records_done}), 200
+
+    except Exception as e:
+        status = 400 if isinstance(e, (ValueError, KeyError)) else 500
+        return jsonify({
+            'error': str(e),
+            'job_id': job.id,
+            'status': job.status,
+            'records_done': job.records_done
+        }), status
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
 # ==================== SENTENCES MANAGEMENT ENDPOINTS ====================
 
+def idempotent(view):
+    # Idempotency-Key header: the first request with a key runs, its response is kept for
+    # IDEMPOTENCY_TTL seconds and repeated to retries, which wait while it is still running
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        user_id = request.form.get('user_id', type=int)
+        if not key or len(key) > 255 or user_id is None:
+            return jsonify({'error': 'Idempotency-Key needs 1 to 255 characters and a user_id'}), 400
+
+        config, manager = current_app.config, current_app.manager
+        request_hash = hashlib.sha256(json.dumps(
+            [request.path, sorted(request.form.items(multi=True))]).encode('utf-8')).hexdigest()
+        while True:
+            entry, claimed = manager.claim_idempotency_key(user_id, key, request_hash, config['IDEMPOTENCY_TTL'],
+                                                           config['IDEMPOTENCY_STALE_AFTER'])
+            if claimed:
+                return _run_idempotent(view, entry.id, args, kwargs)
+            if entry.request_hash != request_hash:
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            entry = _await_idempotent(user_id, key, config['IDEMPOTENCY_WAIT'])
+            if entry is None:
+                # the first request failed and gave the key up, run this one instead
+                continue
+            if entry.status_code is None:
+                response = jsonify({'error': 'A request with this Idempotency-Key is still running'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = Response(entry.response, status=entry.status_code, mimetype='application/json')
+            if entry.location:
+                response.headers['Location'] = entry.location
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+    return wrapper
+
+
+def _run_idempotent(view, entry_id, args, kwargs):
+    try:
+        response = current_app.make_response(view(*args, **kwargs))
+    except Exception:
+        current_app.manager.release_idempotency_key(entry_id)
+        raise
+    if response.status_code >= 500:
+        # nothing worth repeating, a retry gets to run again
+        current_app.manager.release_idempotency_key(entry_id)
+    else:
+        current_app.manager.complete_idempotency_key(entry_id, response.status_code, response.get_data(as_text=True),
+                                                     response.headers.get('Location'))
+    return response
+
+
+def _await_idempotent(user_id, key, timeout):
+    # polls the primary, the request holding the key may run in another worker
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        entry = current_app.manager.get_idempotency_key(user_id, key)
+        if entry is None or entry.status_code is not None or time.monotonic() >= deadline:
+            return entry
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 1.0)
+
+
 @api_bp.route('/sentences', methods=['POST'])
+@idempotent
 def add_sentence():
     """
     Create a new sentence
@@ -325,8 +564,13 @@ def add_sentence():
     tags:
       - Sentences
     summary: Create a sentence
-    description: Creates a new sentence with category and generates translations for all target languages.
+    description: Creates a new sentence with category and generates translations for all target languages. With an Idempotency-Key header, retries of the request get the first response back and do no new work.
     parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        required: false
+        description: Client chosen key of this request, e.g. a UUID, kept for IDEMPOTENCY_TTL seconds
       - name: user_id
         in: formData
         type: integer
@@ -342,7 +586,16 @@ def add_sentence():
         type: string
         required: true
         description: Category for the sentence
+      - name: on_duplicate
+        in: formData
+        type: string
+        required: false
+        enum: [reject, return, merge]
+        default: reject
+        description: What to do if the user already stored this sentence
     responses:
+      200:
+        description: Sentence already existed and was returned (or its categories merged)
       201:
         description: Sentence created successfully
         schema:
@@ -360,55 +613,310 @@ def add_sentence():
               type: string
             created_at:
               type: string
+      202:
+        description: Sentence created, translations are generated by the job in the Location header (request header Prefer respond-async)
       400:
         description: Invalid input
       404:
         description: User not found
+      409:
+        description: Sentence already exists (on_duplicate=reject), or a request with the same Idempotency-Key is still running
+      422:
+        description: The Idempotency-Key was used for a different request
     """
     try:
         original_text = request.form.get('original_text')
         user_id = request.form.get('user_id')
         category = request.form.get('category')
+        on_duplicate = request.form.get('on_duplicate', 'reject')
         
         if not all([original_text, user_id, category]):
             return jsonify({'error': 'Missing required fields'}), 400
             
         # Create sentence
-        sentence = current_app.manager.create_sentence(user_id, original_text, category)
-        
-        # Create progress group for this sentence
-        group = current_app.manager.create_progress_group(sentence.id, user_id)
-        
-        # Get user's target languages
-        user_languages = current_app.manager.get_user_languages(user_id)
-        
-        # For each target language, create translation (AI would generate these)
-        # This is a placeholder - you would call your AI service here
-        for lang in user_languages:
-            # In a real implementation, you would call an AI translation service
-            translated_text = f"Translation of '{original_text}' to {lang.language_code}"
-            current_app.manager.create_translation(
-                sentence.id, 
-                translated_text, 
-                lang.language_code, 
-                group.id
-            )
+        sentence, created = current_app.manager.create_sentence(user_id, original_text, category, on_duplicate)
+        job = None
+        if created and _wants_async():
+            job = _translate_in_background([sentence], user_id)
+        elif created:
+            _create_groups_and_translations([sentence], user_id)
         
-        return jsonify({
+        response = jsonify({
             'id': sentence.id,
             'user_id': sentence.user_id,
             'original_text': sentence.original_text,
             'language_code': sentence.language_code,
             'category': sentence.category,
             'created_at': sentence.created_at.isoformat() if sentence.created_at else None
-        }), 201
+        })
+        if job:
+            return _accepted(response, job)
+        response.status_code = 201 if created else 200
+        return response
         
+    except DuplicateSentenceError as e:
+        return jsonify({'error': str(e), 'existing_id': e.duplicates[0].id}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+
+
+@api_bp.route('/sentences/bulk', methods=['POST'])
+def add_sentences_bulk():
+    """
+    Create many sentences at once
+    ---
+    tags:
+      - Sentences
+    summary: Bulk create sentences
+    description: Stores a batch of sentences in one transaction and generates translations for the new ones.
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            user_id:
+              type: integer
+            on_duplicate:
+              type: string
+              enum: [reject, return, merge]
+              default: reject
+            stream:
+              type: boolean
+              default: false
+              description: Answer with NDJSON, one sentence record per input sentence followed by one translation record per translation as soon as it is stored
+            sentences:
+              type: array
+              items:
+                type: object
+                properties:
+                  original_text:
+                    type: string
+                  category:
+                    type: string
+    responses:
+      200:
+        description: One entry per input sentence, in input order
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              id:
+                type: integer
+              original_text:
+                type: string
+              category:
+                type: string
+              created:
+                type: boolean
+      202:
+        description: Sentences stored, translations are generated by the job in the Location header (request header Prefer respond-async)
+      400:
+        description: Invalid input
+      409:
+        description: At least one sentence already exists or is repeated in the batch (on_duplicate=reject), nothing was stored. Each entry of duplicates has the index of the sentence and either the existing_id of the stored sentence or the first_index of its first occurrence in the batch.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        user_id = data.get('user_id')
+        items = data.get('sentences')
+        on_duplicate = data.get('on_duplicate', 'reject')
+
+        if not user_id or not isinstance(items, list) or not items:
+            return jsonify({'error': 'Missing required fields'}), 400
+        if not all(isinstance(item, dict) and item.get('original_text') for item in items):
+            return jsonify({'error': 'Every sentence needs an original_text'}), 400
+
+        results = current_app.manager.create_sentences(
+            user_id,
+            [(item['original_text'], item.get('category')) for item in items],
+            on_duplicate
+        )
+        new_sentences = {}
+        for sentence, created in results:
+            # a sentence repeated inside the batch is only translated once
+            if created:
+                new_sentences[sentence.id] = sentence
+        entries = [{
+            'id': sentence.id,
+            'original_text': sentence.original_text,
+            'category': sentence.category,
+            'created': created
+        } for sentence, created in results]
+
+        if data.get('stream'):
+            # sentences first, then every translation the moment it is stored
+            def generate():
+                yield from ndjson_lines(('sentence', entry) for entry in entries)
+                yield from ndjson_lines(('translation', {
+                    'sentence_id': translation.sentence_id,
+                    'target_language': translation.target_language_code,
+                    'translated_text': translation.translated_text
+                }) for translation in _iter_groups_and_translations(list(new_sentences.values()), user_id))
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        if _wants_async():
+            return _accepted(jsonify(entries), _translate_in_background(list(new_sentences.values()), user_id))
+        _create_groups_and_translations(list(new_sentences.values()), user_id)
+        return jsonify(entries), 200
+
+    except DuplicateSentenceError as e:
+        duplicates = [{'index': index, 'existing_id': sentence.id} for index, sentence in e.duplicates.items()]
+        duplicates += [{'index': index, 'first_index': first} for index, first in e.repeats.items()]
+        return jsonify({'error': str(e), 'duplicates': sorted(duplicates, key=lambda d: d['index'])}), 409
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Server error: ' + str(e)}), 500
 
 
+def _create_groups_and_translations(sentences, user_id):
+    for _ in _iter_groups_and_translations(sentences, user_id):
+        pass
+
+
+def _iter_groups_and_translations(sentences, user_id):
+    # one progress group per new sentence; translations for all of them are requested
+    # in as few model calls as the token budget allows and yielded as they are stored
+    groups = {}
+    for sentence in sentences:
+        groups[sentence.id] = current_app.manager.create_progress_group(sentence.id, user_id).id
+
+    # Get user's target languages
+    languages = [lang.language_code for lang in current_app.manager.get_user_languages(user_id)]
+    if not sentences or not languages:
+        return
+
+    if current_app.ai_client is None:
+        # no model API configured, store placeholders instead
+        for sentence in sentences:
+            for language in languages:
+                translated_text = f"Translation of '{sentence.original_text}' to {language}"
+                yield current_app.manager.create_translation(sentence.id, translated_text, language, groups[sentence.id])
+        return
+
+    try:
+        yield from iter_translations(
+            current_app.ai_client,
+            current_app.manager,
+            [(sentence.id, sentence.original_text, sentence.category) for sentence in sentences],
+            groups,
+            sentences[0].language_code,
+            languages,
+            current_app.config['AI_TRANSLATION_TOKEN_BUDGET'],
+            current_app.config['AI_MAX_OUTPUT_TOKENS']
+        )
+    except AIClientError as e:
+        # the sentences are stored, their translations can be generated again later
+        current_app.logger.warning("Translation failed: %s", e)
+
+
+def _wants_async():
+    # RFC 7240: the client takes a 202 and polls the job instead of waiting for the model
+    return current_app.ai_client is not None and 'respond-async' in request.headers.get('Prefer', '')
+
+
+def _accepted(response, job):
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_job', job_id=job.id)
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+
+def _translate_in_background(sentences, user_id):
+    # groups are created right away, the translations by a job on the async runner
+    groups = {}
+    for sentence in sentences:
+        groups[sentence.id] = current_app.manager.create_progress_group(sentence.id, user_id).id
+    languages = [lang.language_code for lang in current_app.manager.get_user_languages(user_id)]
+    job = current_app.manager.create_job('translate', user_id)
+    current_app.async_runner.submit(_translation_job(
+        current_app._get_current_object(),
+        job.id,
+        [(sentence.id, sentence.original_text, sentence.category) for sentence in sentences],
+        groups,
+        sentences[0].language_code if sentences else None,
+        languages
+    ))
+    return job
+
+
+async def _translation_job(app, job_id, sentences, group_ids, source_language, languages):
+    runner, manager = app.async_runner, app.manager
+    await runner.run_db(manager.update_job, job_id, 'running')
+
+    async def store(item):
+        await runner.run_db(manager.create_translation, item['sentence_id'], item['text'], item['language'],
+                            group_ids[item['sentence_id']], item.get('confidence'))
+
+    try:
+        stored = await atranslate_sentences(app.ai_client, store, sentences, source_language, languages,
+                                            app.config['AI_TRANSLATION_TOKEN_BUDGET'],
+                                            app.config['AI_MAX_OUTPUT_TOKENS'])
+    except Exception as e:
+        await runner.run_db(manager.update_job, job_id, 'failed', None, str(e))
+        raise
+    await runner.run_db(manager.update_job, job_id, 'done', {'translations': stored})
+
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Get a background job
+    ---
+    tags:
+      - Jobs
+    summary: Get job status
+    description: Status of work started by a request answered with 202, e.g. the translations of new sentences.
+    parameters:
+      - name: job_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the job
+    responses:
+      200:
+        description: Job status
+        schema:
+          type: object
+          properties:
+            id:
+              type: integer
+            kind:
+              type: string
+            status:
+              type: string
+              enum: [pending, running, done, failed]
+            result:
+              type: object
+            error:
+              type: string
+            updated_at:
+              type: string
+      404:
+        description: Job not found
+    """
+    try:
+        job = current_app.manager.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'result': json.loads(job.result) if job.result else None,
+            'error': job.error,
+            'updated_at': job.updated_at.isoformat() if job.updated_at else None
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @api_bp.route('/sentences/<int:user_id>', methods=['GET'])
 def get_sentences(user_id):
     """
@@ -561,8 +1069,321 @@ def delete_sentence(sentence_id):
 
 
 
+# ==================== SHARED DECK ENDPOINTS ====================
+
+@api_bp.route('/decks', methods=['POST'])
+def publish_deck():
+    """
+    Publish a shared deck
+    ---
+    tags:
+      - Decks
+    summary: Publish sentences as a deck
+    description: Copies the user's sentences (all, or the given ones) with their translations into a deck other users can subscribe to. The deck is stored once, subscribers do not get copies.
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            user_id:
+              type: integer
+            name:
+              type: string
+            sentence_ids:
+              type: array
+              items:
+                type: integer
+    responses:
+      201:
+        description: Deck published
+      400:
+        description: Invalid input or nothing to publish
+    """
+    data = request.get_json(silent=True) or {}
+    user_id, name, sentence_ids = data.get('user_id'), data.get('name'), data.get('sentence_ids')
+    ids_ok = sentence_ids is None or (
+        isinstance(sentence_ids, list) and all(isinstance(sentence_id, int) for sentence_id in sentence_ids))
+    if not isinstance(user_id, int) or not isinstance(name, str) or not name.strip() or not ids_ok:
+        return jsonify({'error': 'user_id, name and optionally a list of sentence_ids are required'}), 400
+    try:
+        deck = current_app.manager.publish_deck(user_id, name.strip()[:100], sentence_ids)
+        return jsonify(_deck_json(deck)), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+
+
+@api_bp.route('/decks/<int:deck_id>', methods=['GET'])
+def get_deck(deck_id):
+    """
+    Get a shared deck
+    ---
+    tags:
+      - Decks
+    summary: Get deck details
+    parameters:
+      - name: deck_id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: The deck
+      404:
+        description: Deck not found
+    """
+    deck = current_app.manager.get_deck(deck_id)
+    if not deck:
+        return jsonify({'error': 'Deck not found'}), 404
+    return jsonify(_deck_json(deck))
+
+
+@api_bp.route('/decks/<int:deck_id>/subscribers', methods=['POST'])
+def subscribe_deck(deck_id):
+    """
+    Subscribe to a shared deck
+    ---
+    tags:
+      - Decks
+    summary: Subscribe a user to a deck
+    description: Adds the deck to the user's reviews. Its cards are not copied, they get a progress group each as the user's due list runs short, so subscribing costs the same for any deck size.
+    parameters:
+      - name: deck_id
+        in: path
+        type: integer
+        required: true
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            user_id:
+              type: integer
+    responses:
+      200:
+        description: The user was subscribed already
+      201:
+        description: Subscribed
+      400:
+        description: Missing user_id
+      404:
+        description: User or deck not found
+    """
+    user_id = (request.get_json(silent=True) or {}).get('user_id')
+    if not isinstance(user_id, int):
+        return jsonify({'error': 'user_id is required'}), 400
+    try:
+        subscription, created = current_app.manager.subscribe_deck(user_id, deck_id)
+        return jsonify({
+            'deck_id': subscription.deck_id,
+            'user_id': subscription.user_id,
+            'created_at': subscription.created_at.isoformat() if subscription.created_at else None
+        }), 201 if created else 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+
+
+@api_bp.route('/decks/<int:deck_id>/cards/<int:card_id>', methods=['PUT'])
+def edit_deck_card(deck_id, card_id):
+    """
+    Edit a card of a subscribed deck
+    ---
+    tags:
+      - Decks
+    summary: Edit a shared card for one user
+    description: The first edit copies the card and its translations into the user's own sentences and keeps the review progress; the deck and the other subscribers are not affected. Later edits change the copy.
+    parameters:
+      - name: deck_id
+        in: path
+        type: integer
+        required: true
+      - name: card_id
+        in: path
+        type: integer
+        required: true
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            user_id:
+              type: integer
+            original_text:
+              type: string
+            translations:
+              type: object
+              description: Language code -> corrected translation
+    responses:
+      200:
+        description: The user's copy of the card with its translations
+      400:
+        description: Invalid input
+      404:
+        description: Card not found or not subscribed
+      409:
+        description: The user already has this sentence
+    """
+    data = request.get_json(silent=True) or {}
+    user_id, original_text, translations = data.get('user_id'), data.get('original_text'), data.get('translations')
+    text_ok = original_text is None or (isinstance(original_text, str) and original_text.strip())
+    translations_ok = translations is None or (
+        isinstance(translations, dict) and all(isinstance(text, str) for text in translations.values()))
+    if not isinstance(user_id, int) or not text_ok or not translations_ok:
+        return jsonify({'error': 'user_id and an original_text or translations object are required'}), 400
+    manager = current_app.manager
+    card = manager.get_deck_card(card_id)
+    if not card or card.deck_id != deck_id:
+        return jsonify({'error': 'Card not found'}), 404
+    try:
+        sentence, copies = manager.edit_deck_card(user_id, card_id, original_text, translations)
+    except DuplicateSentenceError as e:
+        return jsonify({'error': str(e), 'existing_id': e.duplicates[0].id if e.duplicates[0] else None}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+    return jsonify({
+        'id': sentence.id,
+        'user_id': sentence.user_id,
+        'original_text': sentence.original_text,
+        'language_code': sentence.language_code,
+        'category': sentence.category,
+        'translations': [{
+            'id': translation.id,
+            'translated_text': translation.translated_text,
+            'target_language_code': translation.target_language_code
+        } for translation in copies]
+    })
+
+
+def _deck_json(deck):
+    return {
+        'id': deck.id,
+        'owner_id': deck.owner_id,
+        'name': deck.name,
+        'language_code': deck.language_code,
+        'card_count': deck.card_count,
+        'created_at': deck.created_at.isoformat() if deck.created_at else None
+    }
+
+
+
 # ==================== LEARNING MANAGEMENT ENDPOINTS ====================
 
+@api_bp.route('/learn/<int:translation_id>', methods=['POST'])
+def submit_attempt(translation_id):
+    """
+    Submit a learning attempt
+    ---
+    tags:
+      - Learning
+    summary: Submit learning attempt
+    description: Scores the answer against the stored translation, updates the progress group and logs the attempt.
+    parameters:
+      - name: translation_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the translation the user answered
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            user_answer:
+              type: string
+            group_id:
+              type: integer
+              description: Progress group of the card, required for cards of shared decks
+    responses:
+      200:
+        description: Evaluation of the attempt
+        schema:
+          type: object
+          properties:
+            translation_id:
+              type: integer
+            score:
+              type: number
+            is_success:
+              type: boolean
+            correct_answer:
+              type: string
+            next_review:
+              type: string
+      400:
+        description: Missing answer
+      404:
+        description: Translation not found
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        user_answer = data.get('user_answer')
+        group_id = data.get('group_id')
+        if not isinstance(user_answer, str) or not isinstance(group_id, (int, type(None))):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        return jsonify(_grade_attempt(translation_id, user_answer, group_id=group_id))
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+
+
+def _grade_attempt(translation_id, user_answer, user_id=None, group_id=None):
+    # scores the answer, updates the progress group and logs the attempt. group_id is
+    # needed for unedited cards of shared decks, whose translation_id is a deck translation.
+    # Raises ValueError if the translation is unknown (or not the user's).
+    manager = current_app.manager
+    group = manager.get_progress_group(group_id) if group_id is not None else None
+    if group is not None and group.sentence_id is None and group.card_id:
+        translation = manager.get_deck_translation(translation_id)
+        if not translation or translation.card_id != group.card_id:
+            raise ValueError("Translation not found")
+        # the attempt log only references the user's own translations
+        logged_translation_id = None
+    else:
+        translation = manager.get_translation(translation_id)
+        if not translation or not translation.group_id or (group_id is not None and translation.group_id != group_id):
+            raise ValueError("Translation not found")
+        group_id = translation.group_id
+        logged_translation_id = translation.id
+    if user_id is not None:
+        # session answers may only grade the user's own cards
+        group = group or manager.get_progress_group(group_id)
+        if not group or group.user_id != user_id:
+            raise ValueError("Translation not found")
+
+    score = answer_score(user_answer, translation.translated_text or '')
+    is_success = score >= current_app.config['LEARN_SUCCESS_SCORE']
+    group = manager.update_progress_group(group_id, score, is_success)
+    current_app.attempt_log.record(
+        user_id=group.user_id,
+        group_id=group.id,
+        translation_id=logged_translation_id,
+        language_code=translation.target_language_code,
+        score=score,
+        is_success=is_success,
+        attempted_at=datetime.utcnow()
+    )
+    return {
+        'translation_id': translation.id,
+        'score': score,
+        'is_success': is_success,
+        'correct_answer': translation.translated_text,
+        'next_review': group.next_review.isoformat() if group.next_review else None
+    }
+
+
 @api_bp.route('/learn/user/<int:user_id>/due', methods=['GET'])
 def get_due_reviews(user_id):
     """
@@ -571,13 +1392,18 @@ def get_due_reviews(user_id):
     tags:
       - Learning
     summary: Get due reviews
-    description: Returns all progress groups that are due for review for a user.
+    description: Returns the next progress groups that are due for review for a user, by priority (most overdue days first, then lowest group score). Served from the queue precomputed by `flask build-review-queues` when there is one for today.
     parameters:
       - name: user_id
         in: path
         type: integer
         required: true
         description: ID of the user
+      - name: limit
+        in: query
+        type: integer
+        default: 100
+        description: Number of groups to return, at most 1000
     responses:
       200:
         description: List of due progress groups
@@ -600,23 +1426,32 @@ def get_due_reviews(user_id):
                 type: string
               review_count:
                 type: integer
+              overdue_days:
+                type: integer
+              card_id:
+                type: integer
+                description: Card of a subscribed deck, sentence_id is null until the user edits it
               created_at:
                 type: string
       404:
         description: User not found
     """
     try:
-        due_groups = current_app.manager.get_due_progress_groups(user_id)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), DUE_LIMIT_MAX)
+        due_groups = _due_groups(user_id, limit)
+        today = datetime.utcnow().date()
         groups_list = []
         for group in due_groups:
             groups_list.append({
                 'id': group.id,
                 'sentence_id': group.sentence_id,
+                'card_id': group.card_id,
                 'user_id': group.user_id,
                 'group_score': group.group_score,
                 'next_review': group.next_review.isoformat() if group.next_review else None,
                 'last_reviewed': group.last_reviewed.isoformat() if group.last_reviewed else None,
                 'review_count': group.review_count,
+                'overdue_days': (today - group.next_review).days,
                 'created_at': group.created_at.isoformat() if group.created_at else None
             })
         return jsonify(groups_list)
@@ -625,6 +1460,189 @@ def get_due_reviews(user_id):
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/learn/session/<int:user_id>', methods=['GET'])
+def get_review_session(user_id):
+    """
+    Start or continue a review session
+    ---
+    tags:
+      - Learning
+    summary: Get a bundle of review cards
+    description: Returns the next due cards in review order, each with its sentence and translations, and a cursor for the bundle after them. Answers can be sent in batches with POST, which returns the following bundle together with the grading.
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the user
+      - name: size
+        in: query
+        type: integer
+        default: 10
+        description: Cards per bundle
+      - name: cursor
+        in: query
+        type: string
+        description: Continue after the cards of an earlier bundle
+    responses:
+      200:
+        description: Bundle of cards
+        schema:
+          type: object
+          properties:
+            cards:
+              type: array
+              items:
+                type: object
+            cursor:
+              type: string
+              description: null once no further cards are due
+      400:
+        description: Invalid cursor
+    """
+    try:
+        after = _decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(_review_bundle(user_id, request.args.get('size', type=int), after))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/learn/session/<int:user_id>', methods=['POST'])
+def answer_review_session(user_id):
+    """
+    Submit answers of a review session
+    ---
+    tags:
+      - Learning
+    summary: Grade answers and get the next bundle
+    description: Grades every answer like POST /learn/{translation_id} and returns the results together with the next bundle of cards after the cursor.
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the user
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            answers:
+              type: array
+              items:
+                type: object
+                properties:
+                  translation_id:
+                    type: integer
+                  user_answer:
+                    type: string
+                  group_id:
+                    type: integer
+                    description: Required for cards of shared decks
+            cursor:
+              type: string
+            size:
+              type: integer
+    responses:
+      200:
+        description: One result per answer (an error for unknown translations), the next cards and cursor
+      400:
+        description: Invalid body or cursor
+    """
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers', [])
+    if not isinstance(answers, list) or not all(
+            isinstance(answer, dict) and isinstance(answer.get('translation_id'), int)
+            and isinstance(answer.get('user_answer'), str)
+            and isinstance(answer.get('group_id'), (int, type(None))) for answer in answers):
+        return jsonify({'error': 'answers must be a list of translation_id and user_answer'}), 400
+    try:
+        after = _decode_cursor(data.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        results = []
+        for answer in answers:
+            try:
+                results.append(_grade_attempt(answer['translation_id'], answer['user_answer'], user_id,
+                                              answer.get('group_id')))
+            except ValueError as e:
+                results.append({'translation_id': answer['translation_id'], 'error': str(e)})
+        bundle = _review_bundle(user_id, data.get('size'), after)
+        bundle['results'] = results
+        return jsonify(bundle)
+    except Exception as e:
+        return jsonify({'error': 'Server error: ' + str(e)}), 500
+
+
+def _review_bundle(user_id, size, after):
+    # the next size due cards after the cursor position, with the cursor for the rest
+    config = current_app.config
+    size = min(max(size or config['LEARN_SESSION_BUNDLE_SIZE'], 1), config['LEARN_SESSION_BUNDLE_MAX'])
+    manager = current_app.manager
+    groups = _due_groups(user_id, size, after)
+    today = datetime.utcnow().date()
+    cards = []
+    for group, sentence, translations in manager.get_review_cards(user_id, groups):
+        cards.append({
+            'group_id': group.id,
+            # set for unedited cards of shared decks, answers to them have to name the group_id
+            'card_id': group.card_id if group.sentence_id is None else None,
+            'sentence': {
+                'id': sentence.id,
+                'original_text': sentence.original_text,
+                'language_code': sentence.language_code,
+                'category': sentence.category
+            } if sentence else None,
+            'translations': [{
+                'id': translation.id,
+                'translated_text': translation.translated_text,
+                'target_language_code': translation.target_language_code
+            } for translation in translations],
+            'group_score': group.group_score,
+            'review_count': group.review_count,
+            'overdue_days': (today - group.next_review).days
+        })
+    # a short bundle was the last one
+    cursor = _encode_cursor(due_key(groups[-1])) if len(groups) == size else None
+    return {'cards': cards, 'cursor': cursor}
+
+
+def _due_groups(user_id, limit, after=None):
+    # cards of subscribed decks get their progress groups as the due list runs short
+    manager = current_app.manager
+    groups = manager.get_due_progress_groups(user_id, limit, after)
+    if len(groups) < limit and manager.introduce_deck_cards(user_id, min(limit - len(groups), DECK_INTRODUCE_MAX)):
+        groups = manager.get_due_progress_groups(user_id, limit, after)
+    return groups
+
+
+def _encode_cursor(key):
+    # the due_key of the last card handed out; only valid on the day it was made
+    next_review, group_score, group_id = key
+    payload = json.dumps([datetime.utcnow().date().isoformat(), next_review.isoformat(), group_score, group_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    # due_key to continue after, None to start from the first due card
+    if not cursor:
+        return None
+    try:
+        day, next_review, group_score, group_id = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        key = (date.fromisoformat(next_review), float(group_score), int(group_id))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    # cards answered yesterday may be due again today, start over
+    return key if day == datetime.utcnow().date().isoformat() else None
+
+
 @api_bp.route('/learn/stats/<int:user_id>', methods=['GET'])
 def get_learning_stats(user_id):
     """
@@ -633,7 +1651,7 @@ def get_learning_stats(user_id):
     tags:
       - Learning
     summary: Get learning stats
-    description: Returns learning statistics for a user.
+    description: Returns learning statistics for a user, computed from their progress groups.
     parameters:
       - name: user_id
         in: path
@@ -648,8 +1666,10 @@ def get_learning_stats(user_id):
           properties:
             total_reviews:
               type: integer
+              description: Answers graded so far, the review_count of all progress groups added up
             avg_success_rate:
               type: number
+              description: Share of successful answers in percent, averaged over the groups reviewed at least once
       404:
         description: User not found
     """
@@ -660,3 +1680,53 @@ def get_learning_stats(user_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@api_bp.route('/learn/stats/<int:user_id>/daily', methods=['GET'])
+def get_daily_learning_stats(user_id):
+    """
+    Get daily learning statistics for a user
+    ---
+    tags:
+      - Learning
+    summary: Get daily learning stats
+    description: Attempts, successes and average score per day and target language, from the attempt log.
+    parameters:
+      - name: user_id
+        in: path
+        type: integer
+        required: true
+        description: ID of the user
+      - name: days
+        in: query
+        type: integer
+        default: 30
+        description: Number of days to look back
+    responses:
+      200:
+        description: One entry per day and language
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              day:
+                type: string
+              language_code:
+                type: string
+              attempts:
+                type: integer
+              successes:
+                type: integer
+              avg_score:
+                type: number
+    """
+    try:
+        days = request.args.get('days', 30, type=int)
+        since = datetime.utcnow().date() - timedelta(days=max(days, 1) - 1)
+        stats = current_app.manager.get_daily_attempt_stats(user_id, since)
+        for entry in stats:
+            entry['day'] = entry['day'].isoformat()
+        return jsonify(stats)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -3,36 +3,93 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_restful import Api, Resource
 from flasgger import Swagger, swag_from
 from datetime import datetime
+from sqlalchemy.pool import NullPool
 from src.server.models.data_models import db
-from data_manager import DataManager
+from src.server.data_manager import DataManager
 from src.server.api.routes import api_bp
+from src.server.api.debug import debug_bp
+from src.server.core.config import Config
+from src.server.core.read_replica import SnapshotRefresher, refresh_snapshot
+from src.server.core.sharding import init_shard, shard_bind_key, shard_binds
+from src.server.commands import register_commands
+from src.server.core.ai_client import AIClient
+from src.server.core.attempt_log import AttemptLog
+from src.server.core.async_runner import AsyncRunner
+from src.server.core.admission import AdmissionController
+from src.server.core.tracing import Tracer
+from src.server.core.profiler import SamplingProfiler
+from src.server.core.languages import LanguageRegistry
 
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-    app.config['SWAGGER'] = {
-        'title': 'N-LanguagesAI API',
-        'uiversion': 3,
-        'description': 'API for multilingual language learning application'
-    }
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+        if 'ADMISSION_LIMITS' in config:
+            # overrides are per endpoint, None lifts an endpoint's limit
+            limits = dict(Config.ADMISSION_LIMITS, **config['ADMISSION_LIMITS'])
+            app.config['ADMISSION_LIMITS'] = {k: v for k, v in limits.items() if v is not None}
+
+    # optional read database, DataManager routes its read-only methods there
+    if app.config['DB_READ_URI']:
+        read_bind = app.config['DB_READ_URI']
+        if app.config['DB_READ_SNAPSHOT']:
+            # no pooling, every session has to open the latest snapshot file
+            read_bind = {'url': read_bind, 'poolclass': NullPool}
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, read=read_bind)
+    # optional user shards for the per-user tables
+    if app.config['DB_SHARD_URIS']:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                              **shard_binds(app.config['DB_SHARD_URIS']))
+
     # create data manager for the app
     app.manager = DataManager()
+    # one model API client per process, its pool and rate limits are shared by all requests
+    app.ai_client = AIClient.from_config(app.config) if app.config['AI_API_KEY'] else None
+    # write-behind buffer for learning attempts, reviews never wait for the log
+    app.attempt_log = AttemptLog.from_config(app)
+    # event loop for model calls of requests answered with 202 (Prefer: respond-async)
+    app.async_runner = AsyncRunner.from_config(app)
+    # per-user rate limits and a concurrency cap for the expensive endpoints
+    app.admission = AdmissionController.from_config(app)
+    # sampled spans of routes, DataManager calls, SQL and model calls, off by default
+    app.tracer = Tracer.from_config(app)
+    # on-demand stack sampling behind /debug/profile, one profile per process at a time
+    app.profiler = SamplingProfiler.from_config(app)
+    # language code <-> small integer key stored in the rows, kept in memory
+    app.languages = LanguageRegistry()
 
     # initial extensions
     swagger = Swagger(app)
     db.init_app(app)
+    app.manager.init_app(app)
+    with app.app_context():
+        # before admission, so the route span includes waiting for admission
+        app.tracer.init_app(app, db.engines.values())
+    app.admission.init_app(app)
 
     # register blueprints
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(debug_bp, url_prefix='/debug')
+    register_commands(app)
 
     # import models for database creation
     from src.server.models import data_models
     with app.app_context():
-        db.create_all()
+        # the models have no bind keys; the other binds' metadata is empty and may even
+        # stem from another app of this process (db is shared), the shards are set up below
+        db.create_all(bind_key=None)
+        app.languages.reload()
+        for index in range(len(app.config['DB_SHARD_URIS'])):
+            init_shard(db.engines[shard_bind_key(index)], db.metadata, index)
+        if app.config['DB_READ_URI'] and app.config['DB_READ_SNAPSHOT']:
+            # start from a current snapshot, create_all only left an empty file there
+            refresh_snapshot(db.engines[None], db.engines['read'])
+            if app.config['DB_READ_SNAPSHOT_INTERVAL']:
+                app.snapshot_refresher = SnapshotRefresher(app, app.config['DB_READ_SNAPSHOT_INTERVAL'])
+                app.snapshot_refresher.start()
         
 
-    return app
\ No newline at end of file
+    return app
@@ -0,0 +1,112 @@
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from src.server.extensions import db
+from src.server.core.read_replica import refresh_snapshot
+from src.server.core.sharding import plan_rebalance
+
+
+def register_commands(app):
+    app.cli.add_command(refresh_read_snapshot)
+    app.cli.add_command(move_user)
+    app.cli.add_command(rebalance_shards)
+    app.cli.add_command(rollup_attempts)
+    app.cli.add_command(build_review_queues)
+    app.cli.add_command(tier_progress_groups)
+    app.cli.add_command(purge_idempotency_keys)
+
+
+@click.command('refresh-read-snapshot')
+@with_appcontext
+def refresh_read_snapshot():
+    """Copy the primary database into the DB_READ_URI snapshot file."""
+    if 'read' not in db.engines:
+        raise click.ClickException("DB_READ_URI is not configured")
+    refresh_snapshot(db.engines[None], db.engines['read'])
+    click.echo(f"Read snapshot refreshed: {db.engines['read'].url.database}")
+
+
+@click.command('move-user')
+@click.argument('user_id', type=int)
+@click.argument('shard', type=int)
+@with_appcontext
+def move_user(user_id, shard):
+    """Move a user's rows to another shard (their sentence, group and translation ids change)."""
+    try:
+        current_app.manager.move_user(user_id, shard)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"User {user_id} now lives on shard {shard}")
+
+
+@click.command('rebalance-shards')
+@click.option('--tolerance', default=0.1, show_default=True,
+              help='Allowed deviation of a shard from the mean number of sentences.')
+@click.option('--dry-run', is_flag=True, help='Only print the planned moves.')
+@with_appcontext
+def rebalance_shards(tolerance, dry_run):
+    """Move users between shards until the shards hold similar numbers of sentences."""
+    manager = current_app.manager
+    if not current_app.config['DB_SHARD_URIS']:
+        raise click.ClickException("DB_SHARD_URIS is not configured")
+    moves = plan_rebalance(manager.get_shard_loads(), tolerance)
+    for user_id, source, target in moves:
+        click.echo(f"user {user_id}: shard {source} -> {target}")
+        if not dry_run:
+            manager.move_user(user_id, target)
+    click.echo(f"{len(moves)} move(s) {'planned' if dry_run else 'done'}")
+
+
+@click.command('rollup-attempts')
+@click.option('--prune/--no-prune', default=True, show_default=True,
+              help='Delete rolled up attempts older than ATTEMPT_LOG_RETENTION_DAYS.')
+@with_appcontext
+def rollup_attempts(prune):
+    """Fold the learning attempts of past days into the daily rollups."""
+    # meant to run daily from cron; attempts of the current day are left alone
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    prune_before = today - timedelta(days=current_app.config['ATTEMPT_LOG_RETENTION_DAYS']) if prune else None
+    current_app.attempt_log.flush()
+    rolled, pruned = current_app.manager.rollup_attempts(today, prune_before)
+    click.echo(f"{rolled} attempt(s) rolled up, {pruned} pruned")
+
+
+@click.command('build-review-queues')
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Day to build the queues for, default today (UTC).')
+@click.option('--batch-size', type=int, help='Users per transaction, default REVIEW_QUEUE_BATCH_SIZE.')
+@click.option('--pause', default=0.0, show_default=True,
+              help='Seconds to sleep between batches.')
+@with_appcontext
+def build_review_queues(day, batch_size, pause):
+    """Precompute the review queue of every active user for a day."""
+    # meant to run from cron off-peak, e.g. shortly after midnight or late the evening before
+    config = current_app.config
+    day = (day or datetime.utcnow()).date()
+    active_since = datetime.utcnow() - timedelta(days=config['REVIEW_QUEUE_ACTIVE_DAYS'])
+    current_app.attempt_log.flush()
+    built = current_app.manager.build_review_queues(
+        day, active_since, batch_size or config['REVIEW_QUEUE_BATCH_SIZE'], pause)
+    click.echo(f"{built} review queue(s) built for {day.isoformat()}")
+
+
+@click.command('tier-progress-groups')
+@click.option('--batch-size', type=int, help='Rows per transaction, default PROGRESS_TIER_BATCH_SIZE.')
+@with_appcontext
+def tier_progress_groups(batch_size):
+    """Move far-off progress groups to the cold table and soon due ones back."""
+    # meant to run daily from cron, before build-review-queues
+    config = current_app.config
+    today = datetime.utcnow().date()
+    cooled, warmed = current_app.manager.tier_progress_groups(
+        today + timedelta(days=config['PROGRESS_COLD_AFTER_DAYS']),
+        today + timedelta(days=config['PROGRESS_WARM_AHEAD_DAYS']),
+        batch_size or config['PROGRESS_TIER_BATCH_SIZE'])
+    click.echo(f"{cooled} group(s) moved to the cold table, {warmed} back")
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys():
+    """Delete the stored responses of expired Idempotency-Keys."""
+    click.echo(f"{current_app.manager.purge_idempotency_keys()} expired key(s) deleted")
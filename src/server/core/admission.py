@@ -0,0 +1,114 @@
+"""
+Admission control for the expensive endpoints.
+
+Every endpoint listed in ADMISSION_LIMITS gets a token bucket per user, and
+all of them together share a cap on requests in flight in this process.
+Requests over a limit are answered at once, 429 with Retry-After when the
+user is over their rate and 503 when the process is saturated, instead of
+queueing behind the work they would add to.
+"""
+import math
+import threading
+from collections import OrderedDict
+from flask import g, jsonify, request
+
+from src.server.core.rate_limit import TokenBucket
+
+
+class AdmissionController:
+    def __init__(self, limits, max_concurrent=0, max_keys=10000, runner=None, max_background=0):
+        # limits: endpoint -> {'rate': tokens per second, 'burst': bucket size}
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.max_keys = max_keys
+        self.runner = runner
+        self.max_background = max_background
+        self.in_flight = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app.config['ADMISSION_LIMITS'],
+            max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+            runner=app.async_runner,
+            max_background=app.config['ASYNC_MAX_PENDING'],
+        )
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def before_request(self):
+        limit = self.limits.get(request.endpoint)
+        if limit is None:
+            return None
+
+        cost = _request_cost()
+        if cost > limit['burst']:
+            return _reject(413, f"At most {int(limit['burst'])} items per request")
+        # the process-wide caps come first, a request turned away with 503
+        # must not use up the user's tokens
+        if (self.runner is not None and self.max_background
+                and 'respond-async' in request.headers.get('Prefer', '')
+                and self.runner.pending >= self.max_background):
+            return _reject(503, "Server is busy", 1)
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                return _reject(503, "Server is busy", 1)
+            self.in_flight += 1
+        g._admitted = True
+
+        wait = self._bucket(request.endpoint, _client_key(), limit).try_acquire(cost)
+        if wait:
+            # teardown_request gives the slot back
+            return _reject(429, "Too many requests", wait)
+        return None
+
+    def teardown_request(self, exc=None):
+        if g.pop('_admitted', False):
+            with self._lock:
+                self.in_flight -= 1
+
+    def _bucket(self, endpoint, key, limit):
+        with self._lock:
+            bucket = self._buckets.get((endpoint, key))
+            if bucket is None:
+                bucket = self._buckets[(endpoint, key)] = TokenBucket(limit['rate'], limit['burst'])
+                # least recently used users go first, their buckets would be full again anyway
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end((endpoint, key))
+            return bucket
+
+
+def _client_key():
+    # the user the request acts for (there is no authentication, so as claimed by the
+    # request), else the client address
+    user_id = (request.view_args or {}).get('user_id') or request.form.get('user_id')
+    if user_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get('user_id')
+    return f'user:{user_id}' if user_id else f'addr:{request.remote_addr}'
+
+
+def _request_cost():
+    # a batch request costs one token per sentence or answer, everything else one
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            for key in ('sentences', 'answers'):
+                if isinstance(data.get(key), list):
+                    return max(1, len(data[key]))
+    return 1
+
+
+def _reject(status, message, retry_after=None):
+    response = jsonify({'error': message})
+    response.status_code = status
+    if retry_after:
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
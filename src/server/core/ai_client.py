@@ -0,0 +1,536 @@
+"""
+Shared client for the model API (translation, scoring, scheduling).
+
+One instance per app keeps a pool of keep-alive HTTP connections, rate limits
+requests and input tokens to the provider quota, retries transient failures
+with jittered exponential backoff and coalesces identical concurrent requests
+into a single upstream call. stream_complete() yields the answer while it is
+still being generated; callers that ask for the same answer while it streams
+get what has arrived so far and then follow the same upstream stream. The a-prefixed methods do the same on an asyncio event
+loop (see core.async_runner) with their own connection pool; sync and async
+calls share the rate limits.
+"""
+import asyncio
+import hashlib
+import http.client
+import json
+import queue
+import random
+import ssl
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlsplit
+
+from src.server.core.rate_limit import TokenBucket
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+ANTHROPIC_VERSION = '2023-06-01'
+
+
+class AIClientError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AIStreamInterrupted(AIClientError):
+    # a streamed answer broke off after it had started, the text received so far is valid
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, base_url, size=8, timeout=60):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        connection_class = (http.client.HTTPSConnection if self.scheme == 'https'
+                            else http.client.HTTPConnection)
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def open(self, method, path, body, headers):
+        # returns (connection, response) with the body still unread; the caller hands
+        # both to finish() after reading it completely, or closes the connection
+        try:
+            connection, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self._connect(), False
+        try:
+            connection.request(method, self.base_path + path, body=body, headers=headers)
+            return connection, connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, not a real failure
+            return self.open(method, path, body, headers)
+        except Exception:
+            connection.close()
+            raise
+
+    def finish(self, connection, response):
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class AsyncResponse:
+    def __init__(self, pool, connection, status, headers):
+        self.pool = pool
+        self.connection = connection
+        self.status = status
+        self.headers = headers
+        chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        length = headers.get('content-length')
+        self._chunked = chunked
+        self._remaining = int(length) if length is not None and not chunked else None
+        self.will_close = (headers.get('connection', '').lower() == 'close'
+                           or (not chunked and length is None))
+        self._complete = False
+
+    async def iter_body(self):
+        reader = self.connection[0]
+        timeout = self.pool.timeout
+        if self._chunked:
+            while True:
+                size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b';')[0], 16)
+                if not size:
+                    # trailers end with an empty line
+                    while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                        pass
+                    break
+                data = await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+                yield data[:-2]
+        elif self._remaining is not None:
+            while self._remaining:
+                data = await asyncio.wait_for(reader.read(min(self._remaining, 65536)), timeout)
+                if not data:
+                    raise ConnectionError("Connection closed before the end of the response")
+                self._remaining -= len(data)
+                yield data
+        else:
+            while data := await asyncio.wait_for(reader.read(65536), timeout):
+                yield data
+        self._complete = True
+
+    async def read(self):
+        return b''.join([data async for data in self.iter_body()])
+
+    async def iter_lines(self):
+        buffer = b''
+        async for data in self.iter_body():
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line
+        if buffer:
+            yield buffer
+
+    def finish(self):
+        # back to the pool after a complete read, otherwise the connection is unusable
+        if self._complete and not self.will_close:
+            self.pool.release(self.connection)
+        else:
+            self.pool.discard(self.connection)
+
+
+class AsyncConnectionPool:
+    # minimal HTTP/1.1 client on asyncio streams, bound to the loop it is used on
+    def __init__(self, base_url, max_connections=64, timeout=60):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def open(self, method, path, body, headers):
+        # returns an AsyncResponse with the body unread; call its finish() when done
+        await self._slots.acquire()
+        try:
+            return await self._open(method, path, body, headers)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _open(self, method, path, body, headers):
+        reused = bool(self._idle)
+        if reused:
+            connection = self._idle.pop()
+        else:
+            connection = await asyncio.wait_for(asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context() if self.https else None), self.timeout)
+        reader, writer = connection
+        lines = [f'{method} {self.base_path}{path} HTTP/1.1', f'host: {self.host}',
+                 f'content-length: {len(body)}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not status_line:
+                raise ConnectionResetError("Connection closed by the server")
+            response_headers = {}
+            while True:
+                line = (await asyncio.wait_for(reader.readline(), self.timeout)).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+            writer.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, not a real failure
+            return await self._open(method, path, body, headers)
+        except BaseException:
+            writer.close()
+            raise
+        return AsyncResponse(self, connection, int(status_line.split()[1]), response_headers)
+
+    def release(self, connection):
+        self._idle.append(connection)
+        self._slots.release()
+
+    def discard(self, connection):
+        connection[1].close()
+        self._slots.release()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream:
+    # the pieces of a streamed answer so far, replayed to every caller that joins it.
+    # A follower waits at most timeout seconds for the next piece, like a reader of
+    # the connection itself would
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.changed = threading.Condition()
+
+    def add(self, text):
+        with self.changed:
+            self.pieces.append(text)
+            self.changed.notify_all()
+
+    def finish(self, error=None):
+        with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+    def follow(self):
+        position = 0
+        while True:
+            with self.changed:
+                while position == len(self.pieces) and not self.done:
+                    if not self.changed.wait(self.timeout):
+                        raise AIStreamInterrupted(
+                            f"Model API stream sent nothing for {self.timeout} seconds")
+                pieces, done, error = self.pieces[position:], self.done, self.error
+            position += len(pieces)
+            yield from pieces
+            if done:
+                if error:
+                    raise error
+                return
+
+
+class AIClient:
+    def __init__(self, base_url, api_key, model, pool_size=8, requests_per_minute=50,
+                 input_tokens_per_minute=40000, max_retries=3, timeout=60,
+                 backoff_base=0.5, backoff_max=20.0, async_connections=64):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.async_connections = async_connections
+        self._async_pool = None
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool = ConnectionPool(base_url, pool_size, timeout)
+        # buckets start full so a burst of up to one minute of quota goes out at once
+        self.request_bucket = TokenBucket(requests_per_minute / 60.0, requests_per_minute)
+        self.token_bucket = TokenBucket(input_tokens_per_minute / 60.0, input_tokens_per_minute)
+        self._inflight = {}
+        self._inflight_streams = {}
+        self._inflight_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            base_url=config['AI_BASE_URL'],
+            api_key=config['AI_API_KEY'],
+            model=config['AI_MODEL'],
+            pool_size=config['AI_POOL_SIZE'],
+            requests_per_minute=config['AI_REQUESTS_PER_MINUTE'],
+            input_tokens_per_minute=config['AI_INPUT_TOKENS_PER_MINUTE'],
+            max_retries=config['AI_MAX_RETRIES'],
+            timeout=config['AI_TIMEOUT'],
+            async_connections=config['AI_ASYNC_MAX_CONNECTIONS'],
+        )
+
+    def complete(self, prompt, system=None, max_tokens=1024):
+        # returns the text of the model's answer
+        response = self.create_message(self.build_payload(prompt, system, max_tokens))
+        return ''.join(block.get('text', '') for block in response.get('content', [])
+                       if block.get('type') == 'text')
+
+    def stream_complete(self, prompt, system=None, max_tokens=1024):
+        # yields the text of the model's answer piece by piece as it arrives. Failures
+        # before the first byte are retried like in complete(); a stream that breaks
+        # off later raises AIStreamInterrupted. Identical streams in flight share one upstream
+        # call like create_message(); if the caller that opened it stops reading early, the
+        # others get AIStreamInterrupted.
+        payload = dict(self.build_payload(prompt, system, max_tokens), stream=True)
+        key = _payload_key(payload)
+        with self._inflight_lock:
+            stream = self._inflight_streams.get(key)
+            leader = stream is None
+            if leader:
+                stream = self._inflight_streams[key] = _Stream(self.timeout)
+        if not leader:
+            yield from stream.follow()
+            return
+        error = AIStreamInterrupted("Model API stream was abandoned by the caller reading it")
+        try:
+            with closing(self._stream_text(payload)) as pieces:
+                for text in pieces:
+                    stream.add(text)
+                    yield text
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight_streams[key]
+            stream.finish(error)
+
+    def _stream_text(self, payload):
+        connection, response = self._open(payload)
+        finished = False
+        try:
+            for line in response:
+                event = _parse_event(line)
+                if event is None:
+                    continue
+                if event['type'] == 'message_stop':
+                    finished = True
+                text = _event_text(event)
+                if text:
+                    yield text
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            raise AIStreamInterrupted(f"Model API stream broke off: {e}")
+        finally:
+            if finished:
+                self.pool.finish(connection, response)
+            else:
+                connection.close()
+        if not finished:
+            raise AIStreamInterrupted("Model API stream ended before message_stop")
+
+    async def astream_complete(self, prompt, system=None, max_tokens=1024):
+        # stream_complete() for coroutines, must run on a single event loop. Identical
+        # streams are not coalesced here, each call is its own upstream request
+        payload = dict(self.build_payload(prompt, system, max_tokens), stream=True)
+        response = await self._aopen(payload)
+        finished = False
+        try:
+            async for line in response.iter_lines():
+                event = _parse_event(line)
+                if event is None:
+                    continue
+                if event['type'] == 'message_stop':
+                    finished = True
+                text = _event_text(event)
+                if text:
+                    yield text
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            raise AIStreamInterrupted(f"Model API stream broke off: {e}")
+        finally:
+            response.finish()
+        if not finished:
+            raise AIStreamInterrupted("Model API stream ended before message_stop")
+
+    def build_payload(self, prompt, system=None, max_tokens=1024):
+        payload = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'messages': [{'role': 'user', 'content': prompt}],
+        }
+        if system:
+            payload['system'] = system
+        return payload
+
+    def create_message(self, payload):
+        # identical payloads in flight at the same time share one upstream call
+        key = _payload_key(payload)
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._send(payload)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _headers(self):
+        return {
+            'content-type': 'application/json',
+            'x-api-key': self.api_key,
+            'anthropic-version': ANTHROPIC_VERSION,
+        }
+
+    def _throttle(self, body):
+        self.request_bucket.acquire()
+        # rough input token estimate, the quota counts tokens not bytes
+        self.token_bucket.acquire(max(1, len(body) // 4))
+
+    def _send(self, payload):
+        connection, response = self._open(payload)
+        try:
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise AIClientError(f"Model API response broke off: {e}")
+        self.pool.finish(connection, response)
+        return json.loads(data)
+
+    def _open(self, payload):
+        # sends the request until a 2xx response arrives and returns (connection, response)
+        # with the body unread
+        body = json.dumps(payload).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            self._throttle(body)
+            retry_after = None
+            try:
+                connection, response = self.pool.open('POST', '/v1/messages', body, self._headers())
+            except (OSError, http.client.HTTPException) as e:
+                error = AIClientError(f"Model API unreachable: {e}")
+            else:
+                if response.status < 300:
+                    return connection, response
+                # error bodies are small, read them so the connection can be reused
+                try:
+                    data = response.read()
+                    self.pool.finish(connection, response)
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    data = b''
+                error = AIClientError(f"Model API returned {response.status}: {data[:200]!r}", response.status)
+                if response.status not in RETRY_STATUSES:
+                    raise error
+                retry_after = response.headers.get('retry-after')
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(self._backoff(attempt, retry_after))
+
+    async def _aopen(self, payload):
+        # _open() for coroutines, returns an AsyncResponse with the body unread
+        if self._async_pool is None:
+            self._async_pool = AsyncConnectionPool(self.base_url, self.async_connections, self.timeout)
+        body = json.dumps(payload).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.request_bucket.reserve())
+            await asyncio.sleep(self.token_bucket.reserve(max(1, len(body) // 4)))
+            retry_after = None
+            try:
+                response = await self._async_pool.open('POST', '/v1/messages', body, self._headers())
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                error = AIClientError(f"Model API unreachable: {e}")
+            else:
+                if response.status < 300:
+                    return response
+                try:
+                    data = await response.read()
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    data = b''
+                response.finish()
+                error = AIClientError(f"Model API returned {response.status}: {data[:200]!r}", response.status)
+                if response.status not in RETRY_STATUSES:
+                    raise error
+                retry_after = response.headers.get('retry-after')
+            if attempt == self.max_retries:
+                raise error
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # full jitter: spreads retries of many clients over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def close(self):
+        self.pool.close()
+        if self._async_pool is not None:
+            self._async_pool.close()
+
+
+def _payload_key(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _parse_event(line):
+    # server-sent events, only the data lines matter for the messages API
+    line = line.strip()
+    if line.startswith(b'data:'):
+        return json.loads(line[5:])
+    return None
+
+
+def _event_text(event):
+    if event['type'] == 'error':
+        raise AIStreamInterrupted(f"Model API stream error: {event.get('error')}")
+    if event['type'] == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+        return event['delta']['text']
+    return None
@@ -0,0 +1,60 @@
+"""
+Per-process asyncio event loop for model-bound work.
+
+Views hand coroutines to submit() and return right away. All coroutines share
+one loop in a daemon thread, so hundreds of model calls can wait on the network
+at the same time without holding a worker thread each. The sqlite driver
+blocks, so coroutines reach the database through run_db(), a small thread pool
+that runs each call inside an app context.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    def __init__(self, app, db_workers=2):
+        self.app = app
+        self.db_workers = db_workers
+        self._loop = None
+        self._db_pool = None
+        self._lock = threading.Lock()
+        # submitted coroutines that have not finished yet
+        self.pending = 0
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(app, db_workers=app.config['ASYNC_DB_WORKERS'])
+
+    def _ensure_loop(self):
+        # started on first use, so forking servers get one loop per worker
+        with self._lock:
+            if self._loop is None:
+                self._db_pool = ThreadPoolExecutor(self.db_workers, thread_name_prefix='async-db')
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='async-runner', daemon=True).start()
+            return self._loop
+
+    def submit(self, coro):
+        # schedules coro on the loop, returns a concurrent.futures.Future
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        with self._lock:
+            self.pending += 1
+        future.add_done_callback(self._done)
+        return future
+
+    async def run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db_pool, self._in_app_context, func, args)
+
+    def _in_app_context(self, func, args):
+        with self.app.app_context():
+            return func(*args)
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Background task failed", exc_info=future.exception())
@@ -0,0 +1,82 @@
+"""
+Write-behind buffer for the learning attempt log.
+
+A review request only appends its attempt to an in-memory list. A background
+thread writes the list through DataManager.insert_attempts in one batch every
+flush_interval seconds, or earlier once flush_size attempts are waiting.
+Attempts still buffered when the process exits are flushed by an atexit hook;
+a hard crash loses at most one interval.
+"""
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptLog:
+    def __init__(self, app, flush_interval=2.0, flush_size=200, max_buffer=10000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # beyond this the database is not keeping up; attempts are dropped rather
+        # than slowing down reviews or growing without bound
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app,
+            flush_interval=app.config['ATTEMPT_LOG_FLUSH_INTERVAL'],
+            flush_size=app.config['ATTEMPT_LOG_FLUSH_SIZE'],
+            max_buffer=app.config['ATTEMPT_LOG_MAX_BUFFER'],
+        )
+
+    def record(self, **attempt):
+        # attempt: Learning_Attempts column values. Returns False if it was dropped.
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return False
+            self._buffer.append(attempt)
+            full = len(self._buffer) >= self.flush_size
+            if self._thread is None:
+                # started on first use, so forking servers get one thread per worker
+                self._thread = threading.Thread(target=self._run, name='attempt-log', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if full:
+            self._wake.set()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        # writes everything buffered so far, returns the number of attempts written
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                with self.app.app_context():
+                    self.app.manager.insert_attempts(batch)
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception("Writing %d learning attempts failed, they are lost", len(batch))
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
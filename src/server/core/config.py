@@ -0,0 +1,110 @@
+import os
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///app.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    SWAGGER = {
+        'title': 'N-LanguagesAI API',
+        'uiversion': 3,
+        'description': 'API for multilingual language learning application'
+    }
+
+    # read-only DataManager methods use this database, writes always go to the primary.
+    # None keeps everything on SQLALCHEMY_DATABASE_URI.
+    DB_READ_URI = None
+    DB_READ_ROUTING = True
+    # DB_READ_URI is a sqlite snapshot of the primary instead of a replica kept in sync
+    # elsewhere; it is refreshed every DB_READ_SNAPSHOT_INTERVAL seconds (0 = only via
+    # `flask refresh-read-snapshot`)
+    DB_READ_SNAPSHOT = False
+    DB_READ_SNAPSHOT_INTERVAL = 0
+
+    # sqlite URIs of the user shards. Empty keeps all per-user tables on the primary;
+    # changing the list later needs `flask rebalance-shards`.
+    DB_SHARD_URIS = []
+
+    # model API, see core.ai_client. Without a key the app uses placeholder translations.
+    AI_API_KEY = os.environ.get('CLAUDE_API_KEY')
+    AI_BASE_URL = os.environ.get('AI_BASE_URL', 'https://api.anthropic.com')
+    AI_MODEL = os.environ.get('AI_MODEL', 'claude-3-5-haiku-latest')
+    AI_POOL_SIZE = 8
+    # provider quota, the client never sends faster than this
+    AI_REQUESTS_PER_MINUTE = 50
+    AI_INPUT_TOKENS_PER_MINUTE = 40000
+    AI_MAX_RETRIES = 3
+    AI_TIMEOUT = 60
+    # open connections of the async client, see core.async_runner
+    AI_ASYNC_MAX_CONNECTIONS = 64
+    # estimated input + output tokens per batched translation request, see api.prompts
+    AI_TRANSLATION_TOKEN_BUDGET = 6000
+    AI_MAX_OUTPUT_TOKENS = 8192
+
+    # answers scoring at least this many percent count as a successful review
+    LEARN_SUCCESS_SCORE = 80
+    # learning attempt log, see core.attempt_log. Attempts are written in batches every
+    # FLUSH_INTERVAL seconds or FLUSH_SIZE attempts; `flask rollup-attempts` folds them
+    # into daily rollups and prunes raw attempts older than RETENTION_DAYS.
+    ATTEMPT_LOG_FLUSH_INTERVAL = 2.0
+    ATTEMPT_LOG_FLUSH_SIZE = 200
+    ATTEMPT_LOG_MAX_BUFFER = 10000
+    ATTEMPT_LOG_RETENTION_DAYS = 90
+    # user profile and language cache, see core.user_cache. The stamp file is shared by
+    # all workers on this host, by default one per database in the temp directory.
+    USER_CACHE_PATH = None
+    USER_CACHE_SLOTS = 65536
+    USER_CACHE_MAX_ENTRIES = 10000
+
+    # cards per review session bundle, see api.routes.get_review_session
+    LEARN_SESSION_BUNDLE_SIZE = 10
+    LEARN_SESSION_BUNDLE_MAX = 50
+    # `flask build-review-queues` precomputes the day's review queue of every user with
+    # an attempt in the last ACTIVE_DAYS, BATCH_SIZE users per transaction
+    REVIEW_QUEUE_ACTIVE_DAYS = 14
+    REVIEW_QUEUE_BATCH_SIZE = 200
+    # `flask tier-progress-groups` moves groups not due within COLD_AFTER_DAYS out of the table
+    # the due scans walk and back once they are due within WARM_AHEAD_DAYS; the gap between
+    # the two is how long the command may go without running
+    PROGRESS_COLD_AFTER_DAYS = 60
+    PROGRESS_WARM_AHEAD_DAYS = 30
+    PROGRESS_TIER_BATCH_SIZE = 1000
+
+    # Idempotency-Key of POST /api/sentences: responses are kept for TTL seconds, a retry waits
+    # up to WAIT seconds for the first request, which is taken as dead after STALE_AFTER seconds
+    IDEMPOTENCY_TTL = 24 * 3600
+    IDEMPOTENCY_WAIT = 30
+    IDEMPOTENCY_STALE_AFTER = 300
+
+    # threads through which background coroutines reach the database
+    ASYNC_DB_WORKERS = 2
+    # background jobs per process before Prefer: respond-async requests get 503, 0 = no limit
+    ASYNC_MAX_PENDING = 500
+
+    # admission control, see core.admission. Per endpoint and user: rate in requests per
+    # second (sentences or answers per second for batch requests) and burst. ADMISSION_MAX_CONCURRENT
+    # caps the requests in flight on all these endpoints together per process, 0 = no cap.
+    # create_app(config) merges its ADMISSION_LIMITS into these per endpoint, None removes one.
+    ADMISSION_LIMITS = {
+        'api.add_sentence': {'rate': 0.5, 'burst': 20},
+        'api.add_sentences_bulk': {'rate': 2, 'burst': 500},
+        'api.submit_attempt': {'rate': 2, 'burst': 30},
+        'api.answer_review_session': {'rate': 2, 'burst': 50},
+        'api.import_user': {'rate': 0.01, 'burst': 3},
+        'api.export_user': {'rate': 0.01, 'burst': 3},
+    }
+    ADMISSION_MAX_CONCURRENT = 16
+
+    # sampled tracing, see core.tracing. Share of requests traced, 0 = off. Spans go to
+    # TRACE_PATH ({pid} is replaced, default trace-{pid}.json in the temp directory).
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.0))
+    TRACE_PATH = os.environ.get('TRACE_PATH')
+    TRACE_MAX_SPANS = 5000
+
+    # /debug endpoints, disabled unless DEBUG_TOKEN is set (Authorization: Bearer <token>)
+    DEBUG_TOKEN = os.environ.get('DEBUG_TOKEN')
+    # /debug/profile samples every PROFILE_INTERVAL seconds, less often if sampling would
+    # take more than PROFILE_MAX_OVERHEAD of the wall time, for at most PROFILE_MAX_SECONDS
+    PROFILE_INTERVAL = 0.01
+    PROFILE_MAX_OVERHEAD = 0.05
+    PROFILE_MAX_SECONDS = 60
@@ -0,0 +1,90 @@
+"""
+Serialization of deck dumps produced by DataManager.iter_user_export.
+
+A dump is a stream of (kind, record) pairs. It is written either as NDJSON,
+one {"type": kind, "data": record} object per line, or as a ZIP archive
+holding a SQLite file with one table per record kind.
+"""
+import json
+import os
+import sqlite3
+import zipfile
+
+# rows per executemany while building the SQLite dump
+SQLITE_CHUNK = 500
+SQLITE_MEMBER = 'deck.sqlite'
+
+
+def ndjson_lines(records):
+    for kind, data in records:
+        yield json.dumps({'type': kind, 'data': data}, ensure_ascii=False) + '\n'
+
+
+def iter_ndjson_records(stream):
+    # stream yields bytes lines, e.g. request.stream
+    for number, line in enumerate(iter(stream.readline, b''), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            yield item['type'], item['data']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"Invalid NDJSON record on line {number}")
+
+
+def write_sqlite_zip(records, columns, workdir):
+    # columns: kind -> column names, tables are created in that order
+    db_path = os.path.join(workdir, SQLITE_MEMBER)
+    conn = sqlite3.connect(db_path)
+    try:
+        for kind, names in columns.items():
+            conn.execute(f'CREATE TABLE "{kind}" ({", ".join(names)})')
+        chunk, chunk_kind = [], None
+        for kind, data in records:
+            if chunk and (kind != chunk_kind or len(chunk) >= SQLITE_CHUNK):
+                _insert_rows(conn, chunk_kind, columns[chunk_kind], chunk)
+                chunk = []
+            chunk_kind = kind
+            chunk.append(tuple(data[name] for name in columns[kind]))
+        if chunk:
+            _insert_rows(conn, chunk_kind, columns[chunk_kind], chunk)
+        conn.commit()
+    finally:
+        conn.close()
+
+    zip_path = os.path.join(workdir, 'deck.zip')
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(db_path, SQLITE_MEMBER)
+    os.remove(db_path)
+    return zip_path
+
+
+def iter_sqlite_zip_records(zip_path, columns, workdir):
+    with zipfile.ZipFile(zip_path) as archive:
+        if SQLITE_MEMBER not in archive.namelist():
+            raise ValueError(f"Archive does not contain {SQLITE_MEMBER}")
+        db_path = archive.extract(SQLITE_MEMBER, workdir)
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for kind, names in columns.items():
+            if kind not in tables:
+                continue
+            # archives of older versions may lack columns added since, they read as missing
+            present = {row[1] for row in conn.execute(f'PRAGMA table_info("{kind}")')}
+            names = [name for name in names if name in present]
+            cursor = conn.execute(f'SELECT {", ".join(names)} FROM "{kind}" ORDER BY rowid')
+            while True:
+                rows = cursor.fetchmany(SQLITE_CHUNK)
+                if not rows:
+                    break
+                for row in rows:
+                    yield kind, dict(zip(names, row))
+    finally:
+        conn.close()
+
+
+def _insert_rows(conn, kind, names, rows):
+    placeholders = ', '.join('?' for _ in names)
+    conn.executemany(f'INSERT INTO "{kind}" VALUES ({placeholders})', rows)
@@ -0,0 +1,74 @@
+"""
+In-memory copy of the languages table.
+
+Rows store a language as the small integer key of its code (see
+models.column_types.LanguageCode); the registry translates between the two
+without SQL. Codes are interned, so the many rows loaded with the same
+language share one string.
+
+A code has to be registered before the first row using it is written.
+register() adds missing codes on a connection of its own and commits at once,
+which keeps the keys the same for every shard and worker, and is called by
+DataManager where new codes come in: a user's native language, an added target
+language and imported records. Keys another worker added are picked up on the
+first lookup that misses.
+
+Keys belong to one database, so every app has a registry of its own
+(app.languages) and the column type looks it up through current_app: rows with
+language codes can only be written or read inside an app context.
+"""
+import sys
+import threading
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.server.extensions import db
+from src.server.models.data_models import Languages
+
+CODE_MAX_LENGTH = 5
+
+
+class LanguageRegistry:
+    def __init__(self):
+        self._ids = {}
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def id_for(self, code, default=None):
+        # default is returned for a code that is not registered, without it that raises ValueError
+        key = self._ids.get(code)
+        if key is None:
+            self.reload()
+            key = self._ids.get(code)
+            if key is None:
+                if default is not None:
+                    return default
+                raise ValueError(f"Unknown language code '{code}'")
+        return key
+
+    def code_for(self, key):
+        code = self._codes.get(key)
+        if code is None:
+            self.reload()
+            code = self._codes[key]
+        return code
+
+    def register(self, codes):
+        missing = [code for code in set(codes) if code not in self._ids]
+        if not missing:
+            return
+        for code in missing:
+            if not isinstance(code, str) or not 0 < len(code) <= CODE_MAX_LENGTH:
+                raise ValueError(f"Invalid language code '{code}'")
+        with db.engines[None].begin() as conn:
+            conn.execute(sqlite_insert(Languages).on_conflict_do_nothing(index_elements=['code']),
+                         [{'code': code} for code in missing])
+        self.reload()
+
+    def reload(self):
+        with db.engines[None].connect() as conn:
+            rows = conn.execute(select(Languages.id, Languages.code)).all()
+        with self._lock:
+            # new dicts are swapped in whole, lookups need no lock
+            codes = {key: sys.intern(code) for key, code in rows}
+            self._codes = codes
+            self._ids = {code: key for key, code in codes.items()}
@@ -0,0 +1,110 @@
+"""
+Statistical sampling profiler for a running worker.
+
+profile() looks at the stack of every other thread of the process at a fixed
+interval for the given number of seconds and counts how often each stack was
+seen. Nothing is hooked into the interpreter, the profiled code runs
+unchanged and only pays for the samples, during which the sampling thread
+holds the GIL. Each sample is timed, and the interval is stretched while
+sampling would take more than max_overhead of the wall time, so a process
+with many deep stacks is sampled less often rather than slowed down.
+
+Only one profile runs per process at a time, a second caller gets
+ProfilerBusy at once. The result is in collapsed stack format, one
+"thread;outer;...;inner count" line per stack, which flamegraph.pl,
+speedscope and inferno read.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# frames are labelled relative to these, longest first
+_PATH_ROOTS = sorted({os.getcwd() + os.sep} | {p + os.sep for p in sys.path if p and os.path.isdir(p)},
+                     key=len, reverse=True)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01, max_seconds=60, max_overhead=0.05, max_stacks=20000):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        # share of wall time the sampling may take
+        self.max_overhead = max_overhead
+        # distinct stacks kept, further ones are counted as one truncated stack
+        self.max_stacks = max_stacks
+        self._running = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            interval=app.config['PROFILE_INTERVAL'],
+            max_seconds=app.config['PROFILE_MAX_SECONDS'],
+            max_overhead=app.config['PROFILE_MAX_OVERHEAD'],
+        )
+
+    def profile(self, seconds):
+        # -> (Counter of collapsed stack -> samples, number of sampling rounds)
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            return self._sample(min(seconds, self.max_seconds))
+        finally:
+            self._running.release()
+
+    def _sample(self, seconds):
+        stacks = Counter()
+        rounds = 0
+        own = threading.get_ident()
+        labels = {}
+        deadline = time.monotonic() + seconds
+        while True:
+            started = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = _collapse(frame, names.get(ident, f'thread-{ident}'), labels)
+                if stack in stacks or len(stacks) < self.max_stacks:
+                    stacks[stack] += 1
+                else:
+                    stacks['[truncated]'] += 1
+            # the frames are not kept alive past the round
+            frames = frame = None
+            rounds += 1
+            cost = time.perf_counter() - started
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return stacks, rounds
+            time.sleep(min(remaining, max(self.interval, cost / self.max_overhead - cost)))
+
+
+def collapsed_lines(stacks):
+    # most frequent stacks first
+    for stack, count in stacks.most_common():
+        yield f"{stack} {count}\n"
+
+
+def _collapse(frame, thread_name, labels):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            label = labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        frames.append(label)
+        frame = frame.f_back
+    frames.append(thread_name.replace(';', ':'))
+    return ';'.join(reversed(frames))
+
+
+def _short_path(filename):
+    for root in _PATH_ROOTS:
+        if filename.startswith(root):
+            return filename[len(root):]
+    return filename
@@ -0,0 +1,47 @@
+"""
+Snapshot files used as read database when DB_READ_SNAPSHOT is enabled.
+"""
+import os
+import sqlite3
+import threading
+from src.server.extensions import db
+
+
+def refresh_snapshot(primary_engine, read_engine):
+    # copy the primary with the sqlite online backup API, then swap the file in
+    # atomically so readers never see a half written snapshot
+    source_path = primary_engine.url.database
+    target_path = read_engine.url.database
+    tmp_path = target_path + '.tmp'
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, target_path)
+    # pooled connections would keep reading the replaced file
+    read_engine.dispose()
+
+
+class SnapshotRefresher:
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='read-snapshot', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    refresh_snapshot(db.engines[None], db.engines['read'])
+                except Exception as e:
+                    self.app.logger.warning("Refreshing read snapshot failed: %s", e)
@@ -0,0 +1,14 @@
+"""
+Review interval logic shared by DataManager and the offline simulator
+(tools/schedule_sim.py), which keeps a vectorized copy of it and checks the
+two against each other before every run.
+"""
+
+
+def next_interval(review_count, is_success):
+    # simple anki logic: days until the next review, review_count includes this review
+    if is_success:
+        # make the learningintervall bigger
+        return max(1, review_count * 2)
+    # make the learningintervall smaller
+    return 1
@@ -0,0 +1,12 @@
+import difflib
+import unicodedata
+
+
+def answer_score(answer, expected):
+    # similarity of the learner's answer to the stored translation in percent. Case
+    # and surrounding whitespace are ignored, missing diacritics cost points.
+    answer = ' '.join(unicodedata.normalize('NFC', answer).casefold().split())
+    expected = ' '.join(unicodedata.normalize('NFC', expected).casefold().split())
+    if not expected:
+        return 0.0
+    return round(difflib.SequenceMatcher(None, answer, expected).ratio() * 100, 1)
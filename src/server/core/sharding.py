@@ -0,0 +1,64 @@
+"""
+User sharding across the sqlite files in DB_SHARD_URIS.
+
+The users table stays on the primary database and records each user's shard.
+All per-user tables live in the shards. Shard k hands out ids from
+k * SHARD_ID_SPAN upwards, so the shard of any sentence, group or translation
+follows from its id alone.
+"""
+from sqlalchemy import text
+
+SHARD_ID_SPAN = 10 ** 12
+SHARDED_TABLES = (
+    'user_languages', 'sentences', 'progress_groups',
+    'translations', 'import_jobs', 'learning_attempts',
+    'attempt_rollups', 'review_queues', 'deck_subscriptions',
+)
+
+
+def shard_bind_key(index):
+    return f'shard_{index}'
+
+
+def shard_binds(uris):
+    return {shard_bind_key(index): uri for index, uri in enumerate(uris)}
+
+
+def shard_for_id(row_id):
+    return int(row_id) // SHARD_ID_SPAN
+
+
+def init_shard(engine, metadata, index):
+    metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in SHARDED_TABLES:
+            conn.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+            ), {'name': table, 'seq': index * SHARD_ID_SPAN})
+
+
+def plan_rebalance(loads, tolerance=0.1):
+    # loads: shard -> {user_id: row count}. Greedily moves users from the fullest
+    # to the emptiest shard until all shards are within tolerance of the mean.
+    loads = {shard: dict(users) for shard, users in loads.items()}
+    totals = {shard: sum(users.values()) for shard, users in loads.items()}
+    mean = sum(totals.values()) / max(len(totals), 1)
+    moves = []
+    while True:
+        source = max(totals, key=totals.get)
+        target = min(totals, key=totals.get)
+        gap = totals[source] - totals[target]
+        if source == target or gap <= mean * tolerance * 2:
+            return moves
+        # the user that brings both shards closest to each other
+        candidates = [(abs(gap - 2 * size), user_id, size)
+                      for user_id, size in loads[source].items() if 0 < size < gap]
+        if not candidates:
+            return moves
+        _, user_id, size = min(candidates)
+        moves.append((user_id, source, target))
+        del loads[source][user_id]
+        loads[target][user_id] = size
+        totals[source] -= size
+        totals[target] += size
@@ -0,0 +1,163 @@
+"""
+Sampled request tracing to a local Chrome trace file.
+
+With TRACE_SAMPLE_RATE above 0, that share of requests is traced: one span
+for the route, one per DataManager method, one per SQL statement and one per
+outbound model call (opening the request, retries and throttling included,
+and the whole answer). Spans of a request are kept in memory and appended to
+TRACE_PATH when it ends, as Chrome trace events ("ph": "X"). Perfetto,
+chrome://tracing and speedscope load the file as it is; the closing bracket
+of the JSON array is optional in that format, so the file is only appended
+to. Requests that are not sampled cost one context variable lookup per span.
+
+Model calls of background jobs (Prefer: respond-async) run outside any
+request and are not traced.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+
+# the spans of the request being traced in this context, None if it is not sampled
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+class Tracer:
+    def __init__(self, path, sample_rate=0.0, max_spans=5000):
+        self.path = path
+        self.sample_rate = sample_rate
+        # spans kept per request, a bulk import issues thousands of statements
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app):
+        # {pid} gives each worker its own file, appends of different processes would interleave
+        path = app.config['TRACE_PATH'] or os.path.join(tempfile.gettempdir(), 'trace-{pid}.json')
+        return cls(path, sample_rate=app.config['TRACE_SAMPLE_RATE'],
+                   max_spans=app.config['TRACE_MAX_SPANS'])
+
+    def init_app(self, app, engines):
+        # nothing is hooked in while tracing is off
+        if self.sample_rate <= 0:
+            return
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self.trace_methods(app.manager, 'data', prefix='DataManager.')
+        if app.ai_client is not None:
+            self.trace_methods(app.ai_client, 'model', ('create_message', 'stream_complete', '_open'),
+                               prefix='AIClient.')
+
+    def trace_methods(self, obj, category, names=None, prefix=''):
+        # wraps the public methods of obj (or the given ones) in spans
+        for name, method in inspect.getmembers(obj, inspect.ismethod):
+            if (names is None and not name.startswith('_')) or (names is not None and name in names):
+                setattr(obj, name, self._traced(prefix + name, category, method))
+
+    def _traced(self, name, category, method):
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def traced_generator(*args, **kwargs):
+                if _trace.get() is None:
+                    return method(*args, **kwargs)
+                return self._span_generator(name, category, method(*args, **kwargs))
+            return traced_generator
+
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            if _trace.get() is None:
+                return method(*args, **kwargs)
+            with self.span(name, category):
+                return method(*args, **kwargs)
+        return traced
+
+    def _span_generator(self, name, category, generator):
+        # one span from the first to the last item, the caller's work in between included
+        with self.span(name, category):
+            yield from generator
+
+    @contextmanager
+    def span(self, name, category, **args):
+        trace = _trace.get()
+        if trace is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(trace, name, category, start, args)
+
+    def _record(self, trace, name, category, start, args):
+        if len(trace['events']) >= self.max_spans:
+            trace['dropped'] += 1
+            return
+        trace['events'].append(_event(name, category, start, args))
+
+    def before_request(self):
+        if random.random() >= self.sample_rate:
+            return
+        g._trace_token = _trace.set({'events': [], 'dropped': 0})
+        g._trace_start = time.perf_counter()
+
+    def after_request(self, response):
+        if '_trace_start' in g:
+            g._trace_status = response.status_code
+        return response
+
+    def teardown_request(self, exc=None):
+        token = g.pop('_trace_token', None)
+        if token is None:
+            return
+        trace = _trace.get()
+        args = {'method': request.method, 'path': request.path, 'status': g.pop('_trace_status', None)}
+        if exc is not None:
+            args['error'] = repr(exc)
+        if trace['dropped']:
+            args['dropped_spans'] = trace['dropped']
+        # the route span is kept past max_spans, the others hang off it
+        trace['events'].append(_event(request.endpoint or request.path, 'route', g.pop('_trace_start'), args))
+        _trace.reset(token)
+        self._write(trace['events'])
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _trace.get() is not None:
+            context._trace_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        trace = _trace.get()
+        start = getattr(context, '_trace_start', None)
+        if trace is not None and start is not None:
+            self._record(trace, statement.split(None, 1)[0].upper(), 'sql', start,
+                         {'statement': ' '.join(statement.split())[:300], 'many': executemany})
+
+    def _write(self, events):
+        path = self.path.format(pid=os.getpid())
+        lines = ''.join(json.dumps(e, separators=(',', ':')) + ',\n' for e in events)
+        with self._lock:
+            with open(path, 'a') as f:
+                if f.tell() == 0:
+                    f.write('[\n')
+                f.write(lines)
+
+
+def _event(name, category, start, args):
+    return {
+        'name': name, 'cat': category, 'ph': 'X',
+        # microseconds on the process' monotonic clock, only differences matter
+        'ts': round(start * 1e6), 'dur': round((time.perf_counter() - start) * 1e6),
+        'pid': os.getpid(), 'tid': threading.get_ident(),
+        'args': args,
+    }
@@ -0,0 +1,90 @@
+"""
+Read-through cache for user profiles and target language lists.
+
+Every worker process keeps its own copies, but whether a copy is current is
+decided by version stamps in a small file that all workers map into memory.
+DataManager bumps a user's stamp after each commit that changes their profile
+or languages, and copies taken under an older stamp are loaded again. A hit
+costs one read from the shared mapping and no SQL.
+
+Stamps are kept in a fixed number of slots, users sharing a slot invalidate
+each other now and then, which only costs a reload.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # no cross-process locking, fine for a single process
+    fcntl = None
+
+# read-only copies handed out instead of ORM rows
+CachedUser = namedtuple('CachedUser', 'id username native_language created_at shard')
+CachedLanguage = namedtuple('CachedLanguage', 'id user_id language_code created_at')
+
+
+class UserCache:
+    def __init__(self, path, slots=65536, max_entries=10000):
+        self.path = path
+        self.slots = slots
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fd = None
+        self._versions = None
+
+    @classmethod
+    def from_config(cls, app):
+        path = app.config['USER_CACHE_PATH']
+        if not path:
+            # one stamp file per database, shared by every worker using it
+            uri = app.config['SQLALCHEMY_DATABASE_URI'].encode()
+            path = os.path.join(tempfile.gettempdir(), f'user-cache-{hashlib.sha1(uri).hexdigest()[:12]}')
+        return cls(path, slots=app.config['USER_CACHE_SLOTS'], max_entries=app.config['USER_CACHE_MAX_ENTRIES'])
+
+    def _open(self):
+        with self._lock:
+            if self._versions is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                size = self.slots * 8
+                if os.fstat(self._fd).st_size < size:
+                    # other workers may be sizing it at the same time, that only grows it
+                    os.ftruncate(self._fd, size)
+                self._versions = memoryview(mmap.mmap(self._fd, size)).cast('Q')
+            return self._versions
+
+    def get(self, kind, user_id, load):
+        # cached value of kind for user_id, load() on a miss; None results are not kept
+        key = (kind, user_id)
+        # the stamp is read before loading, a write committed meanwhile bumps it again
+        version = self._open()[user_id % self.slots]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = load()
+        if value is not None:
+            with self._lock:
+                self._entries[key] = (version, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, user_id):
+        # call after the change is committed
+        versions = self._open()
+        slot = user_id % self.slots
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 8, slot * 8)
+        try:
+            versions[slot] = (versions[slot] + 1) % 2 ** 64
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 8, slot * 8)
@@ -1,132 +1,418 @@
-from sqlalchemy import and_, func
+import hashlib
+import json
+import time
+import unicodedata
+from sqlalchemy import and_, or_, bindparam, case, delete, func, insert, select, tuple_, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, object_session
+from flask import current_app, g, has_app_context
+from datetime import date, datetime, timedelta
 from src.server.extensions import db
+from src.server.core.scheduling import next_interval
+from src.server.core.sharding import shard_bind_key, shard_for_id
+from src.server.core.user_cache import CachedLanguage, CachedUser, UserCache
+from src.server.models.column_types import EpochDay, LanguageCode
 from src.server.models.data_models import (
     User, User_Languages, Sentences,
-    Translations, Learning_Progress, Progress_Groups
+    Translations, Progress_Groups, Cold_Progress_Groups,
+    Import_Jobs, Import_Id_Map, Learning_Attempts, Attempt_Rollups, Background_Jobs,
+    Review_Queues, Idempotency_Keys, Decks, Deck_Cards, Deck_Translations, Deck_Subscriptions
 )
 
 
+# what create_sentence(s) does when a sentence is already stored for the user
+DUPLICATE_POLICIES = ('reject', 'return', 'merge')
+CATEGORY_SEPARATOR = ','
+# sqlite allows a limited number of bound variables per statement
+HASH_LOOKUP_CHUNK = 500
+
+# deck export record kind -> (model, exported columns), in dependency order
+EXPORT_COLUMNS = {
+    'user': (User, ('id', 'username', 'native_language', 'created_at')),
+    'language': (User_Languages, ('id', 'language_code', 'created_at')),
+    # decks stay on the primary, a dump only records which ones the user follows
+    'subscription': (Deck_Subscriptions, ('id', 'deck_id', 'next_card_id', 'created_at')),
+    'sentence': (Sentences, ('id', 'original_text', 'language_code', 'category', 'created_at')),
+    'progress_group': (Progress_Groups, ('id', 'sentence_id', 'group_score', 'next_review',
+                                         'last_reviewed', 'review_count', 'success_count', 'created_at',
+                                         'card_id')),
+    'translation': (Translations, ('id', 'sentence_id', 'group_id', 'translated_text',
+                                   'target_language_code', 'created_at')),
+    'attempt': (Learning_Attempts, ('id', 'group_id', 'translation_id', 'language_code', 'score',
+                                    'is_success', 'attempted_at', 'rolled_up')),
+    'attempt_rollup': (Attempt_Rollups, ('id', 'day', 'language_code', 'attempts', 'successes', 'score_sum')),
+}
+# record kinds of older dumps that are accepted and skipped; learning_progress
+# duplicated the state that progress_group records carry
+LEGACY_EXPORT_KINDS = ('learning_progress',)
+# rows fetched per round trip while exporting, rows per executemany while importing
+EXPORT_CHUNK = 500
+IMPORT_CHUNK = 500
+# largest page of the admin user listing, exact user counts stop here
+USER_PAGE_MAX = 1000
+USER_COUNT_CAP = 10000
+# most due groups handed out at once
+DUE_LIMIT_MAX = 1000
+# most cards of subscribed decks given progress groups at once
+DECK_INTRODUCE_MAX = 100
+# values of a logged learning attempt, see core.attempt_log
+ATTEMPT_COLUMNS = ('user_id', 'group_id', 'translation_id', 'language_code', 'score', 'is_success', 'attempted_at')
+
+
+class DuplicateSentenceError(ValueError):
+    def __init__(self, duplicates, repeats=None):
+        super().__init__("Sentence already exists")
+        # position in the batch -> stored sentence it collides with
+        self.duplicates = duplicates
+        # position in the batch -> earlier position with the same sentence, nothing stored yet
+        self.repeats = repeats or {}
+
+
+def sentence_hash(text):
+    # case, unicode form and whitespace differences do not make a new sentence
+    normalized = ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def split_categories(category):
+    if not category:
+        return []
+    return [part for part in category.split(CATEGORY_SEPARATOR) if part]
+
+
+def merge_categories(current, new):
+    merged = split_categories(current)
+    for part in split_categories(new):
+        if part not in merged:
+            merged.append(part)
+    category = CATEGORY_SEPARATOR.join(merged) or None
+    if category and len(category) > 50:
+        raise ValueError("Merged categories exceed 50 characters")
+    return category
+
+
 class DataManager:
     def __init__(self):
         self.db = db
+        self.user_cache = None
+
+    def init_app(self, app):
+        app.teardown_appcontext(self._close_sessions)
+        self.user_cache = UserCache.from_config(app)
 
-    def _commit(self):
+    def _commit(self, session=None):
+        session = session or self.db.session
         try:
-            self.db.session.commit()
+            session.commit()
         except SQLAlchemyError as e:
-            self.db.session.rollback()
+            session.rollback()
             raise e
+        if has_app_context():
+            # from now on this request reads its own writes from the primary
+            g.db_wrote = True
+
+    def _reader(self):
+        # session for read-only methods: the 'read' bind if configured, else the primary.
+        # mutating methods always use self.db.session, also for the reads they depend on.
+        if (not has_app_context() or g.get('db_wrote')
+                or not current_app.config.get('DB_READ_ROUTING')
+                or 'read' not in self.db.engines):
+            return self.db.session
+        if '_read_session' not in g:
+            g._read_session = Session(bind=self.db.engines['read'])
+        return g._read_session
+
+    def _close_sessions(self, exc=None):
+        session = g.pop('_read_session', None)
+        if session is not None:
+            session.close()
+        for session in g.pop('_shard_sessions', {}).values():
+            session.close()
+
+    # Sharding: with DB_SHARD_URIS the per-user tables live in one shard per user,
+    # the users table on the primary is the directory that says which one
+    def _shard_count(self):
+        if not has_app_context():
+            return 0
+        return len(current_app.config.get('DB_SHARD_URIS') or ())
+
+    def _shard_session(self, index):
+        sessions = g.setdefault('_shard_sessions', {})
+        if index not in sessions:
+            sessions[index] = Session(bind=self.db.engines[shard_bind_key(index)])
+        return sessions[index]
+
+    def _shard_of_user(self, user_id):
+        user_id = int(user_id)
+        shards = g.setdefault('_user_shards', {})
+        if user_id not in shards:
+            user = self.get_user_by_id(user_id)
+            # unknown users read from their default shard and simply find nothing
+            shards[user_id] = user.shard if user and user.shard is not None else user_id % self._shard_count()
+        return shards[user_id]
+
+    def _user_session(self, user_id, write=False):
+        # session holding the per-user rows of user_id
+        if not self._shard_count():
+            return self.db.session if write else self._reader()
+        return self._shard_session(self._shard_of_user(user_id))
+
+    def _row_session(self, row_id, write=False):
+        # session holding a per-user row, its shard is encoded in the id
+        count = self._shard_count()
+        if not count:
+            return self.db.session if write else self._reader()
+        index = shard_for_id(row_id)
+        return self._shard_session(index if index < count else 0)
 
     # User Management
     def create_user(self, username, native_language):
         if User.query.filter_by(username=username).first():
             raise ValueError("Username already exists")
+        # the user's sentences are stored in their native language
+        current_app.languages.register([native_language])
         user = User(username=username, native_language=native_language, created_at=datetime.utcnow())
         self.db.session.add(user)
+        if self._shard_count():
+            self.db.session.flush()
+            user.shard = user.id % self._shard_count()
         self._commit()
+        # ids of deleted users can come back in sqlite
+        self._user_changed(user.id)
         return user
 
     def get_user_by_id(self, user_id):
-        return User.query.get(user_id)
+        # a read-only CachedUser, see core.user_cache; loaded from the primary so a
+        # lagging read snapshot cannot end up in the cache
+        def load():
+            user = self.db.session.get(User, user_id)
+            if user is None:
+                return None
+            return CachedUser(user.id, user.username, user.native_language, user.created_at, user.shard)
+        return self._cached('user', user_id, load)
 
     def get_user_by_username(self, username):
-        return User.query.filter_by(username=username).first()
+        return self._reader().query(User).filter_by(username=username).first()
 
-    # get all users for test reasons
-    def get_users(self):
-        users = User.query.all()
+    # Admin user listing, keyset paginated in username order so the unique index
+    # on username serves ordering, prefix filter and page start alike
+    def get_users_page(self, limit=100, after=None, prefix=None):
+        # users with a username after `after` (the last one of the previous page)
+        stmt = select(User.id, User.username, User.native_language, User.created_at)
+        if prefix:
+            stmt = stmt.where(*_prefix_range(User.username, prefix))
+        if after is not None:
+            stmt = stmt.where(User.username > after)
+        rows = self._reader().execute(stmt.order_by(User.username).limit(limit))
         return [{
             'id': user.id,
             'username': user.username,
             'native_language': user.native_language,
             'created_at': user.created_at.isoformat() if user.created_at else None
-        } for user in users]
+        } for user in rows]
+
+    def iter_users(self, prefix=None):
+        # every matching user, one page at a time so memory does not grow with the user base
+        after = None
+        while True:
+            page = self.get_users_page(USER_PAGE_MAX, after, prefix)
+            yield from page
+            if len(page) < USER_PAGE_MAX:
+                return
+            after = page[-1]['username']
+
+    def estimate_user_count(self, prefix=None):
+        # (count, exact). Without a prefix the highest id, a single index lookup that
+        # ignores deleted users; with one, counted on the username index up to USER_COUNT_CAP
+        session = self._reader()
+        if not prefix:
+            return session.execute(select(func.max(User.id))).scalar() or 0, False
+        matches = select(User.id).where(*_prefix_range(User.username, prefix)).limit(USER_COUNT_CAP + 1)
+        count = session.execute(select(func.count()).select_from(matches.subquery())).scalar()
+        return min(count, USER_COUNT_CAP), count <= USER_COUNT_CAP
 
     def add_target_language(self, user_id, language_code):
         if not self.get_user_by_id(user_id):
             raise ValueError("User not found")
-        if User_Languages.query.filter_by(user_id=user_id, language_code=language_code).first():
+        # before the write session, registering commits on a connection of its own
+        current_app.languages.register([language_code])
+        session = self._user_session(user_id, write=True)
+        if session.query(User_Languages).filter_by(user_id=user_id, language_code=language_code).first():
             raise ValueError("Language already added")
         lang = User_Languages(user_id=user_id, language_code=language_code, created_at=datetime.utcnow())
-        self.db.session.add(lang)
-        self._commit()
+        session.add(lang)
+        self._commit(session)
+        self._user_changed(user_id)
         return lang
 
     def get_user_languages(self, user_id):
-        return User_Languages.query.filter_by(user_id=user_id).all()
+        # read-only CachedLanguage tuples, loaded from the primary like get_user_by_id
+        def load():
+            return tuple(CachedLanguage(lang.id, lang.user_id, lang.language_code, lang.created_at)
+                         for lang in self._user_session(user_id, write=True)
+                         .execute(_USER_LANGUAGES, {'user_id': user_id}).scalars())
+        return list(self._cached('languages', user_id, load))
+
+    def _cached(self, kind, user_id, load):
+        if self.user_cache is None:
+            return load()
+        return self.user_cache.get(kind, int(user_id), load)
+
+    def _user_changed(self, user_id):
+        # after committing a change to a user's profile or languages
+        if self.user_cache is not None:
+            self.user_cache.invalidate(int(user_id))
 
     # Sentences Management
 
     def get_user_categories(self, user_id):
         # returns all identified categories of a user
-        categories = Sentences.query.filter_by(user_id=user_id).with_entities(Sentences.category).distinct().all()
-        return [category[0] for category in categories if category[0]]
+        categories = self._user_session(user_id).query(Sentences).filter_by(user_id=user_id).with_entities(Sentences.category).distinct().all()
+        result = []
+        for category in categories:
+            for part in split_categories(category[0]):
+                if part not in result:
+                    result.append(part)
+        return result
 
-    def create_sentence(self, user_id, original_text, category=None):
+    def create_sentence(self, user_id, original_text, category=None, on_duplicate='reject'):
+        # returns (sentence, created); created is False when an existing sentence was reused
+        return self.create_sentences(user_id, [(original_text, category)], on_duplicate)[0]
+
+    def create_sentences(self, user_id, items, on_duplicate='reject'):
+        # items: iterable of (original_text, category), stored in one transaction
+        if on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError("on_duplicate must be one of: " + ", ".join(DUPLICATE_POLICIES))
         user = self.get_user_by_id(user_id)
         if not user:
             raise ValueError("User not found")
-        sentence = Sentences(
-            user_id=user_id,
-            original_text=original_text,
-            language_code=user.native_language,
-            category=category,
-            created_at=datetime.utcnow()
-        )
-        self.db.session.add(sentence)
-        self._commit()
-        return sentence
+        items = [(text, category, sentence_hash(text)) for text, category in items]
+        try:
+            return self._insert_sentences(user, items, on_duplicate)
+        except IntegrityError:
+            # a concurrent request stored one of the sentences first, the retry sees it
+            return self._insert_sentences(user, items, on_duplicate)
+
+    def _insert_sentences(self, user, items, on_duplicate):
+        session = self._user_session(user.id, write=True)
+        hashes = list({content_hash for _, _, content_hash in items})
+        existing = {}
+        for i in range(0, len(hashes), HASH_LOOKUP_CHUNK):
+            chunk = hashes[i:i + HASH_LOOKUP_CHUNK]
+            for sentence in session.query(Sentences).filter(Sentences.user_id == user.id,
+                                                   Sentences.content_hash.in_(chunk)):
+                existing[sentence.content_hash] = sentence
+
+        results = []
+        duplicates, repeats, first = {}, {}, {}
+        try:
+            for position, (text, category, content_hash) in enumerate(items):
+                sentence = existing.get(content_hash)
+                if sentence is None:
+                    sentence = Sentences(
+                        user_id=user.id,
+                        original_text=text,
+                        language_code=user.native_language,
+                        category=category,
+                        content_hash=content_hash,
+                        created_at=datetime.utcnow()
+                    )
+                    session.add(sentence)
+                    # later duplicates inside the same batch resolve to this one
+                    existing[content_hash] = sentence
+                    first[content_hash] = position
+                    results.append((sentence, True))
+                    continue
+                if content_hash in first:
+                    repeats[position] = first[content_hash]
+                else:
+                    duplicates[position] = sentence
+                if on_duplicate == 'merge':
+                    sentence.category = merge_categories(sentence.category, category)
+                results.append((sentence, False))
+            if (duplicates or repeats) and on_duplicate == 'reject':
+                raise DuplicateSentenceError(duplicates, repeats)
+        except ValueError:
+            session.rollback()
+            raise
+        self._commit(session)
+        return results
 
     def get_sentences_for_user(self, user_id):
-        return Sentences.query.filter_by(user_id=user_id).all()
+        return self._user_session(user_id).query(Sentences).filter_by(user_id=user_id).all()
 
     def get_sentences_by_category(self, user_id, category):
-        return Sentences.query.filter_by(user_id=user_id, category=category).all()
+        # merged duplicates carry several categories, see merge_categories
+        sep = CATEGORY_SEPARATOR
+        return self._user_session(user_id).query(Sentences).filter(
+            Sentences.user_id == user_id,
+            or_(Sentences.category == category,
+                Sentences.category.like(category + sep + '%'),
+                Sentences.category.like('%' + sep + category),
+                Sentences.category.like('%' + sep + category + sep + '%'))
+        ).all()
 
     def delete_sentence(self, sentence_id):
-        sentence = Sentences.query.get(sentence_id)
+        session = self._row_session(sentence_id, write=True)
+        sentence = session.get(Sentences, sentence_id)
         if sentence:
+            # the user's attempts stay in the log without a card, like those of skipped imports
+            groups = union_all(*(select(model.id).where(model.sentence_id == sentence_id)
+                                 for model in (Progress_Groups, Cold_Progress_Groups)))
+            translations = select(Translations.id).where(Translations.sentence_id == sentence_id)
+            session.execute(update(Learning_Attempts).where(
+                Learning_Attempts.user_id == sentence.user_id,
+                or_(Learning_Attempts.group_id.in_(groups), Learning_Attempts.translation_id.in_(translations))
+            ).values(group_id=None, translation_id=None))
             # delete all dependent translations
-            Translations.query.filter_by(sentence_id=sentence_id).delete()
-            Progress_Groups.query.filter_by(sentence_id=sentence_id).delete()
-            self.db.session.delete(sentence)
-            self._commit()
+            session.query(Translations).filter_by(sentence_id=sentence_id).delete()
+            session.query(Progress_Groups).filter_by(sentence_id=sentence_id).delete()
+            session.query(Cold_Progress_Groups).filter_by(sentence_id=sentence_id).delete()
+            session.delete(sentence)
+            self._commit(session)
             return True
         return False
 
 
     def delete_user(self, user_id):
-        user = User.query.get(user_id)
+        user = self.db.session.get(User, user_id)
         if not user:
             return False
-        
-        # Lösche alle abhängigen Daten in der richtigen Reihenfolge
-        # Learning_Progress User
-        Learning_Progress.query.filter_by(user_id=user_id).delete()
-        
-        # User_Languages User
-        User_Languages.query.filter_by(user_id=user_id).delete()
-        
-        # all Sentences User
-        user_sentences = Sentences.query.filter_by(user_id=user_id).all()
-        
-        # Deleting Translations and Progress
-        for sentence in user_sentences:
-            Translations.query.filter_by(sentence_id=sentence.id).delete()
-            Progress_Groups.query.filter_by(sentence_id=sentence.id).delete()
-            self.db.session.delete(sentence)
-        
+
+        # per-user rows first, they may live in another database than the user
+        session = self._user_session(user_id, write=True)
+        self._delete_user_rows(session, user_id)
+        self._commit(session)
+
         # Delete user
+        self.db.session.query(Idempotency_Keys).filter_by(user_id=user_id).delete()
         self.db.session.delete(user)
         self._commit()
+        self._user_changed(user_id)
         return True
-            
+
+    def _delete_user_rows(self, session, user_id):
+        # Lösche alle abhängigen Daten in der richtigen Reihenfolge
+        sentence_ids = select(Sentences.id).where(Sentences.user_id == user_id)
+        session.query(User_Languages).filter_by(user_id=user_id).delete()
+        session.query(Translations).filter(Translations.sentence_id.in_(sentence_ids)).delete(synchronize_session=False)
+        session.query(Progress_Groups).filter_by(user_id=user_id).delete()
+        session.query(Cold_Progress_Groups).filter_by(user_id=user_id).delete()
+        session.query(Sentences).filter_by(user_id=user_id).delete()
+        job_ids = select(Import_Jobs.id).where(Import_Jobs.user_id == user_id)
+        session.query(Import_Id_Map).filter(Import_Id_Map.job_id.in_(job_ids)).delete(synchronize_session=False)
+        session.query(Import_Jobs).filter_by(user_id=user_id).delete()
+        session.query(Learning_Attempts).filter_by(user_id=user_id).delete()
+        session.query(Attempt_Rollups).filter_by(user_id=user_id).delete()
+        session.query(Review_Queues).filter_by(user_id=user_id).delete()
+        # decks the user published stay, their subscribers still learn from them
+        session.query(Deck_Subscriptions).filter_by(user_id=user_id).delete()
 
     # Translations Management
     def create_translation(self, sentence_id, translated_text, target_language, group_id, confidence=None):
-        sentence = Sentences.query.get(sentence_id)
+        session = self._row_session(sentence_id, write=True)
+        sentence = session.get(Sentences, sentence_id)
         if not sentence:
             raise ValueError("Sentence not found")
         translation = Translations(
@@ -138,16 +424,16 @@ class DataManager:
         )
         if confidence:
             translation.translation_confidence = confidence
-        self.db.session.add(translation)
-        self._commit()
+        session.add(translation)
+        self._commit(session)
         # progress will be administrated on group level
         return translation
 
     def get_translations_by_sentence(self, sentence_id):
-        return Translations.query.filter_by(sentence_id=sentence_id).all()
+        return self._row_session(sentence_id).query(Translations).filter_by(sentence_id=sentence_id).all()
 
     def get_translations_by_group(self, group_id):
-        return Translations.query.filter_by(group_id=group_id).all()
+        return self._row_session(group_id).execute(_GROUP_TRANSLATIONS, {'group_id': group_id}).scalars().all()
 
     # Progress Groups Management
     def create_progress_group(self, sentence_id, user_id):
@@ -158,88 +444,861 @@ class DataManager:
             next_review=datetime.utcnow().date(),
             created_at=datetime.utcnow()
         )
-        self.db.session.add(group)
-        self._commit()
+        session = self._user_session(user_id, write=True)
+        session.add(group)
+        self._commit(session)
         return group
 
     def get_progress_group(self, group_id):
-        return Progress_Groups.query.get(group_id)
+        group = self._row_session(group_id).get(Progress_Groups, group_id)
+        if group is None and self._warm_groups(self._row_session(group_id, write=True),
+                                               Cold_Progress_Groups.id == group_id):
+            group = self._row_session(group_id, write=True).get(Progress_Groups, group_id)
+        return group
 
-    def get_due_progress_groups(self, user_id):
+    def get_due_progress_groups(self, user_id, limit=None, after=None):
+        # the first limit (all if None) due groups in review order, see _due_order, after
+        # the due_key after if given. From today's precomputed review queue plus the
+        # groups created or reviewed since it was built; live for users without a queue,
+        # walking ix_progress_groups_due so the cost follows the limit, not the backlog.
         today = datetime.utcnow().date()
-        return Progress_Groups.query.filter(
-            and_(Progress_Groups.user_id == user_id, 
-                 Progress_Groups.next_review <= today)
-        ).all()
+        session = self._user_session(user_id)
+        queue = session.execute(_REVIEW_QUEUE, {'user_id': user_id, 'day': today}).scalar()
+        if queue is None:
+            params = {'user_id': user_id, 'today': today, 'limit': -1 if limit is None else limit}
+            if after is None:
+                return session.execute(_DUE_GROUPS, params).scalars().all()
+            after_review, after_score, after_id = after
+            return session.execute(_DUE_GROUPS_AFTER, dict(
+                params, after_review=after_review, after_score=after_score, after_id=after_id
+            )).scalars().all()
+
+        queued = [int(group_id) for group_id in queue.group_ids.split(',') if group_id]
+        groups = {}
+        for start in range(0, len(queued), HASH_LOOKUP_CHUNK):
+            chunk = queued[start:start + HASH_LOOKUP_CHUNK]
+            groups.update((group.id, group) for group in session.execute(
+                _DUE_GROUPS_BY_ID, {'ids': chunk, 'today': today}).scalars()
+                if after is None or due_key(group) > after)
+            # the queue is in review order, later chunks cannot come first
+            if limit is not None and len(groups) >= limit:
+                queued = queued[:start + len(chunk)]
+                break
+        due = {group_id: groups[group_id] for group_id in queued if group_id in groups}
+        params = {'user_id': user_id, 'today': today, 'max_group_id': queue.max_group_id,
+                  'built_at': queue.built_at}
+        for stmt in (_DUE_GROUPS_CREATED_SINCE, _DUE_GROUPS_REVIEWED_SINCE):
+            due.update((group.id, group) for group in session.execute(stmt, params).scalars()
+                       if after is None or due_key(group) > after)
+        return sorted(due.values(), key=due_key)[:limit]
+
+    def get_review_cards(self, user_id, groups):
+        # (group, sentence, translations) for each of the user's groups, in their order.
+        # Unedited cards of subscribed decks come with the Deck_Cards row as the sentence
+        # and its Deck_Translations.
+        session = self._user_session(user_id)
+        group_ids = [group.id for group in groups]
+        sentences = {sentence.id: sentence for sentence in session.query(Sentences).filter(
+            Sentences.id.in_([group.sentence_id for group in groups]))}
+        translations = {}
+        for translation in session.query(Translations).filter(Translations.group_id.in_(group_ids)) \
+                .order_by(Translations.id):
+            translations.setdefault(translation.group_id, []).append(translation)
+        card_ids = [group.card_id for group in groups if group.sentence_id is None and group.card_id]
+        cards, card_translations = {}, {}
+        if card_ids:
+            reader = self._reader()
+            cards = {card.id: card for card in reader.query(Deck_Cards).filter(Deck_Cards.id.in_(card_ids))}
+            for translation in reader.query(Deck_Translations).filter(Deck_Translations.card_id.in_(card_ids)) \
+                    .order_by(Deck_Translations.id):
+                card_translations.setdefault(translation.card_id, []).append(translation)
+        return [(group, sentences.get(group.sentence_id), translations.get(group.id, []))
+                if group.sentence_id is not None or not group.card_id else
+                (group, cards.get(group.card_id), card_translations.get(group.card_id, []))
+                for group in groups]
+
+    def build_review_queues(self, day, active_since, batch_size=200, pause=0.0):
+        # stores for day the ordered due groups of every user with an attempt since
+        # active_since and removes older queues. Each batch of users is one transaction,
+        # with pause seconds in between so requests get at the database. Returns the
+        # number of queues built.
+        built = 0
+        for session in self._stores():
+            session.execute(delete(Review_Queues).where(Review_Queues.day < day))
+            self._commit(session)
+            user_ids = session.execute(select(Learning_Attempts.user_id).distinct().where(
+                Learning_Attempts.attempted_at >= active_since).order_by(Learning_Attempts.user_id)).scalars().all()
+            for start in range(0, len(user_ids), batch_size):
+                batch = user_ids[start:start + batch_size]
+                # reviews and new groups after this point are picked up live
+                built_at = datetime.utcnow()
+                max_group_id = session.execute(select(func.max(Progress_Groups.id))).scalar() or 0
+                queues = {user_id: [] for user_id in batch}
+                rows = session.execute(select(Progress_Groups.user_id, Progress_Groups.id).where(
+                    Progress_Groups.user_id.in_(batch),
+                    Progress_Groups.next_review <= day,
+                    Progress_Groups.id <= max_group_id
+                ).order_by(Progress_Groups.user_id, *_due_order()))
+                for user_id, group_id in rows:
+                    queues[user_id].append(str(group_id))
+                stmt = sqlite_insert(Review_Queues)
+                session.execute(stmt.on_conflict_do_update(
+                    index_elements=['user_id', 'day'],
+                    set_={'group_ids': stmt.excluded.group_ids, 'max_group_id': stmt.excluded.max_group_id,
+                          'built_at': stmt.excluded.built_at}
+                ), [{'user_id': user_id, 'day': day, 'group_ids': ','.join(group_ids),
+                     'max_group_id': max_group_id, 'built_at': built_at}
+                    for user_id, group_ids in queues.items()])
+                self._commit(session)
+                built += len(batch)
+                if pause:
+                    time.sleep(pause)
+        return built
+
+    # Hot/cold tiering: the due scans only walk progress_groups, groups that will not be
+    # due for a long time wait in cold_progress_groups. Reads by id, sentence or card
+    # move a cold group back first, so only the due scans can tell the tables apart.
+    def tier_progress_groups(self, cold_after, warm_before, batch_size=1000):
+        # moves groups due after the date cold_after to the cold table and cold groups due
+        # on or before warm_before back, batch_size rows per transaction. Returns
+        # (cooled, warmed). warm_before has to stay ahead of the next run.
+        cooled = warmed = 0
+        for session in self._stores():
+            last_id = 0
+            while True:
+                # one pass over progress_groups in id order, each batch starts where the last ended
+                ids = session.execute(select(Progress_Groups.id).where(
+                    Progress_Groups.id > last_id, Progress_Groups.next_review > cold_after
+                ).order_by(Progress_Groups.id).limit(batch_size)).scalars().all()
+                if not ids:
+                    break
+                last_id = ids[-1]
+                cooled += self._move_groups(session, Progress_Groups, Cold_Progress_Groups, ids)
+                self._commit(session)
+            while True:
+                ids = session.execute(select(Cold_Progress_Groups.id).where(
+                    Cold_Progress_Groups.next_review <= warm_before).limit(batch_size)).scalars().all()
+                if not ids:
+                    break
+                warmed += self._move_groups(session, Cold_Progress_Groups, Progress_Groups, ids)
+                self._commit(session)
+        return cooled, warmed
+
+    def _warm_groups(self, session, condition):
+        # moves the cold groups matching condition back and commits; returns how many
+        ids = session.execute(select(Cold_Progress_Groups.id).where(condition)).scalars().all()
+        if not ids:
+            return 0
+        moved = self._move_groups(session, Cold_Progress_Groups, Progress_Groups, ids)
+        self._commit(session)
+        return moved
+
+    def _move_groups(self, session, source, target, ids):
+        columns = [column.name for column in Progress_Groups.__table__.columns]
+        session.execute(insert(target).from_select(
+            columns, select(*(getattr(source, name) for name in columns)).where(source.id.in_(ids))))
+        return session.execute(delete(source).where(source.id.in_(ids))).rowcount
 
     def update_progress_group(self, group_id, group_score, is_success):
-        group = Progress_Groups.query.get(group_id)
+        session = self._row_session(group_id, write=True)
+        group = session.get(Progress_Groups, group_id)
+        if not group and self._warm_groups(session, Cold_Progress_Groups.id == group_id):
+            group = session.get(Progress_Groups, group_id)
         if not group:
             raise ValueError("Progress group not found")
         
         group.group_score = group_score
         group.review_count += 1
-        group.last_reviewed = datetime.utcnow()
-        
-        # simple anki logic
         if is_success:
-            # make the learningintervall bigger
-            interval_days = max(1, group.review_count * 2)
-        else:
-            # make the learningintervall smaller
-            interval_days = 1
-            
+            group.success_count = (group.success_count or 0) + 1
+        group.last_reviewed = datetime.utcnow().date()
+        
+        interval_days = next_interval(group.review_count, is_success)
         group.next_review = (datetime.utcnow() + timedelta(days=interval_days)).date()
-        self._commit()
+        self._commit(session)
         return group
 
-    # Learning Progress 
-    def create_learning_progress(self, user_id, group_id):
-        if Learning_Progress.query.filter_by(user_id=user_id, group_id=group_id).first():
-            return 
-            
-        progress = Learning_Progress(
-            user_id=user_id,
-            group_id=group_id,
-            score=0.0,
-            last_reviewed=None,
-            next_review=datetime.utcnow().date(),
-            review_count=0,
-            success_rate=0.0
+    def get_learning_stats(self, user_id):
+        # success rate per reviewed group, averaged like the old per-card success_rate
+        groups = union_all(*(
+            select(model.review_count, model.success_count).where(model.user_id == user_id)
+            for model in (Progress_Groups, Cold_Progress_Groups)
+        )).subquery()
+        success_rate = groups.c.success_count * 100.0 / groups.c.review_count
+        total_reviews, avg_success_rate = self._user_session(user_id).execute(
+            select(func.sum(groups.c.review_count), func.avg(case((groups.c.review_count > 0, success_rate))))
+        ).one()
+        stats = {
+            'total_reviews': total_reviews or 0,
+            'avg_success_rate': avg_success_rate or 0,
+        }
+        return stats
+
+    # Deck Export / Import
+    def iter_user_export(self, user_id):
+        # checked eagerly so callers can answer 404 before streaming starts
+        user = self.get_user_by_id(user_id)
+        if not user:
+            raise ValueError("User not found")
+        return self._iter_export(user, self._user_session(user_id))
+
+    def _iter_export(self, user, session):
+        yield 'user', self._export_row('user', user)
+        # (kind, model, select) in dependency order; cold groups are exported like the others
+        selects = (
+            ('language', User_Languages, lambda cols: select(*cols).where(User_Languages.user_id == user.id)),
+            ('subscription', Deck_Subscriptions,
+             lambda cols: select(*cols).where(Deck_Subscriptions.user_id == user.id)),
+            ('sentence', Sentences, lambda cols: select(*cols).where(Sentences.user_id == user.id)),
+            ('progress_group', Progress_Groups, lambda cols: select(*cols).where(Progress_Groups.user_id == user.id)),
+            ('progress_group', Cold_Progress_Groups,
+             lambda cols: select(*cols).where(Cold_Progress_Groups.user_id == user.id)),
+            ('translation', Translations,
+             lambda cols: select(*cols).join(Sentences, Translations.sentence_id == Sentences.id)
+                                       .where(Sentences.user_id == user.id)),
+            ('attempt', Learning_Attempts, lambda cols: select(*cols).where(Learning_Attempts.user_id == user.id)),
+            ('attempt_rollup', Attempt_Rollups, lambda cols: select(*cols).where(Attempt_Rollups.user_id == user.id)),
         )
-        self.db.session.add(progress)
+        for kind, model, build in selects:
+            columns = EXPORT_COLUMNS[kind][1]
+            stmt = build([getattr(model, c) for c in columns]).order_by(model.id)
+            # yield_per streams through a server side cursor instead of loading every row
+            rows = session.execute(stmt.execution_options(yield_per=EXPORT_CHUNK))
+            for row in rows:
+                yield kind, {c: _export_value(v) for c, v in zip(columns, row)}
+
+    def _export_row(self, kind, obj):
+        return {c: _export_value(getattr(obj, c)) for c in EXPORT_COLUMNS[kind][1]}
+
+    def get_or_create_import_job(self, user_id, job_id=None):
+        if not self.db.session.get(User, user_id):
+            raise ValueError("User not found")
+        # the job is stored next to the rows it imports so both commit together
+        session = self._user_session(user_id, write=True)
+        if job_id is not None:
+            job = session.get(Import_Jobs, job_id)
+            if not job or job.user_id != int(user_id):
+                raise ValueError("Import job not found")
+            return job
+        job = Import_Jobs(user_id=user_id, status='running', records_done=0)
+        session.add(job)
+        self._commit(session)
+        return job
+
+    def import_user_records(self, job, records):
+        # records: iterable of (kind, data) in export order. Every chunk commits together
+        # with job.records_done, so a failed job resumes right after its last chunk.
+        if job.status == 'done':
+            return job
+        session = object_session(job)
+        job.status = 'running'
+        self._commit(session)
+        id_maps = {kind: {} for kind in EXPORT_COLUMNS}
+        id_maps['reused_sentence'] = {}
+        for row in session.query(Import_Id_Map).filter_by(job_id=job.id):
+            id_maps[row.kind][row.old_id] = row.new_id
+
+        chunk, chunk_kind, position = [], None, 0
+        try:
+            for position, (kind, data) in enumerate(records, 1):
+                if position <= job.records_done or kind in LEGACY_EXPORT_KINDS:
+                    continue
+                if kind not in EXPORT_COLUMNS:
+                    raise ValueError(f"Unknown record type '{kind}' at record {position}")
+                if chunk and (kind != chunk_kind or len(chunk) >= IMPORT_CHUNK):
+                    self._import_chunk(session, job, chunk_kind, chunk, id_maps, position - 1)
+                    chunk = []
+                chunk_kind = kind
+                chunk.append(data)
+            if chunk:
+                self._import_chunk(session, job, chunk_kind, chunk, id_maps, position)
+        except Exception:
+            session.rollback()
+            job.status = 'failed'
+            self._commit(session)
+            raise
+
+        # the id map is only needed to resume
+        session.query(Import_Id_Map).filter_by(job_id=job.id).delete()
+        job.status = 'done'
+        job.updated_at = datetime.utcnow()
+        self._commit(session)
+        # the dump may have added target languages
+        self._user_changed(job.user_id)
+        return job
+
+    def _import_chunk(self, session, job, kind, chunk, id_maps, last_position):
+        user_id = job.user_id
+        model, columns = EXPORT_COLUMNS[kind]
+        old_ids, rows, mapped = [], [], []
+        stmt = insert(model)
+        # the previous chunk is committed, so the registry's own write cannot wait on this session
+        codes = {data.get(c) for c in columns for data in chunk
+                 if isinstance(model.__table__.c[c].type, LanguageCode)}
+        current_app.languages.register(codes - {None})
+
+        if kind == 'user':
+            # the target account already exists
+            pass
+        elif kind == 'language':
+            known = {lang.language_code for lang in session.query(User_Languages).filter_by(user_id=user_id)}
+            for data in chunk:
+                if data['language_code'] not in known:
+                    known.add(data['language_code'])
+                    rows.append(dict(_import_values(model, data, columns[1:]), user_id=user_id))
+        elif kind == 'subscription':
+            known = {sub.deck_id for sub in session.query(Deck_Subscriptions).filter_by(user_id=user_id)}
+            for data in chunk:
+                if data['deck_id'] not in known:
+                    known.add(data['deck_id'])
+                    rows.append(dict(_import_values(model, data, columns[1:]), user_id=user_id))
+        elif kind == 'sentence':
+            hashes = {data['id']: sentence_hash(data['original_text']) for data in chunk}
+            existing = {s.content_hash: s.id for s in session.query(Sentences).filter(
+                Sentences.user_id == user_id, Sentences.content_hash.in_(set(hashes.values())))}
+            pending = set()
+            for data in chunk:
+                content_hash = hashes[data['id']]
+                if content_hash in existing:
+                    # keep the target's sentence and progress, skip the imported copy
+                    mapped.append(('reused_sentence', data['id'], existing[content_hash]))
+                    continue
+                if content_hash in pending:
+                    raise ValueError(f"Duplicate sentence {data['id']} in import")
+                pending.add(content_hash)
+                old_ids.append(data['id'])
+                rows.append(dict(_import_values(model, data, columns[1:]),
+                                 user_id=user_id, content_hash=content_hash))
+        elif kind == 'progress_group':
+            card_ids = {data['card_id'] for data in chunk if data.get('card_id') and data['sentence_id'] is None}
+            # the target may follow the same deck and have reviewed the card already
+            reviewed = self._cards_with_groups(session, user_id, card_ids)
+            for data in chunk:
+                if data['sentence_id'] in id_maps['reused_sentence'] or (
+                        data['sentence_id'] is None and data.get('card_id') in reviewed):
+                    mapped.append((kind, data['id'], None))
+                    continue
+                old_ids.append(data['id'])
+                # dumps from before success_count existed count no successes
+                rows.append(dict(_import_values(model, data, columns[2:]), user_id=user_id,
+                                 success_count=data.get('success_count') or 0,
+                                 sentence_id=self._remap(id_maps, 'sentence', data['sentence_id'])))
+        elif kind == 'translation':
+            for data in chunk:
+                group_id = self._remap(id_maps, 'progress_group', data['group_id'])
+                if data['sentence_id'] in id_maps['reused_sentence'] or (data['group_id'] and group_id is None):
+                    mapped.append((kind, data['id'], None))
+                    continue
+                old_ids.append(data['id'])
+                rows.append(dict(_import_values(model, data, columns[3:]), group_id=group_id,
+                                 sentence_id=self._remap(id_maps, 'sentence', data['sentence_id'])))
+        elif kind == 'attempt':
+            for data in chunk:
+                # attempts on skipped or deleted cards stay in the log without a card
+                rows.append(dict(_import_values(model, data, columns[3:]), user_id=user_id,
+                                 group_id=self._remap(id_maps, 'progress_group', data['group_id'], required=False),
+                                 translation_id=self._remap(id_maps, 'translation', data['translation_id'],
+                                                            required=False)))
+        elif kind == 'attempt_rollup':
+            # days the target already has are added up
+            stmt = _rollup_upsert()
+            for data in chunk:
+                rows.append(dict(_import_values(model, data, columns[1:]), user_id=user_id))
+
+        if rows:
+            if old_ids:
+                # executemany with RETURNING hands back the new ids in input order
+                stmt = stmt.returning(model.id, sort_by_parameter_order=True)
+                new_ids = session.execute(stmt, rows).scalars().all()
+                mapped.extend((kind, old, new) for old, new in zip(old_ids, new_ids))
+            else:
+                session.execute(stmt, rows)
+        for map_kind, old, new in mapped:
+            id_maps[map_kind][old] = new
+        if mapped:
+            session.execute(insert(Import_Id_Map), [
+                {'job_id': job.id, 'kind': map_kind, 'old_id': old, 'new_id': new}
+                for map_kind, old, new in mapped
+            ])
+        job.records_done = last_position
+        job.updated_at = datetime.utcnow()
+        self._commit(session)
+
+    def _remap(self, id_maps, kind, old_id, required=True):
+        # required=False maps ids the dump does not contain to None
+        if old_id is None:
+            return None
+        if kind == 'sentence' and old_id in id_maps['reused_sentence']:
+            return id_maps['reused_sentence'][old_id]
+        if old_id not in id_maps[kind]:
+            if not required:
+                return None
+            raise ValueError(f"Import references unknown {kind} {old_id}")
+        return id_maps[kind][old_id]
+
+    # Shard Maintenance
+    def get_shard_loads(self):
+        # shard -> {user_id: number of sentences}
+        loads = {}
+        for index in range(self._shard_count()):
+            rows = self._shard_session(index).query(Sentences.user_id, func.count(Sentences.id)) \
+                .group_by(Sentences.user_id).all()
+            loads[index] = dict(rows)
+        return loads
+
+    def move_user(self, user_id, target):
+        # copies the user's rows into the target shard through the import pipeline, so
+        # they get ids from the target's range, then switches the directory entry.
+        # The user should not write meanwhile; ids of moved rows change.
+        if not 0 <= target < self._shard_count():
+            raise ValueError("Unknown shard")
+        user = self.db.session.get(User, user_id)
+        if not user:
+            raise ValueError("User not found")
+        source = self._shard_of_user(user.id)
+        # leftovers of an interrupted earlier move
+        for index in range(self._shard_count()):
+            if index != source:
+                session = self._shard_session(index)
+                self._delete_user_rows(session, user.id)
+                self._commit(session)
+        if source == target:
+            return user
+
+        source_session = self._shard_session(source)
+        target_session = self._shard_session(target)
+        job = Import_Jobs(user_id=user.id, status='running', records_done=0)
+        target_session.add(job)
+        self._commit(target_session)
+        self.import_user_records(job, self._iter_export(user, source_session))
+        target_session.delete(job)
+        self._commit(target_session)
+
+        user.shard = target
         self._commit()
-        return progress
-
-    def update_learning_progress(self, group_id, new_score, is_success):
-        progress = Learning_Progress.query.filter_by(group_id=group_id).first()
-        if not progress:
-            raise ValueError("Progress not found")
-            
-        progress.score = new_score
-        progress.review_count += 1
-        progress.success_rate = ((progress.success_rate * (progress.review_count - 1)) + (100 if is_success else 0)) / progress.review_count
-        progress.last_reviewed = datetime.utcnow()
-        
-        # simple Intervalllogic
-        if is_success:
-            progress.next_review = progress.last_reviewed + timedelta(days=progress.review_count * 2)
+        self._user_changed(user.id)
+        g._user_shards[user.id] = target
+        self._delete_user_rows(source_session, user.id)
+        self._commit(source_session)
+        return user
+
+    # Learning Attempt Log
+    def insert_attempts(self, attempts):
+        # attempts: dicts of ATTEMPT_COLUMNS values, one executemany per database
+        batches = {}
+        for attempt in attempts:
+            session = self._user_session(attempt['user_id'], write=True)
+            batches.setdefault(session, []).append({c: attempt.get(c) for c in ATTEMPT_COLUMNS})
+        for session, rows in batches.items():
+            session.execute(insert(Learning_Attempts), rows)
+            self._commit(session)
+
+    def rollup_attempts(self, cutoff, prune_before=None):
+        # adds the attempts before cutoff (normally today's midnight) to the daily rollups
+        # and marks them; with prune_before, rolled up attempts older than that are deleted.
+        # Returns (attempts rolled up, attempts pruned).
+        rolled = pruned = 0
+        for session in self._stores():
+            max_id = session.execute(select(func.max(Learning_Attempts.id)).where(
+                Learning_Attempts.rolled_up.is_(False), Learning_Attempts.attempted_at < cutoff)).scalar()
+            if max_id is not None:
+                # the id bound keeps attempts flushed meanwhile out of both statements
+                pending = and_(Learning_Attempts.rolled_up.is_(False),
+                               Learning_Attempts.attempted_at < cutoff,
+                               Learning_Attempts.id <= max_id)
+                session.execute(_rollup_upsert(), [
+                    {'user_id': user_id, 'day': day, 'language_code': language,
+                     'attempts': attempts, 'successes': successes, 'score_sum': score_sum}
+                    for user_id, day, language, attempts, successes, score_sum
+                    in self._aggregate_attempts(session, pending)
+                ])
+                result = session.execute(update(Learning_Attempts).where(pending).values(rolled_up=True)
+                                         .execution_options(synchronize_session=False))
+                rolled += result.rowcount
+            if prune_before is not None:
+                result = session.execute(delete(Learning_Attempts).where(
+                    Learning_Attempts.rolled_up.is_(True), Learning_Attempts.attempted_at < prune_before
+                ).execution_options(synchronize_session=False))
+                pruned += result.rowcount
+            self._commit(session)
+        return rolled, pruned
+
+    def get_daily_attempt_stats(self, user_id, since):
+        # per day and language since the given date, from the rollups plus the
+        # attempts that are not rolled up yet
+        session = self._user_session(user_id)
+        totals = {}
+        for rollup in session.query(Attempt_Rollups).filter(Attempt_Rollups.user_id == user_id,
+                                                            Attempt_Rollups.day >= since):
+            totals[(rollup.day, rollup.language_code)] = [rollup.attempts, rollup.successes, rollup.score_sum]
+        recent = and_(Learning_Attempts.user_id == user_id, Learning_Attempts.attempted_at >= since,
+                      Learning_Attempts.rolled_up.is_(False))
+        for _, day, language, attempts, successes, score_sum in self._aggregate_attempts(session, recent):
+            total = totals.setdefault((day, language), [0, 0, 0.0])
+            total[0] += attempts
+            total[1] += successes
+            total[2] += score_sum
+        return [{
+            'day': day,
+            'language_code': language,
+            'attempts': attempts,
+            'successes': successes,
+            'avg_score': score_sum / attempts if attempts else 0.0
+        } for (day, language), (attempts, successes, score_sum) in sorted(totals.items())]
+
+    def _aggregate_attempts(self, session, condition):
+        # (user_id, day, language, attempts, successes, score sum) per user, day and language
+        day = func.date(Learning_Attempts.attempted_at)
+        language = func.coalesce(Learning_Attempts.language_code, '')
+        rows = session.execute(select(
+            Learning_Attempts.user_id, day, language, func.count(),
+            func.sum(case((Learning_Attempts.is_success, 1), else_=0)),
+            func.coalesce(func.sum(Learning_Attempts.score), 0.0)
+        ).where(condition).group_by(Learning_Attempts.user_id, day, language)).all()
+        return [(row[0], date.fromisoformat(row[1]), *row[2:]) for row in rows]
+
+    def _stores(self):
+        # write sessions of every database holding per-user rows
+        count = self._shard_count()
+        if not count:
+            return [self.db.session]
+        return [self._shard_session(index) for index in range(count)]
+
+    # Shared Decks: cards and their translations are stored once on the primary. Subscribers
+    # get a progress group per card as they reach it and a copy of a card only if they edit it.
+    def publish_deck(self, user_id, name, sentence_ids=None):
+        # copies the user's sentences (or the given ones) with their translations into a new deck
+        user = self.get_user_by_id(user_id)
+        if not user:
+            raise ValueError("User not found")
+        source = self._user_session(user_id)
+        query = source.query(Sentences).filter(Sentences.user_id == user_id)
+        if sentence_ids is not None:
+            query = query.filter(Sentences.id.in_(sentence_ids))
+        sentences = query.order_by(Sentences.id).all()
+        if not sentences:
+            raise ValueError("No sentences to publish")
+
+        session = self.db.session
+        today = datetime.utcnow().date()
+        deck = Decks(owner_id=user_id, name=name, language_code=user.native_language,
+                     card_count=len(sentences), created_at=today)
+        session.add(deck)
+        session.flush()
+        card_ids = session.execute(insert(Deck_Cards).returning(Deck_Cards.id, sort_by_parameter_order=True), [{
+            'deck_id': deck.id, 'original_text': sentence.original_text, 'language_code': sentence.language_code,
+            'category': sentence.category, 'created_at': today
+        } for sentence in sentences]).scalars().all()
+        cards = dict(zip((sentence.id for sentence in sentences), card_ids))
+        for start in range(0, len(sentences), HASH_LOOKUP_CHUNK):
+            chunk = [sentence.id for sentence in sentences[start:start + HASH_LOOKUP_CHUNK]]
+            rows = [{'card_id': cards[translation.sentence_id], 'translated_text': translation.translated_text,
+                     'target_language_code': translation.target_language_code, 'created_at': today}
+                    for translation in source.query(Translations).filter(Translations.sentence_id.in_(chunk))]
+            if rows:
+                session.execute(insert(Deck_Translations), rows)
+        self._commit(session)
+        return deck
+
+    def get_deck(self, deck_id):
+        return self._reader().get(Decks, deck_id)
+
+    def subscribe_deck(self, user_id, deck_id):
+        # -> (subscription, created). One row, whatever the size of the deck
+        if not self.get_user_by_id(user_id):
+            raise ValueError("User not found")
+        if not self.get_deck(deck_id):
+            raise ValueError("Deck not found")
+        session = self._user_session(user_id, write=True)
+        created = session.execute(
+            sqlite_insert(Deck_Subscriptions).values(user_id=user_id, deck_id=deck_id, next_card_id=0,
+                                                     created_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=['user_id', 'deck_id'])
+        ).rowcount
+        self._commit(session)
+        subscription = session.query(Deck_Subscriptions).filter_by(user_id=user_id, deck_id=deck_id).one()
+        return subscription, bool(created)
+
+    def introduce_deck_cards(self, user_id, limit):
+        # gives the next limit cards of the user's decks a progress group, due today;
+        # returns how many. Costs follow limit, not the size of the decks.
+        session = self._user_session(user_id, write=True)
+        subscriptions = session.query(Deck_Subscriptions).filter_by(user_id=user_id) \
+            .order_by(Deck_Subscriptions.id).all()
+        now = datetime.utcnow()
+        introduced = 0
+        for subscription in subscriptions:
+            if introduced >= limit:
+                break
+            card_ids = self._reader().execute(_DECK_CARDS_FROM, {
+                'deck_id': subscription.deck_id, 'from_id': subscription.next_card_id, 'limit': limit - introduced
+            }).scalars().all()
+            if not card_ids:
+                continue
+            # cards edited before they were reached have their group already
+            edited = self._cards_with_groups(session, user_id, card_ids)
+            rows = [{'user_id': user_id, 'card_id': card_id, 'group_score': 0.0, 'next_review': now.date(),
+                     'review_count': 0, 'success_count': 0, 'created_at': now}
+                    for card_id in card_ids if card_id not in edited]
+            if rows:
+                session.execute(insert(Progress_Groups), rows)
+            subscription.next_card_id = card_ids[-1] + 1
+            introduced += len(card_ids)
+        if introduced:
+            self._commit(session)
+        return introduced
+
+    def _cards_with_groups(self, session, user_id, card_ids):
+        # the card_ids the user has a progress group for, hot or cold
+        if not card_ids:
+            return set()
+        return set(session.execute(union_all(*(
+            select(model.card_id).where(model.user_id == user_id, model.card_id.in_(card_ids))
+            for model in (Progress_Groups, Cold_Progress_Groups)
+        ))).scalars())
+
+    def get_deck_card(self, card_id):
+        return self._reader().get(Deck_Cards, card_id)
+
+    def get_deck_translation(self, translation_id):
+        return self._reader().get(Deck_Translations, translation_id)
+
+    def edit_deck_card(self, user_id, card_id, original_text=None, translations=None):
+        # copy-on-write: the first edit copies the card and its translations into the user's
+        # own rows and points their progress group there, the deck is not touched.
+        # translations: language code -> new text. Returns (sentence, translations).
+        card = self.get_deck_card(card_id)
+        if not card:
+            raise ValueError("Card not found")
+        session = self._user_session(user_id, write=True)
+        if not session.query(Deck_Subscriptions).filter_by(user_id=user_id, deck_id=card.deck_id).first():
+            raise ValueError("Not subscribed to this deck")
+        translations = translations or {}
+        group = session.query(Progress_Groups).filter_by(user_id=user_id, card_id=card_id).first()
+        if group is None and self._warm_groups(session, and_(Cold_Progress_Groups.user_id == user_id,
+                                                             Cold_Progress_Groups.card_id == card_id)):
+            group = session.query(Progress_Groups).filter_by(user_id=user_id, card_id=card_id).first()
+
+        if group is not None and group.sentence_id is not None:
+            # edited before, the copy is edited in place
+            sentence = session.get(Sentences, group.sentence_id)
+            copies = session.query(Translations).filter_by(group_id=group.id).order_by(Translations.id).all()
+            if original_text is not None:
+                sentence.original_text = original_text
+                sentence.content_hash = sentence_hash(original_text)
         else:
-            progress.next_review = progress.last_reviewed + timedelta(days=1)
-            
+            # the copy gets its final text before the flush, the card's own text may be taken
+            text = card.original_text if original_text is None else original_text
+            sentence = Sentences(user_id=user_id, original_text=text, language_code=card.language_code,
+                                 category=card.category, content_hash=sentence_hash(text),
+                                 created_at=datetime.utcnow())
+            session.add(sentence)
+            if group is None:
+                # not reached yet, the group starts from scratch
+                group = Progress_Groups(user_id=user_id, card_id=card_id, group_score=0.0,
+                                        next_review=datetime.utcnow().date(), review_count=0, success_count=0,
+                                        created_at=datetime.utcnow())
+                session.add(group)
+            copies = None
+        content_hash = sentence.content_hash
+        try:
+            if copies is None:
+                session.flush()
+                group.sentence_id = sentence.id
+                copies = [Translations(sentence_id=sentence.id, group_id=group.id, translated_text=t.translated_text,
+                                       target_language_code=t.target_language_code, created_at=datetime.utcnow())
+                          for t in self.db.session.query(Deck_Translations).filter_by(card_id=card_id)
+                          .order_by(Deck_Translations.id)]
+                session.add_all(copies)
+            for translation in copies:
+                if translation.target_language_code in translations:
+                    translation.translated_text = translations[translation.target_language_code]
+            self._commit(session)
+        except IntegrityError:
+            # the user stored the same sentence on their own
+            session.rollback()
+            existing = session.query(Sentences).filter_by(user_id=user_id, content_hash=content_hash).first()
+            raise DuplicateSentenceError({0: existing})
+        return sentence, copies
+
+    # Background Jobs
+    def create_job(self, kind, user_id=None):
+        job = Background_Jobs(kind=kind, user_id=user_id, status='pending')
+        self.db.session.add(job)
         self._commit()
-        return progress
+        return job
 
-    def get_learning_stats(self, user_id):
-        stats = {
-            'total_reviews': Learning_Progress.query.filter_by(user_id=user_id).count(),
-            'avg_success_rate': db.session.query(func.avg(Learning_Progress.success_rate)).filter_by(user_id=user_id).scalar() or 0,
-        }
-        return stats
+    def update_job(self, job_id, status, result=None, error=None):
+        job = self.db.session.get(Background_Jobs, job_id)
+        if not job:
+            raise ValueError("Job not found")
+        job.status = status
+        if result is not None:
+            job.result = json.dumps(result)
+        if error is not None:
+            job.error = error[:500]
+        job.updated_at = datetime.utcnow()
+        self._commit()
+        return job
+
+    def get_job(self, job_id):
+        # clients poll this right after the job was created, so no read routing
+        return self.db.session.get(Background_Jobs, job_id)
+
+    # Idempotency Keys
+    def claim_idempotency_key(self, user_id, key, request_hash, ttl, stale_after):
+        # -> (entry, claimed). claimed means the caller runs the request and completes or
+        # releases the entry; otherwise entry is the first request's, finished or in flight
+        now = datetime.utcnow()
+        values = {'request_hash': request_hash, 'status_code': None, 'response': None, 'location': None,
+                  'created_at': now, 'expires_at': now + timedelta(seconds=ttl)}
+        result = self.db.session.execute(
+            sqlite_insert(Idempotency_Keys).values(user_id=user_id, key=key, **values)
+            .on_conflict_do_nothing(index_elements=['user_id', 'key'])
+        )
+        self._commit()
+        entry = self.get_idempotency_key(user_id, key)
+        if result.rowcount:
+            return entry, True
+        abandoned = entry.status_code is None and entry.created_at <= now - timedelta(seconds=stale_after)
+        if entry.expires_at <= now or abandoned:
+            # expired, or its request died without releasing it; the created_at check
+            # lets only one of several concurrent retries take it over
+            taken = self.db.session.execute(
+                update(Idempotency_Keys)
+                .where(Idempotency_Keys.id == entry.id, Idempotency_Keys.created_at == entry.created_at)
+                .values(**values)
+            ).rowcount
+            self._commit()
+            entry = self.get_idempotency_key(user_id, key)
+            return entry, bool(taken)
+        return entry, False
+
+    def get_idempotency_key(self, user_id, key):
+        # polled while another request holds the key, so always a fresh row from the primary
+        return self.db.session.execute(
+            select(Idempotency_Keys).where(Idempotency_Keys.user_id == user_id, Idempotency_Keys.key == key)
+            .execution_options(populate_existing=True)
+        ).scalar_one_or_none()
+
+    def complete_idempotency_key(self, entry_id, status_code, response, location=None):
+        self.db.session.execute(
+            update(Idempotency_Keys).where(Idempotency_Keys.id == entry_id)
+            .values(status_code=status_code, response=response, location=location)
+        )
+        self._commit()
+
+    def release_idempotency_key(self, entry_id):
+        # the request failed before doing its work, a retry may run it again
+        self.db.session.execute(delete(Idempotency_Keys).where(Idempotency_Keys.id == entry_id))
+        self._commit()
+
+    def purge_idempotency_keys(self, now=None):
+        result = self.db.session.execute(
+            delete(Idempotency_Keys).where(Idempotency_Keys.expires_at <= (now or datetime.utcnow()))
+        )
+        self._commit()
+        return result.rowcount
 
     # Helpermethods
+    def get_translation(self, translation_id):
+        return self._row_session(translation_id).get(Translations, translation_id)
+
     def get_translations_for_group(self, group_id):
-        return Translations.query.filter_by(group_id=group_id).all()
+        return self.get_translations_by_group(group_id)
 
     def get_group_for_sentence(self, sentence_id):
-        return Progress_Groups.query.filter_by(sentence_id=sentence_id).first()
\ No newline at end of file
+        group = self._row_session(sentence_id).query(Progress_Groups).filter_by(sentence_id=sentence_id).first()
+        if group is None and self._warm_groups(self._row_session(sentence_id, write=True),
+                                               Cold_Progress_Groups.sentence_id == sentence_id):
+            group = self._row_session(sentence_id, write=True).query(Progress_Groups) \
+                .filter_by(sentence_id=sentence_id).first()
+        return group
+
+
+def _export_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _import_values(model, data, columns):
+    values = {}
+    for column in columns:
+        value = data.get(column)
+        column_type = model.__table__.c[column].type
+        if isinstance(value, str) and isinstance(column_type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        elif isinstance(value, str) and isinstance(column_type, (db.Date, EpochDay)):
+            value = date.fromisoformat(value[:10])
+        values[column] = value
+    return values
+
+
+def due_key(group):
+    # a group's position in _due_order, as a tuple that compares the same way
+    return group.next_review, group.group_score or 0.0, group.id
+
+
+def _due_order():
+    # review priority of due groups: most overdue days first, then the lowest score.
+    # Matches ix_progress_groups_due, so a limited due query stops after limit rows.
+    return Progress_Groups.next_review, Progress_Groups.group_score, Progress_Groups.id
+
+
+def _prefix_range(column, prefix):
+    # column LIKE 'prefix%' as a range, which sqlite can answer from an index.
+    # The bound is the prefix with its last character incremented; trailing
+    # U+10FFFF have no successor and are dropped, all of them leaves no bound.
+    stem = prefix.rstrip('\U0010ffff')
+    if not stem:
+        return (column >= prefix,)
+    last = ord(stem[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        # surrogates are no characters of their own
+        last = 0xE000
+    return column >= prefix, column < stem[:-1] + chr(last)
+
+
+def _rollup_upsert():
+    # adds to an existing (user_id, day, language_code) rollup instead of failing
+    stmt = sqlite_insert(Attempt_Rollups)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day', 'language_code'],
+        set_={
+            'attempts': Attempt_Rollups.attempts + stmt.excluded.attempts,
+            'successes': Attempt_Rollups.successes + stmt.excluded.successes,
+            'score_sum': Attempt_Rollups.score_sum + stmt.excluded.score_sum,
+        }
+    )
+
+
+# Statements of the hot read paths, built once and executed with bound parameters.
+# SQLAlchemy then neither builds the query nor computes its cache key per call;
+# tools/statement_benchmark.py measures the difference.
+_REVIEW_QUEUE = select(Review_Queues).where(
+    Review_Queues.user_id == bindparam('user_id'), Review_Queues.day == bindparam('day'))
+_DUE_GROUPS = select(Progress_Groups).where(
+    Progress_Groups.user_id == bindparam('user_id'), Progress_Groups.next_review <= bindparam('today')
+).order_by(*_due_order()).limit(bindparam('limit'))
+_DUE_GROUPS_AFTER = _DUE_GROUPS.where(tuple_(*_due_order()) > tuple_(
+    # a bare bindparam in a tuple would get no column type and skip the EpochDay encoding
+    bindparam('after_review', type_=EpochDay()), bindparam('after_score'), bindparam('after_id')))
+_DUE_GROUPS_BY_ID = select(Progress_Groups).where(
+    Progress_Groups.id.in_(bindparam('ids', expanding=True)), Progress_Groups.next_review <= bindparam('today'))
+# changed since a review queue was built: two statements rather than an OR, so each is
+# an index range, the primary key for new groups (user_id + 0 keeps sqlite off the
+# user index) and ix_progress_groups_user_reviewed for reviewed ones. last_reviewed is a
+# day, groups reviewed earlier that day come back as well and are deduplicated by id
+_DUE_GROUPS_CREATED_SINCE = select(Progress_Groups).where(
+    Progress_Groups.id > bindparam('max_group_id'), Progress_Groups.user_id + 0 == bindparam('user_id'),
+    Progress_Groups.next_review <= bindparam('today'))
+_DUE_GROUPS_REVIEWED_SINCE = select(Progress_Groups).where(
+    Progress_Groups.user_id == bindparam('user_id'), Progress_Groups.last_reviewed >= bindparam('built_at'),
+    Progress_Groups.next_review <= bindparam('today'))
+_DECK_CARDS_FROM = select(Deck_Cards.id).where(
+    Deck_Cards.deck_id == bindparam('deck_id'), Deck_Cards.id >= bindparam('from_id')
+).order_by(Deck_Cards.id).limit(bindparam('limit'))
+_GROUP_TRANSLATIONS = select(Translations).where(Translations.group_id == bindparam('group_id'))
+_USER_LANGUAGES = select(User_Languages).where(
+    User_Languages.user_id == bindparam('user_id')).order_by(User_Languages.id)
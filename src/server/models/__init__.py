@@ -7,7 +7,6 @@ from .api import (
     SentenceResponse,
     TranslationResponse,
     ProgressGroupResponse,
-    LearningProgressResponse,
     SupportedLanguageResponse,
     ErrorResponse,
 )
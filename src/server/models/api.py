@@ -1,7 +1,7 @@
 # src/server/models/api.py
 from pydantic import BaseModel, Field, validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 # Request Models (Input)
 class UserCreateRequest(BaseModel):
@@ -59,28 +59,14 @@ class ProgressGroupResponse(BaseModel):
     sentence_id: int
     user_id: int
     group_score: float
-    next_review: Optional[datetime]
-    last_reviewed: Optional[datetime]
+    next_review: Optional[date]
+    last_reviewed: Optional[date]
     review_count: int
     created_at: datetime
 
     class Config:
         orm_mode = True
 
-class LearningProgressResponse(BaseModel):
-    id: int
-    user_id: int
-    translation_id: int
-    group_id: int
-    score: int
-    last_reviewed: Optional[datetime]
-    next_review: Optional[datetime]
-    review_count: int
-    success_rate: int
-
-    class Config:
-        orm_mode = True
-
 # Additional Models
 class SupportedLanguageResponse(BaseModel):
     code: str
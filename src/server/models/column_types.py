@@ -0,0 +1,53 @@
+"""
+Compact column encodings.
+
+EpochDay stores a date as the number of days since 1970-01-01 and LanguageCode
+stores a language code as the small integer key of its row in the languages
+table (see core.languages). Python code and the API keep seeing date objects
+and ISO codes, only the database holds the integers.
+"""
+from datetime import date
+from flask import current_app
+from sqlalchemy import Integer, SmallInteger
+from sqlalchemy.types import TypeDecorator
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class EpochDay(TypeDecorator):
+    # days keep their order, so ranges, ORDER BY and the indexes work on the integers
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        # a datetime counts as its day
+        return value.toordinal() - EPOCH_ORDINAL
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return date.fromordinal(value + EPOCH_ORDINAL)
+
+
+# no language has this key, the ids of the languages table start at 1
+UNKNOWN_LANGUAGE_KEY = 0
+
+
+class LanguageCode(TypeDecorator):
+    # codes have to be registered before rows with them are written, see LanguageRegistry.
+    # Needs an app context, the keys are those of current_app's database
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        # a code nobody registered matches no row, like the string it stands for
+        return current_app.languages.id_for(value, default=UNKNOWN_LANGUAGE_KEY)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return current_app.languages.code_for(value)
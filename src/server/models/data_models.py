@@ -1,6 +1,7 @@
 # from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from src.server.extensions import db
+from src.server.models.column_types import EpochDay, LanguageCode
 
 
 class User(db.Model):
@@ -10,16 +11,29 @@ class User(db.Model):
     username = db.Column(db.String(100), unique=True, nullable=False)
     native_language = db.Column(db.String(5), nullable=False)
     created_at = db.Column(db.Date)
+    # index of the database in DB_SHARD_URIS holding this user's rows, None if unsharded
+    shard = db.Column(db.Integer)
 
 
 
+class Languages(db.Model):
+    __tablename__ = 'languages'
+    # language code -> the small key stored in place of it, see core.languages. sqlite
+    # only numbers rows itself for INTEGER keys and stores small values in one byte anyway
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    code = db.Column(db.String(5), unique=True, nullable=False)
+
+
 class User_Languages(db.Model):
     __tablename__ = 'user_languages'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    language_code = db.Column(db.String(5), nullable=False)
+    language_code = db.Column(LanguageCode, nullable=False)
     created_at = db.Column(db.Date)
+    # AUTOINCREMENT lets every shard start its ids at its own offset, see core.sharding.
+    # (user_id, id) returns a user's languages in the order they were added without a sort
+    __table_args__ = (db.Index('ix_user_languages_user', 'user_id', 'id'), {'sqlite_autoincrement': True})
 
 
 class Sentences(db.Model):
@@ -28,9 +42,13 @@ class Sentences(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     original_text = db.Column(db.String(200), nullable=False)
-    language_code = db.Column(db.String(5), nullable=False)
+    language_code = db.Column(LanguageCode, nullable=False)
     category = db.Column(db.String(50))
+    # normalized hash of original_text, see DataManager.sentence_hash
+    content_hash = db.Column(db.String(64), nullable=False)
     created_at = db.Column(db.Date)
+    # a user can store the same sentence only once
+    __table_args__ = (db.UniqueConstraint('user_id', 'content_hash'), {'sqlite_autoincrement': True})
 
 
 class Translations(db.Model):
@@ -39,36 +57,213 @@ class Translations(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'), nullable=False)
     translated_text = db.Column(db.String(200))
-    target_language_code = db.Column(db.String(5))
+    target_language_code = db.Column(LanguageCode)
     created_at = db.Column(db.Date)
     group_id = db.Column(db.Integer, db.ForeignKey('progress_groups.id'))
+    __table_args__ = (
+        db.Index('ix_translations_group', 'group_id'),
+        db.Index('ix_translations_sentence', 'sentence_id'),
+        {'sqlite_autoincrement': True}
+    )
 
 
-class Learning_Progress(db.Model):
-    __tablename__ = 'learning_progress'
-
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    translation_id = db.Column(db.Integer, db.ForeignKey('translations.id'), nullable=False)
-    group_id = db.Column(db.Integer, db.ForeignKey('progress_groups.id'))
-    score = db.Column(db.Integer, default=0)
-    last_reviewed = db.Column(db.Date)
-    next_review = db.Column(db.Date)
-    review_count = db.Column(db.Integer, default=0)
-    success_rate = db.Column(db.Integer, default=0)
-    # every user has for every translation only one progressdataset
-    __table_args__ = (db.UniqueConstraint('user_id', 'translation_id'),)
-
 class Progress_Groups(db.Model):
     __tablename__ = 'progress_groups'
+    # the only store of review state, a sentence's translations are learned together
     id = db.Column(db.Integer, primary_key=True)
     sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     group_score = db.Column(db.Float, default=0.0)
-    next_review = db.Column(db.Date)
-    last_reviewed = db.Column(db.DateTime)
+    next_review = db.Column(EpochDay)
+    last_reviewed = db.Column(EpochDay)
+    review_count = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # card of a subscribed deck; sentence_id stays NULL until the user edits the card
+    # and gets a copy of it, see DataManager.edit_deck_card
+    card_id = db.Column(db.Integer, db.ForeignKey('deck_cards.id'))
+    __table_args__ = (
+        # due groups in review order, see DataManager.get_due_progress_groups
+        db.Index('ix_progress_groups_due', 'user_id', 'next_review', 'group_score'),
+        # groups reviewed after a review queue was built
+        db.Index('ix_progress_groups_user_reviewed', 'user_id', 'last_reviewed'),
+        db.Index('ix_progress_groups_sentence', 'sentence_id'),
+        db.Index('ix_progress_groups_card', 'user_id', 'card_id'),
+        {'sqlite_autoincrement': True}
+    )
+
+
+class Cold_Progress_Groups(db.Model):
+    __tablename__ = 'cold_progress_groups'
+    # progress_groups rows not due for a long time, same columns. `flask tier-progress-groups`
+    # moves them here and back with their ids, so translations and attempts keep pointing at them
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    group_score = db.Column(db.Float, default=0.0)
+    next_review = db.Column(EpochDay)
+    last_reviewed = db.Column(EpochDay)
     review_count = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    card_id = db.Column(db.Integer, db.ForeignKey('deck_cards.id'))
+    __table_args__ = (
+        # rows about to become due are moved back in next_review order
+        db.Index('ix_cold_progress_groups_review', 'next_review'),
+        db.Index('ix_cold_progress_groups_card', 'user_id', 'card_id'),
+        db.Index('ix_cold_progress_groups_sentence', 'sentence_id'),
+    )
+
+
+
+
+
+class Import_Jobs(db.Model):
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # running, failed or done; failed jobs are resumed from records_done
+    status = db.Column(db.String(10), default='running')
+    records_done = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+class Import_Id_Map(db.Model):
+    __tablename__ = 'import_id_map'
+    # old id from the export -> id in this database, kept until the job is done
+    job_id = db.Column(db.Integer, db.ForeignKey('import_jobs.id'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    old_id = db.Column(db.Integer, primary_key=True)
+    # NULL marks a record that was skipped because its sentence already existed
+    new_id = db.Column(db.Integer)
+
+
+class Learning_Attempts(db.Model):
+    __tablename__ = 'learning_attempts'
+    # append-only log of every answer, written in batches by core.attempt_log
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('progress_groups.id'))
+    translation_id = db.Column(db.Integer, db.ForeignKey('translations.id'))
+    language_code = db.Column(db.String(5))
+    score = db.Column(db.Float)
+    is_success = db.Column(db.Boolean)
+    attempted_at = db.Column(db.DateTime, nullable=False)
+    # counted in attempt_rollups already, may be pruned after the retention period
+    rolled_up = db.Column(db.Boolean, nullable=False, default=False)
+    __table_args__ = (
+        db.Index('ix_learning_attempts_user', 'user_id', 'attempted_at'),
+        db.Index('ix_learning_attempts_rollup', 'rolled_up', 'attempted_at'),
+        {'sqlite_autoincrement': True}
+    )
+
+
+class Attempt_Rollups(db.Model):
+    __tablename__ = 'attempt_rollups'
+    # daily aggregates of learning_attempts per user and language
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    language_code = db.Column(db.String(5), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    successes = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', 'language_code'), {'sqlite_autoincrement': True})
+
+
+class Background_Jobs(db.Model):
+    __tablename__ = 'background_jobs'
+    # work handed to core.async_runner by requests answered with 202, on the primary
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    kind = db.Column(db.String(30), nullable=False)
+    # pending, running, done or failed
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    # JSON encoded result once done
+    result = db.Column(db.Text)
+    error = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Review_Queues(db.Model):
+    __tablename__ = 'review_queues'
+    # a user's due groups for one day in review order, built off-peak by `flask build-review-queues`
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    # comma separated progress group ids
+    group_ids = db.Column(db.Text, nullable=False, default='')
+    # groups with a higher id were created after the build
+    max_group_id = db.Column(db.Integer, nullable=False, default=0)
+    built_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.UniqueConstraint('user_id', 'day'), {'sqlite_autoincrement': True})
+
+
+class Idempotency_Keys(db.Model):
+    __tablename__ = 'idempotency_keys'
+    # responses of POST /api/sentences by the client's Idempotency-Key, on the primary
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # sha256 of the request the key was first used with
+    request_hash = db.Column(db.String(64), nullable=False)
+    # None while the first request is in flight
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    location = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key'),
+        db.Index('ix_idempotency_keys_expires', 'expires_at'),
+        {'sqlite_autoincrement': True}
+    )
 
 
+class Decks(db.Model):
+    __tablename__ = 'decks'
+    # a published set of cards, stored once on the primary and read by every subscriber
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    language_code = db.Column(LanguageCode, nullable=False)
+    card_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.Date)
+
+
+class Deck_Cards(db.Model):
+    __tablename__ = 'deck_cards'
+    # the sentences of a deck, copied from the owner's when it was published
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id'), nullable=False)
+    original_text = db.Column(db.String(200), nullable=False)
+    language_code = db.Column(LanguageCode, nullable=False)
+    category = db.Column(db.String(50))
+    created_at = db.Column(db.Date)
+    # subscribers are handed the cards in id order, see DataManager.introduce_deck_cards
+    __table_args__ = (db.Index('ix_deck_cards_deck', 'deck_id', 'id'), {'sqlite_autoincrement': True})
+
 
+class Deck_Translations(db.Model):
+    __tablename__ = 'deck_translations'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    card_id = db.Column(db.Integer, db.ForeignKey('deck_cards.id'), nullable=False)
+    translated_text = db.Column(db.String(200))
+    target_language_code = db.Column(LanguageCode)
+    created_at = db.Column(db.Date)
+    __table_args__ = (db.Index('ix_deck_translations_card', 'card_id'), {'sqlite_autoincrement': True})
+
+
+class Deck_Subscriptions(db.Model):
+    __tablename__ = 'deck_subscriptions'
+    # per-user like progress_groups, the deck itself stays on the primary
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    deck_id = db.Column(db.Integer, db.ForeignKey('decks.id'), nullable=False)
+    # cards of the deck with a lower id already have a progress group
+    next_card_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('user_id', 'deck_id'), {'sqlite_autoincrement': True})
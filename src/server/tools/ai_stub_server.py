@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the model API, for tests and benchmarks.
+
+    python -m src.server.tools.ai_stub_server --port 8089 --delay 0.5
+
+then run the app with AI_BASE_URL=http://localhost:8089 and any AI_API_KEY.
+Answers POST /v1/messages in the Anthropic response format, as server-sent
+events when the request asks for "stream": true. --fail-every N answers every
+Nth request with 529 (or --fail-status) to exercise retries, with a
+Retry-After header if --retry-after is given.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_responder(payload):
+    # answers translation prompts (see api.prompts) with fake translations,
+    # echoes everything else
+    prompt = payload['messages'][-1]['content']
+    if 'Input:\n' in prompt:
+        try:
+            request = json.loads(prompt.rsplit('Input:\n', 1)[1])
+            return json.dumps({'translations': [
+                {'sentence_id': sentence['sentence_id'], 'language': language,
+                 'text': f"[{language}] {sentence['text']}", 'confidence': 0.9}
+                for sentence in request['sentences'] for language in request['target_languages']
+            ]}, ensure_ascii=False)
+        except (ValueError, KeyError):
+            pass
+    return prompt
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # benchmarks open many connections at once
+    request_queue_size = 256
+
+    def __init__(self, address, delay=0.0, fail_every=0, responder=default_responder,
+                 chunk_size=40, chunk_delay=0.0, fail_status=529, retry_after=None):
+        super().__init__(address, StubHandler)
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.responder = responder
+        self.request_count = 0
+        # connections accepted so far, keep-alive clients reuse theirs
+        self.connection_count = 0
+        # requests being answered right now, and the most there ever were at once
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connection_count += 1
+        super().process_request(request, client_address)
+
+    def start(self):
+        # serves from a daemon thread, returns self for `server = StubServer(...).start()`
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        with self.server._count_lock:
+            self.server.request_count += 1
+            number = self.server.request_count
+            self.server.in_flight += 1
+            self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+        try:
+            self._answer(body, number)
+        finally:
+            with self.server._count_lock:
+                self.server.in_flight -= 1
+
+    def _answer(self, body, number):
+        if self.path.rstrip('/') != '/v1/messages':
+            return self._send(404, {'type': 'error', 'error': {'type': 'not_found_error'}})
+        if self.server.fail_every and number % self.server.fail_every == 0:
+            headers = {'retry-after': str(self.server.retry_after)} if self.server.retry_after is not None else {}
+            return self._send(self.server.fail_status, {'type': 'error', 'error': {'type': 'overloaded_error'}},
+                              headers)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        payload = json.loads(body)
+        text = self.server.responder(payload)
+        message = {
+            'id': f'msg_stub_{number}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': payload.get('model'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'usage': {'input_tokens': len(body) // 4, 'output_tokens': len(text) // 4},
+        }
+        if payload.get('stream'):
+            return self._send_stream(message, text)
+        self._send(200, message)
+
+    def _send_stream(self, message, text):
+        self.send_response(200)
+        self.send_header('content-type', 'text/event-stream')
+        self.send_header('transfer-encoding', 'chunked')
+        self.end_headers()
+        self._event('message_start', {'message': dict(message, content=[], stop_reason=None)})
+        self._event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        size = self.server.chunk_size
+        for start in range(0, len(text), size):
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            self._event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta',
+                                                                      'text': text[start:start + size]}})
+        self._event('content_block_stop', {'index': 0})
+        self._event('message_delta', {'delta': {'stop_reason': 'end_turn'}, 'usage': message['usage']})
+        self._event('message_stop', {})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _event(self, name, data):
+        chunk = f"event: {name}\ndata: {json.dumps(dict(data, type=name))}\n\n".encode('utf-8')
+        self.wfile.write(f'{len(chunk):x}\r\n'.encode('ascii') + chunk + b'\r\n')
+        self.wfile.flush()
+
+    def _send(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before each answer')
+    parser.add_argument('--fail-every', type=int, default=0)
+    parser.add_argument('--fail-status', type=int, default=529, help='status of the failed requests')
+    parser.add_argument('--retry-after', help='Retry-After header of the failed requests')
+    parser.add_argument('--chunk-size', type=int, default=40, help='characters per streamed delta')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between streamed deltas')
+    args = parser.parse_args()
+    server = StubServer((args.host, args.port), args.delay, args.fail_every,
+                        chunk_size=args.chunk_size, chunk_delay=args.chunk_delay,
+                        fail_status=args.fail_status, retry_after=args.retry_after)
+    print(f"Model API stub listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark for model-bound requests on a single WSGI worker thread.
+
+    python -m src.server.tools.async_benchmark --requests 50 --delay 0.5
+
+Starts the model API stub with the given answer delay and the app on a
+single-threaded WSGI server, then posts --requests sentences concurrently:
+once waiting for the translations in the view, once with
+Prefer: respond-async so the model calls run on the async runner. Prints the
+time until every translation is stored and the peak number of model calls
+in flight at the stub.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+
+from src.server.app import create_app
+from src.server.tools.ai_stub_server import StubServer
+
+LANGUAGES = ('en', 'fr', 'es')
+
+
+def post_sentence(base_url, user_id, text, respond_async):
+    data = urllib.parse.urlencode({'user_id': user_id, 'original_text': text, 'category': 'bench'}).encode()
+    req = urllib.request.Request(base_url + '/api/sentences', data=data)
+    if respond_async:
+        req.add_header('Prefer', 'respond-async')
+    with urllib.request.urlopen(req, timeout=600) as response:
+        return response.status, response.headers.get('Location')
+
+
+def wait_for_job(base_url, location):
+    while True:
+        with urllib.request.urlopen(base_url + location, timeout=60) as response:
+            job = json.loads(response.read())
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+
+
+def run(mode, stub, args, workdir):
+    respond_async = mode == 'async'
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'{mode}.db'),
+        'AI_API_KEY': 'benchmark',
+        'AI_BASE_URL': stub.url,
+        # the stub has no quota, the benchmark measures concurrency only
+        'AI_REQUESTS_PER_MINUTE': 1000000,
+        'AI_INPUT_TOKENS_PER_MINUTE': 1000000000,
+        'AI_ASYNC_MAX_CONNECTIONS': args.requests,
+        # every request comes from one user and arrives at once, admission would turn most away
+        'ADMISSION_LIMITS': {'api.add_sentence': None},
+        'ADMISSION_MAX_CONCURRENT': 0,
+    })
+    with app.app_context():
+        user = app.manager.create_user(f'bench_{mode}', 'de')
+        for language in LANGUAGES:
+            app.manager.add_target_language(user.id, language)
+        user_id = user.id
+
+    # threaded=False: one thread serves every request
+    server = make_server('127.0.0.1', 0, app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    stub.peak_in_flight = 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.requests) as pool:
+        responses = list(pool.map(lambda i: post_sentence(base_url, user_id, f'Satz {mode} {i}', respond_async),
+                                  range(args.requests)))
+        answered = time.perf_counter() - started
+        if respond_async:
+            jobs = list(pool.map(lambda r: wait_for_job(base_url, r[1]), responses))
+            failed = sum(1 for job in jobs if job['status'] != 'done')
+        else:
+            failed = sum(1 for status, _ in responses if status != 201)
+    finished = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"{mode:>5}: {args.requests} requests answered in {answered:6.2f}s, "
+          f"translated in {finished:6.2f}s, peak model calls in flight {stub.peak_in_flight:4d}, "
+          f"failed {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.5, help='seconds the stub takes per model call')
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    stub = StubServer(('127.0.0.1', 0), delay=args.delay).start()
+    print(f"1 WSGI worker thread, model calls take {args.delay}s")
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in ('sync', 'async'):
+            if args.mode in (mode, 'both'):
+                run(mode, stub, args, workdir)
+
+
+if __name__ == '__main__':
+    main()
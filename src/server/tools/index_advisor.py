@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Access path check for every query DataManager issues.
+
+    python -m src.server.tools.index_advisor
+    python -m src.server.tools.index_advisor --users 50 --verbose
+
+Seeds a temporary sharded database through DataManager, calls every public
+method, captures the SQL each one sends, and runs it again under
+EXPLAIN QUERY PLAN. Full table scans and temp B-tree sorts are reported with
+the method that caused them and a suggested (covering) index.
+
+Exits with status 1 when a query scans one of GUARDED_TABLES without being
+listed in ALLOWED_SCANS, or when a public method is not exercised here, so a
+new method has to be added to exercise() and pass before it ships.
+"""
+import argparse
+import functools
+import inspect
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from src.server.app import create_app
+from src.server.data_manager import DataManager
+from src.server.extensions import db
+
+# tables whose scans grow with every user's deck
+GUARDED_TABLES = ('sentences', 'translations', 'progress_groups')
+# (method, table) scans that are the point of the method
+ALLOWED_SCANS = {
+    # counts the sentences of every user on a shard
+    ('get_shard_loads', 'sentences'),
+}
+# public methods that issue no SQL of their own
+EXEMPT_METHODS = {'init_app'}
+PLAN_SCAN = re.compile(r'^SCAN (\w+)')
+PLAN_SORT = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+
+
+class Recorder:
+    # the SQL of every DataManager call, attributed to the outermost method
+    def __init__(self):
+        self.method = None
+        self.called = set()
+        # (bind key, statement) -> [parameters, methods]
+        self.statements = {}
+
+    def listen(self, bind_key, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            verb = statement.lstrip()[:6].upper()
+            if self.method is None or verb not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+                return
+            if verb == 'INSERT' and ' SELECT ' not in ' '.join(statement.split()).upper():
+                # plain VALUES inserts have no access path to check
+                return
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            entry = self.statements.setdefault((bind_key, statement), [parameters, set()])
+            entry[1].add(self.method)
+
+    def wrap(self, manager):
+        for name, method in inspect.getmembers(manager, inspect.ismethod):
+            if not name.startswith('_'):
+                setattr(manager, name, self._traced(name, method))
+
+    def _traced(self, name, method):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            with self._calling(name):
+                result = method(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return self._traced_generator(name, result)
+            return result
+        return traced
+
+    def _traced_generator(self, name, generator):
+        # generators run their queries while they are consumed
+        while True:
+            with self._calling(name):
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _calling(self, name):
+        recorder = self
+
+        class Calling:
+            def __enter__(self):
+                recorder.called.add(name)
+                self.outer = recorder.method is None
+                if self.outer:
+                    recorder.method = name
+
+            def __exit__(self, *exc):
+                if self.outer:
+                    recorder.method = None
+        return Calling()
+
+
+def seed(manager, users, sentences):
+    # users with decks in two target languages, partly reviewed, on both shards
+    user_ids = []
+    for index in range(users):
+        user = manager.create_user(f'advisor{index:04d}', 'de')
+        user_ids.append(user.id)
+        for language in ('en', 'fr'):
+            manager.add_target_language(user.id, language)
+        items = [(f'Satz {index} {number}', 'Alltag,Arbeit' if number % 3 else 'Essen')
+                 for number in range(sentences)]
+        for sentence, _ in manager.create_sentences(user.id, items):
+            group = manager.create_progress_group(sentence.id, user.id)
+            for language in ('en', 'fr'):
+                manager.create_translation(sentence.id, f'{language}: {sentence.original_text}', language, group.id)
+            if sentence.id % 4 == 0:
+                manager.update_progress_group(group.id, 50.0, sentence.id % 8 == 0)
+    manager.insert_attempts([{
+        'user_id': user_id, 'group_id': None, 'translation_id': None, 'language_code': 'en',
+        'score': 90.0, 'is_success': True, 'attempted_at': datetime.utcnow() - timedelta(days=day)
+    } for user_id in user_ids for day in range(3)])
+    return user_ids
+
+
+def exercise(manager, user_ids):
+    # one call of every public method; the seeding covered the create methods
+    today = datetime.utcnow()
+    user_id = user_ids[0]
+    manager.get_user_by_id(user_id)
+    manager.get_user_by_username('advisor0000')
+    manager.get_users_page(50, 'advisor0001', 'advisor')
+    list(manager.iter_users('advisor'))
+    manager.estimate_user_count()
+    manager.estimate_user_count('advisor')
+    manager.get_user_languages(user_id)
+    manager.get_user_categories(user_id)
+    manager.create_sentence(user_id, 'Satz 0 0', 'Alltag', on_duplicate='merge')
+    manager.get_sentences_for_user(user_id)
+    manager.get_sentences_by_category(user_id, 'Arbeit')
+
+    due = manager.get_due_progress_groups(user_id, 20)
+    manager.get_due_progress_groups(user_id, 20, (due[-1].next_review, due[-1].group_score or 0.0, due[-1].id))
+    manager.get_review_cards(user_id, due)
+    group = due[0]
+    manager.get_progress_group(group.id)
+    manager.get_group_for_sentence(group.sentence_id)
+    translations = manager.get_translations_for_group(group.id)
+    manager.get_translations_by_group(group.id)
+    manager.get_translations_by_sentence(group.sentence_id)
+    manager.get_translation(translations[0].id)
+    manager.update_progress_group(group.id, 100.0, True)
+    manager.get_learning_stats(user_id)
+
+    # everything reviewed goes cold, then comes back through reads and the warm pass
+    group_id, sentence_id = group.id, due[1].sentence_id
+    manager.tier_progress_groups(today.date(), today.date() - timedelta(days=1))
+    manager.get_learning_stats(user_id)
+    manager.get_progress_group(group_id)
+    manager.get_group_for_sentence(sentence_id)
+    manager.tier_progress_groups(today.date() + timedelta(days=365), today.date() + timedelta(days=365))
+
+    manager.build_review_queues(today.date(), today - timedelta(days=14))
+    # served from the queue this time
+    manager.get_due_progress_groups(user_id, 20)
+    manager.rollup_attempts(today.replace(hour=0, minute=0, second=0, microsecond=0), today - timedelta(days=90))
+    manager.get_daily_attempt_stats(user_id, today.date() - timedelta(days=30))
+
+    # user_ids[2] follows a deck of user_id's sentences
+    deck = manager.publish_deck(user_id, 'advisor')
+    manager.get_deck(deck.id)
+    manager.subscribe_deck(user_ids[2], deck.id)
+    manager.introduce_deck_cards(user_ids[2], 10)
+    shared = manager.get_due_progress_groups(user_ids[2], 100)
+    cards = manager.get_review_cards(user_ids[2], shared)
+    manager.get_deck_card(shared[-1].card_id)
+    manager.get_deck_translation(cards[-1][2][0].id)
+    manager.edit_deck_card(user_ids[2], shared[-1].card_id, 'Geteilter Satz', {'en': 'shared sentence'})
+
+    job = manager.create_job('advisor', user_id)
+    manager.update_job(job.id, 'done', {'ok': True})
+    manager.get_job(job.id)
+    entry, _ = manager.claim_idempotency_key(user_id, 'advisor', 'hash', 60, 60)
+    manager.complete_idempotency_key(entry.id, 201, '{}')
+    manager.claim_idempotency_key(user_id, 'advisor', 'hash', 60, 60)
+    manager.get_idempotency_key(user_id, 'advisor')
+    manager.release_idempotency_key(entry.id)
+    manager.purge_idempotency_keys()
+
+    # export one user into another through the import pipeline
+    target = user_ids[1]
+    manager.delete_sentence(manager.get_sentences_for_user(target)[0].id)
+    import_job = manager.get_or_create_import_job(target)
+    manager.import_user_records(import_job, list(manager.iter_user_export(user_id)))
+
+    manager.get_shard_loads()
+    manager.move_user(user_id, 1 - manager._shard_of_user(user_id))
+    manager.delete_user(user_ids[-1])
+
+
+def explain(bind_key, statement, parameters):
+    connection = db.engines[bind_key].raw_connection()
+    try:
+        return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    finally:
+        connection.close()
+
+
+def suggest_index(statement, table, order_only=False):
+    # equality columns first, then ranges, then the ORDER BY columns, then the other
+    # selected columns of the table if that keeps the index small enough to cover
+    statement = ' '.join(statement.split())
+    qualified = rf'\b{table}\.(\w+)'
+    where = statement.split(' WHERE ', 1)[1] if ' WHERE ' in statement else ''
+    where = re.split(r' ORDER BY | GROUP BY | LIMIT ', where)[0]
+    order = statement.split(' ORDER BY ', 1)[1] if ' ORDER BY ' in statement else ''
+    columns = []
+
+    def add(names):
+        for name in names:
+            if name not in columns:
+                columns.append(name)
+
+    add(re.findall(qualified + r'\s*(?:=|IN\b|IS\b)', where))
+    if not order_only:
+        add(re.findall(qualified + r'\s*(?:<|>|LIKE\b|BETWEEN\b)', where))
+    add(re.findall(qualified, order))
+    if not columns or columns == ['id']:
+        # the primary key is there already
+        return None
+    selected = re.findall(qualified, statement.split(' FROM ', 1)[0])
+    if len(set(columns) | set(selected)) <= 5:
+        add(selected)
+    return f"CREATE INDEX ix_{table}_{'_'.join(columns[:3])} ON {table} ({', '.join(columns)})"
+
+
+def analyze(recorder):
+    # -> list of (severity, method(s), table, plan line, statement, suggestion)
+    findings = []
+    for (bind_key, statement), (parameters, methods) in recorder.statements.items():
+        try:
+            plan = explain(bind_key, statement, parameters)
+        except Exception as e:
+            findings.append(('error', methods, None, str(e), statement, None))
+            continue
+        for line in plan:
+            scan = PLAN_SCAN.match(line)
+            if scan and scan.group(1) in db.metadata.tables:
+                table = scan.group(1)
+                guarded = table in GUARDED_TABLES and any((m, table) not in ALLOWED_SCANS for m in methods)
+                findings.append(('fail' if guarded else 'scan', methods, table, line, statement,
+                                 suggest_index(statement, table)))
+            sort = PLAN_SORT.match(line)
+            if sort:
+                tables = [t for t in re.findall(r'\bFROM (\w+)', statement) if t in db.metadata.tables]
+                findings.append(('sort', methods, tables[0] if tables else None, line, statement,
+                                 suggest_index(statement, tables[0], order_only=True) if tables else None))
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=6)
+    parser.add_argument('--sentences', type=int, default=40, help='sentences per user')
+    parser.add_argument('--verbose', action='store_true', help='also print the SQL of each finding')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='index-advisor-')
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'primary.db'),
+            'DB_SHARD_URIS': ['sqlite:///' + os.path.join(workdir, f'shard{i}.db') for i in range(2)],
+            'AI_API_KEY': None,
+        })
+        recorder = Recorder()
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                recorder.listen(bind_key, engine)
+            manager = app.manager
+            recorder.wrap(manager)
+            user_ids = seed(manager, args.users, args.sentences)
+            exercise(manager, user_ids)
+            findings = analyze(recorder)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    public = {name for name, _ in inspect.getmembers(DataManager, inspect.isfunction) if not name.startswith('_')}
+    missing = sorted(public - recorder.called - EXEMPT_METHODS)
+    print(f"{len(recorder.statements)} distinct statements from {len(recorder.called)} methods")
+    for severity, methods, table, line, statement, suggestion in sorted(
+            findings, key=lambda f: (f[0] != 'fail', f[0], sorted(f[1]))):
+        print(f"[{severity}] {', '.join(sorted(methods))}: {line}")
+        if suggestion:
+            print(f"    suggest: {suggestion}")
+        if args.verbose or severity in ('fail', 'error'):
+            print(f"    {statement}")
+    for name in missing:
+        print(f"[fail] {name}: not exercised, add it to index_advisor.exercise()")
+
+    failed = missing or any(f[0] in ('fail', 'error') for f in findings)
+    print("FAILED" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
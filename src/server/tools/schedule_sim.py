@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Offline simulation of review scheduling algorithms.
+
+    python -m src.server.tools.schedule_sim --learners 1000 --cards 500 --days 365
+    python -m src.server.tools.schedule_sim --algorithms current,sm2 --csv out.csv
+
+Synthetic learners work through their decks for a simulated year. Memory is
+modelled as exponential forgetting, recall probability exp(-elapsed / S), where
+the stability S grows with every successful review, faster for able learners
+and easy cards, and drops after a lapse. Learners skip days, introduce a fixed
+number of new cards per day and review at most --daily-cap cards; everything
+due beyond that is backlog. All cards are simulated at once with NumPy.
+
+Prints daily review load, backlog and retention per algorithm (--csv writes
+every day). "current" is core.scheduling.next_interval, the logic the server
+uses; its vectorized copy here is checked against it before every run.
+"""
+import argparse
+import csv
+import time
+import numpy as np
+
+from src.server.core.scheduling import next_interval
+
+
+# algorithm(review_count, success, previous_interval) -> next interval in days;
+# review_count includes the current review
+def current(review_count, success, interval):
+    return np.where(success, np.maximum(1, review_count * 2), 1)
+
+
+def sm2(review_count, success, interval):
+    # fixed-ease SM-2: 1, 6, then x2.5, back to 1 day after a lapse
+    grown = np.where(review_count == 1, 1, np.where(review_count == 2, 6, np.ceil(interval * 2.5)))
+    return np.where(success, grown, 1)
+
+
+def doubling(review_count, success, interval):
+    # doubles the previous interval, halves it after a lapse
+    return np.where(success, np.maximum(1, interval * 2), np.maximum(1, interval // 2))
+
+
+ALGORITHMS = {'current': current, 'sm2': sm2, 'doubling': doubling}
+
+
+def check_current():
+    # the vectorized copy has to schedule exactly like the server
+    counts = np.repeat(np.arange(1, 200), 2)
+    success = np.tile([True, False], 199)
+    expected = [next_interval(int(c), bool(s)) for c, s in zip(counts, success)]
+    if not np.array_equal(current(counts, success, np.ones_like(counts)), expected):
+        raise SystemExit("schedule_sim.current no longer matches core.scheduling.next_interval")
+
+
+def simulate(algorithm, learners=1000, cards=500, days=365, new_per_day=10, daily_cap=200,
+             active_rate=0.85, seed=0, retention_every=7):
+    # returns a dict of per-day arrays; retention is measured every retention_every days
+    # (NaN in between), it is the most expensive number
+    rng = np.random.default_rng(seed)
+    total = learners * cards
+    # cards are stored learner by learner
+    learner = np.repeat(np.arange(learners), cards)
+    ability = rng.lognormal(0.0, 0.3, learners)[learner]
+    ease = rng.lognormal(0.0, 0.4, total)
+    intro_day = np.tile(np.arange(cards) // new_per_day, learners)
+
+    # stability right after learning a card, also the floor after a lapse since the
+    # learner sees the answer again
+    learned = 2.0 * ability
+    stability = learned.copy()
+    last_review = np.zeros(total, dtype=np.int64)
+    due_day = intro_day.astype(np.int64)
+    review_count = np.zeros(total, dtype=np.int64)
+    interval = np.zeros(total, dtype=np.int64)
+
+    result = {name: np.zeros(days) for name in
+              ('reviews', 'new', 'successes', 'backlog', 'retention', 'max_interval')}
+    for day in range(days):
+        active = rng.random(learners) < active_rate
+        # due_day starts at intro_day, so this only includes introduced cards
+        pending = due_day <= day
+        due = np.flatnonzero(pending & np.repeat(active, cards))
+
+        # at most daily_cap reviews per learner, in deck order; due is sorted by learner
+        owners = learner[due]
+        starts = np.searchsorted(owners, owners, side='left')
+        reviewed = due[np.arange(len(due)) - starts < daily_cap]
+
+        s = stability[reviewed]
+        counts = review_count[reviewed] + 1
+        first = counts == 1
+        recall = np.where(first, 1.0, np.exp((last_review[reviewed] - day) / s))
+        success = rng.random(len(reviewed)) < recall
+
+        # growth slows down as memories get stable
+        growth = 1.0 + 2.0 * ability[reviewed] * ease[reviewed] * np.exp(-0.05 * np.sqrt(s))
+        stability[reviewed] = np.where(success, s * growth, np.maximum(learned[reviewed], s * 0.5))
+        review_count[reviewed] = counts
+        days_until = algorithm(counts, success, interval[reviewed])
+        interval[reviewed] = days_until
+        due_day[reviewed] = day + days_until
+        last_review[reviewed] = day
+
+        result['reviews'][day] = len(reviewed)
+        result['new'][day] = np.count_nonzero(first)
+        result['successes'][day] = np.count_nonzero(success & ~first)
+        pending[reviewed] = False
+        result['backlog'][day] = np.count_nonzero(pending)
+        result['max_interval'][day] = days_until.max() if len(reviewed) else 0
+        if day % retention_every == 0 or day == days - 1:
+            seen = review_count > 0
+            result['retention'][day] = np.exp((last_review[seen] - day) / stability[seen]).mean() if seen.any() else 1.0
+        else:
+            result['retention'][day] = np.nan
+    return result
+
+
+def summarize(name, result, seconds):
+    repeats = result['reviews'] - result['new']
+    success_rate = result['successes'].sum() / max(repeats.sum(), 1)
+    return (f"{name:>9} | {result['reviews'].mean():9.0f} {result['reviews'].max():9.0f} "
+            f"{result['backlog'][-1]:9.0f} {result['backlog'].max():9.0f} "
+            f"{success_rate:8.1%} {result['retention'][-1]:9.1%} {result['max_interval'].max():7.0f} "
+            f"{seconds:6.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS),
+                        help=f"comma separated, from: {', '.join(ALGORITHMS)}")
+    parser.add_argument('--learners', type=int, default=1000)
+    parser.add_argument('--cards', type=int, default=500, help='cards per learner')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--new-per-day', type=int, default=10)
+    parser.add_argument('--daily-cap', type=int, default=200, help='reviews per learner and day')
+    parser.add_argument('--active-rate', type=float, default=0.85, help='chance a learner studies on a day')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='write the daily numbers of every algorithm to this file')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.algorithms.split(',') if name.strip()]
+    unknown = set(names) - set(ALGORITHMS)
+    if unknown:
+        parser.error(f"unknown algorithm(s): {', '.join(sorted(unknown))}")
+    check_current()
+
+    print(f"{args.learners} learners x {args.cards} cards, {args.days} days")
+    print(f"{'algorithm':>9} | {'reviews/d':>9} {'peak/d':>9} {'backlog':>9} {'peak blg':>9} "
+          f"{'success':>8} {'retention':>9} {'max int':>7} {'time':>7}")
+    results = {}
+    for name in names:
+        started = time.perf_counter()
+        results[name] = simulate(ALGORITHMS[name], args.learners, args.cards, args.days, args.new_per_day,
+                                 args.daily_cap, args.active_rate, args.seed)
+        print(summarize(name, results[name], time.perf_counter() - started))
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['algorithm', 'day', *results[names[0]]])
+            for name, result in results.items():
+                for day in range(args.days):
+                    writer.writerow([name, day, *(result[column][day] for column in result)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Per-call overhead of the hot DataManager reads.
+
+    python -m src.server.tools.statement_benchmark --calls 5000
+
+Seeds a temporary database with one user's deck and times each hot read
+twice: built as a Query on every call, the way DataManager used to, and
+through the statement built once in data_manager (see _DUE_GROUPS and
+friends). Both run the same SQL against the same rows, so the difference is
+the cost of building the query and computing its cache key. Language lists
+are also timed through the user cache, which skips SQL altogether.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+
+from src.server.app import create_app
+from src.server.extensions import db
+from src.server.models.data_models import Progress_Groups, Translations, User_Languages
+
+
+def seed(manager, sentences):
+    user = manager.create_user('benchmark', 'de')
+    for language in ('en', 'fr', 'es'):
+        manager.add_target_language(user.id, language)
+    today = datetime.utcnow().date()
+    group_id = None
+    for number, (sentence, _) in enumerate(manager.create_sentences(
+            user.id, [(f'Satz {number}', 'Alltag') for number in range(sentences)])):
+        group = manager.create_progress_group(sentence.id, user.id)
+        group.next_review = today - timedelta(days=number % 30)
+        group_id = group.id
+        for language in ('en', 'fr', 'es'):
+            manager.create_translation(sentence.id, f'{language}: {sentence.original_text}', language, group.id)
+    return user.id, group_id
+
+
+def query_builders(session, user_id, group_id):
+    # the former Query based implementations
+    today = datetime.utcnow().date()
+    order = (Progress_Groups.next_review, Progress_Groups.group_score, Progress_Groups.id)
+    return {
+        'get_due_progress_groups': lambda: session.query(Progress_Groups).filter(
+            and_(Progress_Groups.user_id == user_id, Progress_Groups.next_review <= today)
+        ).order_by(*order).limit(20).all(),
+        'get_translations_for_group': lambda: session.query(Translations).filter_by(group_id=group_id).all(),
+        'get_user_languages': lambda: session.query(User_Languages).filter_by(user_id=user_id)
+                                             .order_by(User_Languages.id).all(),
+    }
+
+
+def timed(func, calls):
+    for _ in range(min(calls, 200)):
+        func()
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=5000, help='calls per variant')
+    parser.add_argument('--sentences', type=int, default=200, help='sentences in the seeded deck')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='statement-benchmark-')
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+                          'USER_CACHE_PATH': os.path.join(workdir, 'user-cache')})
+        with app.app_context():
+            manager = app.manager
+            user_id, group_id = seed(manager, args.sentences)
+            builders = query_builders(db.session, user_id, group_id)
+            cache = manager.user_cache
+            statements = {
+                'get_due_progress_groups': lambda: manager.get_due_progress_groups(user_id, 20),
+                'get_translations_for_group': lambda: manager.get_translations_for_group(group_id),
+                # without the cache, so the statement itself is measured
+                'get_user_languages': lambda: manager.get_user_languages(user_id),
+            }
+            print(f"{'query':<28} {'Query/call':>11} {'statement':>11} {'speedup':>8}")
+            for name, build in builders.items():
+                if name == 'get_user_languages':
+                    manager.user_cache = None
+                before, after = timed(build, args.calls), timed(statements[name], args.calls)
+                manager.user_cache = cache
+                print(f"{name:<28} {before:9.1f}us {after:9.1f}us {before / after:7.1f}x")
+            cached = timed(statements['get_user_languages'], args.calls)
+            print(f"{'get_user_languages, cached':<28} {'':>11} {cached:9.1f}us")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import pytest
+
+from src.server.app import create_app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # an app on fresh sqlite files in tmp_path; shards=N adds N user shards
+    def make(shards=0, **config):
+        config = dict({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/primary.db',
+            'USER_CACHE_PATH': str(tmp_path / 'user-cache'),
+            'AI_API_KEY': None,
+            'DB_SHARD_URIS': [f'sqlite:///{tmp_path}/shard{i}.db' for i in range(shards)],
+        }, **config)
+        return create_app(config)
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(client, username='anna', native_language='de', languages=('en',)):
+    response = client.post('/api/users', data={'username': username, 'native_language': native_language})
+    assert response.status_code == 201, response.get_json()
+    user_id = response.get_json()['id']
+    for language in languages:
+        assert client.post(f'/api/users/{user_id}/languages/{language}').status_code == 201
+    return user_id
+
+
+def add_sentence(client, user_id, text, category='Alltag', **headers):
+    return client.post('/api/sentences', data={'user_id': user_id, 'original_text': text, 'category': category},
+                       headers=headers)
@@ -0,0 +1,66 @@
+from src.server.core.config import Config
+from tests.conftest import add_sentence, create_user
+
+
+def test_over_rate_is_answered_with_429(make_app):
+    app = make_app(ADMISSION_LIMITS={'api.add_sentence': {'rate': 0.001, 'burst': 2}})
+    client = app.test_client()
+    anna, ben = create_user(client, 'anna'), create_user(client, 'ben')
+
+    statuses = [add_sentence(client, anna, f'Satz {i}').status_code for i in range(2)]
+    rejected = add_sentence(client, anna, 'Satz 2')
+
+    assert statuses == [201, 201]
+    assert rejected.status_code == 429
+    assert int(rejected.headers['Retry-After']) >= 1
+    # buckets are per user
+    assert add_sentence(client, ben, 'Satz 0').status_code == 201
+
+
+def test_limit_overrides_keep_the_other_endpoints(make_app):
+    app = make_app(ADMISSION_LIMITS={'api.add_sentence': {'rate': 1, 'burst': 5}, 'api.export_user': None})
+    assert app.admission.limits['api.add_sentence'] == {'rate': 1, 'burst': 5}
+    assert 'api.export_user' not in app.admission.limits
+    assert app.admission.limits['api.add_sentences_bulk'] == Config.ADMISSION_LIMITS['api.add_sentences_bulk']
+
+
+def test_bulk_larger_than_the_burst_is_refused(make_app):
+    app = make_app(ADMISSION_LIMITS={'api.add_sentences_bulk': {'rate': 1, 'burst': 3}})
+    client = app.test_client()
+    user_id = create_user(client)
+    response = client.post('/api/sentences/bulk', json={
+        'user_id': user_id, 'sentences': [{'original_text': f'Satz {i}'} for i in range(4)]})
+    assert response.status_code == 413
+
+
+def test_saturated_process_is_answered_with_503(make_app):
+    app = make_app(ADMISSION_MAX_CONCURRENT=1)
+    client = app.test_client()
+    user_id = create_user(client)
+    # another request of the same process is still running
+    app.admission.in_flight = 1
+
+    busy = add_sentence(client, user_id, 'Satz')
+
+    assert busy.status_code == 503
+    assert busy.headers['Retry-After'] == '1'
+    # endpoints without a limit are not counted
+    assert client.get(f'/api/sentences/{user_id}').status_code == 200
+    app.admission.in_flight = 0
+    assert add_sentence(client, user_id, 'Satz').status_code == 201
+    assert app.admission.in_flight == 0
+
+
+def test_503_does_not_use_up_tokens(make_app):
+    app = make_app(ADMISSION_MAX_CONCURRENT=1, ADMISSION_LIMITS={'api.add_sentence': {'rate': 0.001, 'burst': 1}})
+    client = app.test_client()
+    user_id = create_user(client)
+    app.admission.in_flight = 1
+
+    assert add_sentence(client, user_id, 'Satz 0').status_code == 503
+
+    app.admission.in_flight = 0
+    assert add_sentence(client, user_id, 'Satz 0').status_code == 201
+    # the 429 gives its slot back
+    assert add_sentence(client, user_id, 'Satz 1').status_code == 429
+    assert app.admission.in_flight == 0
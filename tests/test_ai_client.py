@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from src.server.core.ai_client import AIClient, AIClientError, AIStreamInterrupted, _Stream
+from src.server.core.rate_limit import TokenBucket
+from src.server.tools.ai_stub_server import StubServer
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(**options):
+        servers.append(StubServer(('127.0.0.1', 0), **options).start())
+        return servers[-1]
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(server, **options):
+    return AIClient(server.url, 'test-key', 'test-model', **dict({'backoff_base': 0.001}, **options))
+
+
+def test_sequential_calls_reuse_pooled_connections(make_server):
+    server = make_server()
+    client = make_client(server, pool_size=2)
+
+    answers = [client.complete(f'Satz {i}') for i in range(10)]
+
+    assert answers == [f'Satz {i}' for i in range(10)]
+    assert server.request_count == 10
+    assert server.connection_count <= 2
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retry_after_is_honoured(make_server, status):
+    server = make_server(fail_every=2, fail_status=status, retry_after='0.2')
+    client = make_client(server)
+    assert client.complete('eins') == 'eins'
+
+    started = time.monotonic()
+    # the second request fails, the third answers
+    assert client.complete('zwei') == 'zwei'
+
+    assert server.request_count == 3
+    assert time.monotonic() - started >= 0.2
+
+
+def test_gives_up_after_max_retries(make_server):
+    server = make_server(fail_every=1, fail_status=429, retry_after='0')
+    client = make_client(server, max_retries=2)
+
+    with pytest.raises(AIClientError) as error:
+        client.complete('eins')
+
+    assert error.value.status == 429
+    assert server.request_count == 3
+
+
+def test_identical_concurrent_calls_share_one_request(make_server):
+    server = make_server(delay=0.3)
+    client = make_client(server)
+    payload = client.build_payload('gleich')
+    start = threading.Barrier(5)
+    results = []
+
+    def call():
+        start.wait()
+        results.append(client.create_message(payload))
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(results) == 5
+    assert all(result == results[0] for result in results)
+    assert server.request_count == 1
+
+
+def test_token_bucket_returns_the_wait_once_the_burst_is_spent():
+    now = [100.0]
+    bucket = TokenBucket(rate=2, capacity=3, clock=lambda: now[0])
+
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    assert bucket.try_acquire(2) == pytest.approx(1.0)
+    now[0] += 0.5
+    assert bucket.try_acquire() == 0
+
+
+def test_stream_follower_gives_up_when_the_leader_stalls():
+    stream = _Stream(timeout=0.05)
+    stream.add('a')
+    follower = stream.follow()
+    assert next(follower) == 'a'
+    with pytest.raises(AIStreamInterrupted):
+        next(follower)
+
+
+def test_stream_follower_sees_pieces_added_later():
+    stream = _Stream(timeout=5)
+    pieces = []
+    thread = threading.Thread(target=lambda: pieces.extend(stream.follow()))
+    thread.start()
+    for text in 'abc':
+        stream.add(text)
+    stream.finish()
+    thread.join(5)
+    assert pieces == ['a', 'b', 'c']
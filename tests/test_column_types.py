@@ -0,0 +1,86 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, select
+
+from src.server.core.languages import LanguageRegistry
+from src.server.extensions import db
+from src.server.models.column_types import EpochDay, LanguageCode
+from src.server.models.data_models import Decks
+from tests.conftest import add_sentence, create_user
+
+metadata = MetaData()
+samples = Table('samples', metadata,
+                Column('id', Integer, primary_key=True),
+                Column('day', EpochDay),
+                Column('language', LanguageCode))
+
+
+@pytest.fixture
+def conn(app):
+    with app.app_context():
+        engine = db.engines[None]
+        metadata.create_all(engine)
+        with engine.begin() as conn:
+            yield conn
+
+
+def test_epoch_day_round_trip_and_ranges(conn):
+    days = [date(1969, 12, 31), date(1970, 1, 1), date(2024, 2, 29), date(2038, 1, 20)]
+    conn.execute(samples.insert(), [{'id': i, 'day': day} for i, day in enumerate(days)])
+    conn.execute(samples.insert(), [{'id': 10, 'day': None}, {'id': 11, 'day': datetime(2024, 2, 29, 23, 59)}])
+
+    stored = dict(conn.execute(select(samples.c.id, samples.c.day)).all())
+    assert [stored[i] for i in range(4)] == days
+    assert stored[10] is None and stored[11] == date(2024, 2, 29)
+    # the database holds days since 1970-01-01
+    raw = conn.exec_driver_sql('SELECT day FROM samples WHERE id < 4 ORDER BY id').scalars().all()
+    assert raw == [-1, 0, 19782, 24856]
+
+    between = conn.execute(select(samples.c.day).where(
+        samples.c.day >= date(1970, 1, 1), samples.c.day < date(2038, 1, 20)).order_by(samples.c.day)).scalars()
+    assert list(between) == [date(1970, 1, 1), date(2024, 2, 29), date(2024, 2, 29)]
+
+
+def test_language_code_round_trip(app, conn):
+    app.languages.register(['en', 'pt-BR'])
+    conn.execute(samples.insert(), [{'id': 1, 'language': 'en'}, {'id': 2, 'language': 'pt-BR'},
+                                    {'id': 3, 'language': None}])
+
+    assert conn.execute(select(samples.c.language).order_by(samples.c.id)).scalars().all() == ['en', 'pt-BR', None]
+    assert conn.execute(select(samples.c.id).where(samples.c.language == 'pt-BR')).scalar() == 2
+    # the database holds the small integer key
+    assert conn.exec_driver_sql('SELECT language FROM samples WHERE id = 1').scalar() == app.languages.id_for('en')
+    # a code nobody registered matches nothing
+    assert conn.execute(select(samples.c.id).where(samples.c.language == 'xx')).all() == []
+
+
+def test_registry_picks_up_codes_registered_elsewhere(app):
+    with app.app_context():
+        other = LanguageRegistry()
+        other.reload()
+        app.languages.register(['sv'])
+
+        assert other.code_for(app.languages.id_for('sv')) == 'sv'
+        assert other.id_for('sv') == app.languages.id_for('sv')
+
+
+@pytest.mark.parametrize('code', ['toolong', '', None])
+def test_register_rejects_invalid_codes(app, code):
+    with app.app_context():
+        with pytest.raises(ValueError):
+            app.languages.register([code])
+        with pytest.raises(ValueError):
+            app.languages.id_for('toolong')
+
+
+def test_deck_language_is_stored_as_a_key(app, client):
+    user_id = create_user(client, native_language='de')
+    assert add_sentence(client, user_id, 'Guten Morgen').status_code == 201
+    response = client.post('/api/decks', json={'user_id': user_id, 'name': 'Morgens'})
+    assert response.status_code == 201, response.get_json()
+
+    with app.app_context():
+        assert db.session.execute(select(Decks.language_code)).scalar() == 'de'
+        raw = db.session.connection().exec_driver_sql('SELECT language_code FROM decks').scalar()
+        assert raw == app.languages.id_for('de')
@@ -0,0 +1,79 @@
+import pytest
+
+from tests.conftest import add_sentence, create_user
+
+
+@pytest.fixture(params=[0, 2], ids=['unsharded', 'sharded'])
+def client(request, make_app):
+    return make_app(shards=request.param).test_client()
+
+
+def publish(client, owner, texts):
+    for text in texts:
+        add_sentence(client, owner, text)
+    response = client.post('/api/decks', json={'user_id': owner, 'name': 'Alltag'})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def subscribe(client, deck_id, name):
+    user_id = create_user(client, name)
+    assert client.post(f'/api/decks/{deck_id}/subscribers', json={'user_id': user_id}).status_code == 201
+    return user_id
+
+
+def session_texts(client, user_id):
+    cards = client.get(f'/api/learn/session/{user_id}?size=50').get_json()['cards']
+    return {card['card_id']: card['sentence']['original_text'] for card in cards}
+
+
+def edit(client, deck_id, card_id, user_id, **changes):
+    return client.put(f'/api/decks/{deck_id}/cards/{card_id}', json=dict(changes, user_id=user_id))
+
+
+def test_edit_copies_the_card_for_the_editor_only(client):
+    owner = create_user(client, 'owner')
+    deck_id = publish(client, owner, ['Eins', 'Zwei'])
+    anna, ben = subscribe(client, deck_id, 'anna'), subscribe(client, deck_id, 'ben')
+    card_id = min(session_texts(client, anna))
+
+    response = edit(client, deck_id, card_id, anna, original_text='Eins!', translations={'en': 'One!'})
+
+    assert response.status_code == 200
+    copy = response.get_json()
+    assert copy['user_id'] == anna
+    assert [t['translated_text'] for t in copy['translations']] == ['One!']
+    # edited cards are the user's own sentences from now on
+    assert session_texts(client, anna) == {None: 'Eins!', card_id + 1: 'Zwei'}
+    assert session_texts(client, ben) == {card_id: 'Eins', card_id + 1: 'Zwei'}
+    assert client.get(f'/api/decks/{deck_id}').get_json()['card_count'] == 2
+    # later edits change the copy in place
+    again = edit(client, deck_id, card_id, anna, original_text='Eins?')
+    assert again.get_json()['id'] == copy['id']
+    assert [s['original_text'] for s in client.get(f'/api/sentences/{anna}').get_json()] == ['Eins?']
+
+
+def test_edit_of_a_card_whose_text_the_user_already_has(client):
+    owner = create_user(client, 'owner')
+    deck_id = publish(client, owner, ['Eins', 'Zwei'])
+    anna = subscribe(client, deck_id, 'anna')
+    own = add_sentence(client, anna, 'Eins').get_json()['id']
+    cards = {text: card_id for card_id, text in session_texts(client, anna).items()}
+
+    renamed = edit(client, deck_id, cards['Eins'], anna, original_text='Eins, neu')
+    collision = edit(client, deck_id, cards['Zwei'], anna, original_text='Eins')
+
+    assert renamed.status_code == 200
+    assert collision.status_code == 409
+    assert collision.get_json()['existing_id'] == own
+    # the failed edit left nothing behind, the card can still be edited
+    assert edit(client, deck_id, cards['Zwei'], anna, original_text='Zwei!').status_code == 200
+    assert sorted(s['original_text'] for s in client.get(f'/api/sentences/{anna}').get_json()) == [
+        'Eins', 'Eins, neu', 'Zwei!']
+
+
+def test_edit_needs_a_subscription(client):
+    owner = create_user(client, 'owner')
+    deck_id = publish(client, owner, ['Eins'])
+    stranger = create_user(client, 'stranger')
+    assert edit(client, deck_id, 1, stranger, original_text='X').status_code == 404
@@ -0,0 +1,53 @@
+from tests.conftest import add_sentence, create_user
+
+
+def test_retry_gets_the_first_response(client):
+    user_id = create_user(client)
+
+    first = add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+    retry = add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert len(client.get(f'/api/sentences/{user_id}').get_json()) == 1
+
+
+def test_key_reused_for_another_request_is_refused(client):
+    user_id = create_user(client)
+    add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+
+    response = add_sentence(client, user_id, 'Guten Abend', **{'Idempotency-Key': 'k1'})
+
+    assert response.status_code == 422
+    assert len(client.get(f'/api/sentences/{user_id}').get_json()) == 1
+
+
+def test_keys_are_per_user(client):
+    anna, ben = create_user(client, 'anna'), create_user(client, 'ben')
+    add_sentence(client, anna, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+
+    response = add_sentence(client, ben, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+
+
+def test_server_error_gives_the_key_up(app, client, monkeypatch):
+    user_id = create_user(client)
+    create_sentence = app.manager.create_sentence
+    monkeypatch.setattr(app.manager, 'create_sentence', lambda *args: 1 / 0)
+
+    failed = add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+    monkeypatch.setattr(app.manager, 'create_sentence', create_sentence)
+    retry = add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'k1'})
+
+    assert failed.status_code == 500
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+
+
+def test_invalid_key_is_refused(client):
+    user_id = create_user(client)
+    assert add_sentence(client, user_id, 'Guten Morgen', **{'Idempotency-Key': 'x' * 256}).status_code == 400
@@ -0,0 +1,129 @@
+import json
+
+from tests.conftest import add_sentence, create_user
+
+
+def export_records(client, user_id):
+    response = client.get(f'/api/users/{user_id}/export')
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def import_records(client, user_id, records, job_id=None):
+    body = ''.join(json.dumps(record) + '\n' for record in records)
+    query = f'?job_id={job_id}' if job_id else ''
+    return client.post(f'/api/users/{user_id}/import{query}', data=body, content_type='application/x-ndjson')
+
+
+def sentences_of(client, user_id):
+    return {s['original_text']: s for s in client.get(f'/api/sentences/{user_id}').get_json()}
+
+
+def test_import_remaps_ids_and_keeps_existing_sentences(client):
+    source = create_user(client, 'anna')
+    for text in ('Eins', 'Zwei', 'Drei'):
+        add_sentence(client, source, text)
+    target = create_user(client, 'ben', languages=('en', 'fr'))
+    kept = add_sentence(client, target, 'Zwei').get_json()['id']
+
+    response = import_records(client, target, export_records(client, source))
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'done'
+    sentences = sentences_of(client, target)
+    assert set(sentences) == {'Eins', 'Zwei', 'Drei'}
+    assert sentences['Zwei']['id'] == kept
+    assert {s['id'] for s in sentences.values()}.isdisjoint(
+        {s['id'] for s in sentences_of(client, source).values()})
+    # the imported copies bring their translations and progress groups along
+    dump = export_records(client, target)
+    imported = {sentences['Eins']['id'], sentences['Drei']['id']}
+    translations = [r['data'] for r in dump if r['type'] == 'translation']
+    groups = {r['data']['id']: r['data'] for r in dump if r['type'] == 'progress_group'}
+    assert imported <= {t['sentence_id'] for t in translations}
+    assert all(groups[t['group_id']]['sentence_id'] == t['sentence_id'] for t in translations)
+    assert sorted(r['data']['language_code'] for r in dump if r['type'] == 'language') == ['en', 'fr']
+
+
+def test_failed_import_resumes_after_its_last_chunk(client):
+    source = create_user(client, 'anna')
+    for text in ('Eins', 'Zwei'):
+        add_sentence(client, source, text)
+    records = export_records(client, source)
+    target = create_user(client, 'ben')
+    broken = [dict(r, data=dict(r['data'], sentence_id=999)) if r['type'] == 'translation' else r
+              for r in records]
+
+    failed = import_records(client, target, broken)
+
+    assert failed.status_code == 400
+    job = failed.get_json()
+    assert job['status'] == 'failed'
+    assert 0 < job['records_done'] < len(records)
+    # sentences and groups before the broken chunk are stored once, the resume skips them
+    resumed = import_records(client, target, records, job_id=job['job_id'])
+    assert resumed.status_code == 200
+    assert resumed.get_json() == {'job_id': job['job_id'], 'status': 'done', 'records_done': len(records)}
+    assert sorted(sentences_of(client, target)) == ['Eins', 'Zwei']
+    dump = export_records(client, target)
+    assert sum(r['type'] == 'translation' for r in dump) == 2
+    assert sum(r['type'] == 'progress_group' for r in dump) == 2
+
+
+def test_unknown_record_type_fails(client):
+    target = create_user(client)
+    response = import_records(client, target, [{'type': 'bogus', 'data': {}}])
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'failed'
+
+
+def review_every_card(app, client, user_id):
+    cards = client.get(f'/api/learn/session/{user_id}?size=50').get_json()['cards']
+    for card in cards:
+        translation = card['translations'][0]
+        response = client.post(f"/api/learn/{translation['id']}", json={'user_answer': translation['translated_text']})
+        assert response.status_code == 200
+    app.attempt_log.flush()
+    return cards
+
+
+def test_attempts_of_deleted_sentences_survive_export_and_move(make_app):
+    app = make_app(shards=2)
+    client = app.test_client()
+    source = create_user(client, 'anna')
+    doomed = add_sentence(client, source, 'Eins').get_json()['id']
+    add_sentence(client, source, 'Zwei')
+    review_every_card(app, client, source)
+
+    assert client.delete(f'/api/sentences/{doomed}').status_code == 200
+
+    records = export_records(client, source)
+    attempts = [r['data'] for r in records if r['type'] == 'attempt']
+    assert len(attempts) == 2
+    assert sum(a['group_id'] is None and a['translation_id'] is None for a in attempts) == 1
+    target = create_user(client, 'ben')
+    response = import_records(client, target, records)
+    assert response.status_code == 200, response.get_json()
+    assert len([r for r in export_records(client, target) if r['type'] == 'attempt']) == 2
+    with app.app_context():
+        shard = app.manager.get_user_by_id(source).shard
+    result = app.test_cli_runner().invoke(args=['move-user', str(source), str(1 - shard)])
+    assert result.exit_code == 0, result.output
+    assert sorted(sentences_of(client, source)) == ['Zwei']
+
+
+def test_import_tolerates_attempts_with_dangling_references(client):
+    source = create_user(client, 'anna')
+    add_sentence(client, source, 'Eins')
+    records = export_records(client, source)
+    # written by an older version that kept attempts of deleted sentences
+    records.append({'type': 'attempt', 'data': {
+        'id': 1, 'group_id': 999, 'translation_id': 999, 'language_code': 'en', 'score': 80.0,
+        'is_success': True, 'attempted_at': '2026-01-02T10:00:00', 'rolled_up': False}})
+    target = create_user(client, 'ben')
+
+    response = import_records(client, target, records)
+
+    assert response.status_code == 200, response.get_json()
+    attempt = [r['data'] for r in export_records(client, target) if r['type'] == 'attempt'][0]
+    assert (attempt['group_id'], attempt['translation_id']) == (None, None)
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from src.server.api.prompts import TranslationStreamParser, iter_translations
+from src.server.core.ai_client import AIStreamInterrupted
+
+ANSWER = json.dumps({'translations': [
+    {'sentence_id': 1, 'language': 'en', 'text': 'He said "hi" {twice}', 'confidence': 0.9},
+    {'sentence_id': 1, 'language': 'fr', 'text': 'a \\ b ] [ }', 'confidence': 0.5},
+    {'sentence_id': 2, 'language': 'en', 'text': 'plain'},
+]}, ensure_ascii=False)
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, len(ANSWER)])
+def test_parser_items_split_across_chunks(size):
+    parser = TranslationStreamParser()
+    items = [item for chunk in chunks('Here you go: ' + ANSWER, size) for item in parser.feed(chunk)]
+    assert items == json.loads(ANSWER)['translations']
+
+
+def test_parser_returns_items_as_soon_as_they_are_complete():
+    parser = TranslationStreamParser()
+    first_end = ANSWER.index('}', ANSWER.index('"confidence"')) + 1
+    assert parser.feed(ANSWER[:first_end - 1]) == []
+    assert [item['text'] for item in parser.feed(ANSWER[first_end - 1:first_end])] == ['He said "hi" {twice}']
+
+
+class FakeClient:
+    # answers stream_complete() with the given replies in turn; a reply ending in an
+    # exception raises it after the text before it
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def stream_complete(self, prompt, system=None, max_tokens=1024):
+        self.prompts.append(json.loads(prompt[prompt.index('Input:\n') + len('Input:\n'):]))
+        for piece in self.replies.pop(0):
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+
+class FakeManager:
+    def __init__(self):
+        self.stored = []
+
+    def create_translation(self, sentence_id, text, language, group_id, confidence=None):
+        self.stored.append((sentence_id, language, text))
+        return self.stored[-1]
+
+
+def item(sentence_id, language, text):
+    return json.dumps({'sentence_id': sentence_id, 'language': language, 'text': text})
+
+
+def test_broken_stream_keeps_stored_items_and_retries_the_missing_pairs():
+    sentences = [(1, 'Hallo', 'Alltag'), (2, 'Tschüss', 'Alltag')]
+    cut_off = '{"translations": [' + item(1, 'en', 'Hello') + ', {"sentence_id": 2, "lang'
+    client = FakeClient(
+        chunks(cut_off, 5) + [AIStreamInterrupted('connection reset')],
+        ['{"translations": [' + item(2, 'en', 'Bye') + ']}'],
+    )
+    manager = FakeManager()
+
+    rows = list(iter_translations(client, manager, sentences, {1: 10, 2: 20}, 'de', ['en'], token_budget=4000))
+
+    assert rows == [(1, 'en', 'Hello'), (2, 'en', 'Bye')]
+    assert [s['sentence_id'] for s in client.prompts[0]['sentences']] == [1, 2]
+    assert [s['sentence_id'] for s in client.prompts[1]['sentences']] == [2]
+    assert client.prompts[1]['target_languages'] == ['en']
+
+
+def test_retry_asks_only_for_missing_languages():
+    sentences = [(1, 'Hallo', 'Alltag')]
+    client = FakeClient(
+        ['{"translations": [' + item(1, 'en', 'Hello') + ']}'],
+        ['{"translations": [' + item(1, 'fr', 'Salut') + ']}'],
+    )
+    manager = FakeManager()
+
+    list(iter_translations(client, manager, sentences, {1: 10}, 'de', ['en', 'fr'], token_budget=4000))
+
+    assert client.prompts[1]['target_languages'] == ['fr']
+    assert manager.stored == [(1, 'en', 'Hello'), (1, 'fr', 'Salut')]
@@ -0,0 +1,52 @@
+import pytest
+
+from src.server.core.read_replica import refresh_snapshot
+from src.server.extensions import db
+from tests.conftest import create_user
+
+
+@pytest.fixture
+def make_snapshot_app(make_app, tmp_path):
+    def make(**config):
+        return make_app(DB_READ_URI=f'sqlite:///{tmp_path}/snapshot.db', DB_READ_SNAPSHOT=True, **config)
+    return make
+
+
+def listed(client):
+    response = client.get('/api/')
+    assert response.status_code == 200
+    return [user['username'] for user in response.get_json()]
+
+
+def test_reads_of_later_requests_see_the_snapshot(make_snapshot_app):
+    app = make_snapshot_app()
+    client = app.test_client()
+    create_user(client, 'anna', languages=())
+
+    # the snapshot was taken at startup
+    assert listed(client) == []
+
+    with app.app_context():
+        refresh_snapshot(db.engines[None], db.engines['read'])
+    assert listed(client) == ['anna']
+
+
+def test_a_request_reads_its_own_writes_from_the_primary(make_snapshot_app):
+    app = make_snapshot_app()
+    with app.test_request_context():
+        assert app.manager.get_user_by_username('anna') is None
+        app.manager.create_user('anna', 'de')
+        assert app.manager.get_user_by_username('anna') is not None
+    with app.test_request_context():
+        # a new request without writes reads the snapshot again
+        assert app.manager.get_user_by_username('anna') is None
+
+
+def test_routing_off_reads_the_primary(make_snapshot_app):
+    app = make_snapshot_app(DB_READ_ROUTING=False)
+    client = app.test_client()
+    create_user(client, 'anna', languages=())
+
+    assert listed(client) == ['anna']
+    with app.test_request_context():
+        assert app.manager.get_user_by_username('anna') is not None
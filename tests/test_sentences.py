@@ -0,0 +1,62 @@
+from tests.conftest import add_sentence, create_user
+
+
+def bulk(client, user_id, texts, on_duplicate='reject', category='Alltag'):
+    return client.post('/api/sentences/bulk', json={
+        'user_id': user_id, 'on_duplicate': on_duplicate,
+        'sentences': [{'original_text': text, 'category': category} for text in texts],
+    })
+
+
+def test_reject_stores_nothing_and_names_the_duplicates(client):
+    user_id = create_user(client)
+    existing = add_sentence(client, user_id, 'Guten Morgen').get_json()['id']
+
+    response = bulk(client, user_id, ['Neu', '  guten   MORGEN ', 'Noch neu', 'neu'])
+
+    assert response.status_code == 409
+    assert response.get_json()['duplicates'] == [
+        {'index': 1, 'existing_id': existing},
+        {'index': 3, 'first_index': 0},
+    ]
+    assert len(client.get(f'/api/sentences/{user_id}').get_json()) == 1
+
+
+def test_single_duplicate_is_rejected(client):
+    user_id = create_user(client)
+    existing = add_sentence(client, user_id, 'Guten Morgen').get_json()['id']
+
+    response = add_sentence(client, user_id, 'guten morgen')
+
+    assert response.status_code == 409
+    assert response.get_json()['existing_id'] == existing
+
+
+def test_return_hands_back_the_stored_sentence(client):
+    user_id = create_user(client)
+    existing = add_sentence(client, user_id, 'Guten Morgen').get_json()['id']
+
+    response = bulk(client, user_id, ['Guten Morgen', 'Neu', 'Neu'], on_duplicate='return', category='Arbeit')
+
+    assert response.status_code == 200
+    entries = response.get_json()
+    assert [(e['id'] == existing, e['created']) for e in entries] == [(True, False), (False, True), (False, False)]
+    assert entries[1]['id'] == entries[2]['id']
+    assert entries[0]['category'] == 'Alltag'
+
+
+def test_merge_adds_the_new_category(client):
+    user_id = create_user(client)
+    add_sentence(client, user_id, 'Guten Morgen', category='Alltag')
+
+    response = bulk(client, user_id, ['Guten Morgen'], on_duplicate='merge', category='Arbeit')
+
+    assert response.status_code == 200
+    assert response.get_json()[0]['category'] == 'Alltag,Arbeit'
+    by_category = client.get(f'/api/sentences/{user_id}/category/Arbeit')
+    assert [s['original_text'] for s in by_category.get_json()] == ['Guten Morgen']
+
+
+def test_unknown_policy_is_rejected(client):
+    user_id = create_user(client)
+    assert bulk(client, user_id, ['Neu'], on_duplicate='ignore').status_code == 400
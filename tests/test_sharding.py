@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from src.server.core.sharding import SHARD_ID_SPAN, shard_for_id
+from tests.conftest import add_sentence, create_user
+
+
+def rows_in(app, shard, table, user_id):
+    path = app.config['DB_SHARD_URIS'][shard].removeprefix('sqlite:///')
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def sharded(make_app):
+    app = make_app(shards=2)
+    return app, app.test_client()
+
+
+def test_user_rows_live_on_their_shard(sharded):
+    app, client = sharded
+    users = [create_user(client, name) for name in ('anna', 'ben')]
+    for user_id in users:
+        add_sentence(client, user_id, 'Guten Morgen')
+
+    for user_id in users:
+        with app.app_context():
+            shard = app.manager.get_user_by_id(user_id).shard
+        assert rows_in(app, shard, 'sentences', user_id) == 1
+        assert rows_in(app, 1 - shard, 'sentences', user_id) == 0
+        sentence = client.get(f'/api/sentences/{user_id}').get_json()[0]
+        # the shard follows from the id alone
+        assert shard_for_id(sentence['id']) == shard
+        assert sentence['id'] > shard * SHARD_ID_SPAN
+    with app.app_context():
+        assert {shard: set(loads) for shard, loads in app.manager.get_shard_loads().items()} == {
+            app.manager.get_user_by_id(users[0]).shard: {users[0]},
+            app.manager.get_user_by_id(users[1]).shard: {users[1]},
+        }
+
+
+def test_move_user_takes_every_row_along(sharded):
+    app, client = sharded
+    user_id = create_user(client, languages=('en', 'fr'))
+    for text in ('Eins', 'Zwei'):
+        add_sentence(client, user_id, text)
+    with app.app_context():
+        source = app.manager.get_user_by_id(user_id).shard
+    due_before = client.get(f'/api/learn/user/{user_id}/due').get_json()
+
+    result = app.test_cli_runner().invoke(args=['move-user', str(user_id), str(1 - source)])
+
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert app.manager.get_user_by_id(user_id).shard == 1 - source
+    for table in ('sentences', 'progress_groups', 'user_languages'):
+        assert rows_in(app, source, table, user_id) == 0
+        assert rows_in(app, 1 - source, table, user_id) > 0
+    sentences = client.get(f'/api/sentences/{user_id}').get_json()
+    assert sorted(s['original_text'] for s in sentences) == ['Eins', 'Zwei']
+    assert all(shard_for_id(s['id']) == 1 - source for s in sentences)
+    assert sorted(l['language_code'] for l in client.get(f'/api/users/{user_id}/languages').get_json()) == ['en', 'fr']
+    due_after = client.get(f'/api/learn/user/{user_id}/due').get_json()
+    assert len(due_after) == len(due_before) == 2
+    session = client.get(f'/api/learn/session/{user_id}').get_json()
+    assert sorted(len(card['translations']) for card in session['cards']) == [2, 2]
+
+
+def test_move_user_rejects_unknown_shards(sharded):
+    app, client = sharded
+    user_id = create_user(client)
+    result = app.test_cli_runner().invoke(args=['move-user', str(user_id), '2'])
+    assert result.exit_code != 0
+    assert 'Unknown shard' in result.output
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.server.models.data_models import Cold_Progress_Groups, Progress_Groups
+from tests.conftest import add_sentence, create_user
+
+
+@pytest.fixture(params=[0, 2], ids=['unsharded', 'sharded'])
+def app(request, make_app):
+    return make_app(shards=request.param)
+
+
+def schedule(app, user_id, days_ahead):
+    # next_review of the user's groups in id order, days from today
+    today = datetime.utcnow().date()
+    with app.app_context():
+        session = app.manager._user_session(user_id, write=True)
+        groups = session.query(Progress_Groups).filter_by(user_id=user_id).order_by(Progress_Groups.id).all()
+        for group, days in zip(groups, days_ahead):
+            group.next_review = today + timedelta(days=days)
+        app.manager._commit(session)
+        return [group.id for group in groups]
+
+
+def counts(app, user_id):
+    with app.app_context():
+        session = app.manager._user_session(user_id)
+        return tuple(session.query(model).filter_by(user_id=user_id).count()
+                     for model in (Progress_Groups, Cold_Progress_Groups))
+
+
+def test_far_off_groups_move_to_the_cold_table_and_back(app):
+    client = app.test_client()
+    user_id = create_user(client)
+    for i in range(7):
+        add_sentence(client, user_id, f'Satz {i}')
+    group_ids = schedule(app, user_id, [0, 0, 10, 90, 120, 200, 400])
+    stats = client.get(f'/api/learn/stats/{user_id}').get_json()
+    due = client.get(f'/api/learn/user/{user_id}/due').get_json()
+
+    result = app.test_cli_runner().invoke(args=['tier-progress-groups', '--batch-size', '2'])
+
+    assert result.exit_code == 0, result.output
+    assert '4 group(s) moved to the cold table, 0 back' in result.output
+    assert counts(app, user_id) == (3, 4)
+    assert client.get(f'/api/learn/stats/{user_id}').get_json() == stats
+    assert client.get(f'/api/learn/user/{user_id}/due').get_json() == due
+    exported = [line for line in client.get(f'/api/users/{user_id}/export').get_data(as_text=True).splitlines()
+                if '"progress_group"' in line]
+    assert len(exported) == 7
+
+    # groups that come within reach are moved back with their ids
+    today = datetime.utcnow().date()
+    with app.app_context():
+        assert app.manager.tier_progress_groups(today + timedelta(days=300), today + timedelta(days=150)) == (0, 2)
+        assert counts(app, user_id) == (5, 2)
+        assert app.manager.get_progress_group(group_ids[4]).id == group_ids[4]
+
+
+def test_reading_a_cold_group_warms_it(app):
+    client = app.test_client()
+    user_id = create_user(client)
+    sentence_id = add_sentence(client, user_id, 'Satz').get_json()['id']
+    group_id, = schedule(app, user_id, [100])
+    today = datetime.utcnow().date()
+    with app.app_context():
+        app.manager.tier_progress_groups(today + timedelta(days=60), today + timedelta(days=30))
+    assert counts(app, user_id) == (0, 1)
+
+    with app.app_context():
+        group = app.manager.update_progress_group(group_id, 80.0, True)
+        assert (group.id, group.review_count) == (group_id, 1)
+        assert app.manager.get_group_for_sentence(sentence_id).id == group_id
+    assert counts(app, user_id) == (1, 0)
+
+
+def test_deleting_a_sentence_removes_its_cold_group(app):
+    client = app.test_client()
+    user_id = create_user(client)
+    sentence_id = add_sentence(client, user_id, 'Satz').get_json()['id']
+    schedule(app, user_id, [100])
+    today = datetime.utcnow().date()
+    with app.app_context():
+        app.manager.tier_progress_groups(today + timedelta(days=60), today + timedelta(days=30))
+
+    assert client.delete(f'/api/sentences/{sentence_id}').status_code == 200
+    assert counts(app, user_id) == (0, 0)
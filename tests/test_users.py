@@ -0,0 +1,22 @@
+import pytest
+
+from tests.conftest import create_user
+
+MAX = '\U0010ffff'
+
+
+@pytest.fixture
+def usernames(client):
+    names = ['anna', 'anton', 'bert', f'an{MAX}', f'an{MAX}x', f'ao{MAX}', MAX, f'{MAX}{MAX}z']
+    for name in names:
+        create_user(client, username=name, languages=())
+    return names
+
+
+@pytest.mark.parametrize('prefix', ['an', 'ant', 'b', f'an{MAX}', MAX, f'{MAX}{MAX}', 'zz'])
+def test_prefix_listing_matches_startswith(client, usernames, prefix):
+    response = client.get('/api/', query_string={'prefix': prefix})
+    assert response.status_code == 200
+    expected = sorted(name for name in usernames if name.startswith(prefix))
+    assert [user['username'] for user in response.get_json()] == expected
+    assert response.headers['X-Total-Count'] == str(len(expected))